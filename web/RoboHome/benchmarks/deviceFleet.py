@@ -0,0 +1,426 @@
+"""
+Emulates a fleet of Arduino, Wemo, Gadgeteer and LightwaveRF devices on loopback, so the real middle layers can be measured without hardware
+
+Every address in 127.0.0.0/8 reaches the local machine on Linux, so each virtual device has its own address,
+e.g. an item with brand arduino and ip 127.1.0.7 is served by the Arduino emulator
+python -m benchmarks.deviceFleet --lightwave 127.3.0.1 --lightwave-count 10 --gadgeteer-server http://127.0.0.1:9090 --latency 0.05 --loss 0.01
+"""
+import argparse
+import heapq
+import httplib
+import json
+import random
+import re
+import select
+import socket
+import struct
+import threading
+import time
+import urlparse
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from SocketServer import ThreadingMixIn
+
+ARDUINO_PORT = 80
+WEMO_PORT = 49153
+LIGHTWAVE_PORT = 9760
+
+WEMO_SETUP = """<?xml version="1.0"?>
+<root xmlns="urn:Belkin:device-1-0">
+ <device>
+  <deviceType>urn:Belkin:device:controllee:1</deviceType>
+  <friendlyName>Emulated Wemo %(address)s</friendlyName>
+  <manufacturer>Belkin International Inc.</manufacturer>
+  <modelName>Socket</modelName>
+  <UDN>uuid:Socket-1_0-%(address)s</UDN>
+  <serviceList>
+   <service>
+    <serviceType>urn:Belkin:service:basicevent:1</serviceType>
+    <serviceId>urn:Belkin:serviceId:basicevent1</serviceId>
+    <controlURL>/upnp/control/basicevent1</controlURL>
+    <eventSubURL>/upnp/event/basicevent1</eventSubURL>
+    <SCPDURL>/eventservice.xml</SCPDURL>
+   </service>
+  </serviceList>
+ </device>
+</root>
+"""
+WEMO_SERVICE = """<?xml version="1.0"?>
+<scpd xmlns="urn:Belkin:service-1-0">
+ <actionList>
+  <action><name>GetBinaryState</name><argumentList><argument><name>BinaryState</name><relatedStateVariable>BinaryState</relatedStateVariable><direction>out</direction></argument></argumentList></action>
+  <action><name>SetBinaryState</name><argumentList><argument><name>BinaryState</name><relatedStateVariable>BinaryState</relatedStateVariable><direction>in</direction></argument></argumentList></action>
+ </actionList>
+ <serviceStateTable>
+  <stateVariable sendEvents="yes"><name>BinaryState</name><dataType>Boolean</dataType><defaultValue>0</defaultValue></stateVariable>
+ </serviceStateTable>
+</scpd>
+"""
+WEMO_RESPONSE = """<s:Envelope xmlns:s="http://schemas.xmlsoap.org/soap/envelope/" s:encodingStyle="http://schemas.xmlsoap.org/soap/encoding/"><s:Body>
+<u:%(action)sResponse xmlns:u="urn:Belkin:service:basicevent:1">
+<BinaryState>%(state)s</BinaryState>
+</u:%(action)sResponse>
+</s:Body> </s:Envelope>"""
+
+
+def addresses(first, count):
+    """
+    Returns count consecutive IPv4 addresses starting at first
+
+    Arguments:
+    first -- the first address, e.g. 127.1.0.1
+    count -- the number of addresses
+    """
+    start = struct.unpack("!I", socket.inet_aton(first))[0]
+    return [socket.inet_ntoa(struct.pack("!I", start + i)) for i in range(count)]
+
+
+class Faults(object):
+    """
+    Decides how long a virtual device takes to answer and whether it answers at all
+    """
+    def __init__(self, latency=0, jitter=0, loss=0, failure=0, seed=None):
+        """
+        Arguments:
+        latency -- seconds every answer is delayed by
+        jitter -- up to this many more seconds are added at random
+        loss -- probability that a request is never answered
+        failure -- probability that a request is answered with an error
+        seed -- seed for the random choices
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.failure = failure
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def delay(self):
+        """Returns the seconds the next answer is delayed by"""
+        with self.lock:
+            return self.latency + self.rng.uniform(0, self.jitter)
+
+    def outcome(self):
+        """Returns 'lost', 'failed' or 'ok' for the next request"""
+        with self.lock:
+            r = self.rng.random()
+        if r < self.loss:
+            return 'lost'
+        if r < self.loss + self.failure:
+            return 'failed'
+        return 'ok'
+
+
+class Fleet(object):
+    """
+    The state of every virtual device and counters of the requests they served
+    """
+    def __init__(self, faults):
+        self.faults = faults
+        self.states = {}
+        self.counters = {}
+        self.lock = threading.Lock()
+
+    def getState(self, key, default=0):
+        with self.lock:
+            return self.states.setdefault(key, default)
+
+    def setState(self, key, state):
+        with self.lock:
+            self.states[key] = state
+
+    def count(self, protocol, outcome):
+        with self.lock:
+            counters = self.counters.setdefault(protocol, {'ok': 0, 'lost': 0, 'failed': 0})
+            counters[outcome] += 1
+
+    def getStats(self):
+        with self.lock:
+            devices = {}
+            for protocol, address in self.states:
+                devices[protocol] = devices.get(protocol, 0) + 1
+            return {'devices': devices, 'requests': dict((p, dict(c)) for p, c in self.counters.items())}
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+
+class DeviceHandler(BaseHTTPRequestHandler):
+    """
+    Base handler for the HTTP devices, the device is the local address the client connected to
+    """
+    protocol_version = 'HTTP/1.1'
+    protocol = None
+
+    def log_message(self, *args):
+        pass
+
+    def getAddress(self):
+        return self.connection.getsockname()[0]
+
+    def answer(self, handle):
+        """
+        Applies the faults and then answers with handle, which returns (code, contentType, body)
+
+        Arguments:
+        handle -- called to work out the answer
+        """
+        fleet = self.server.fleet
+        outcome = fleet.faults.outcome()
+        fleet.count(self.protocol, outcome)
+        time.sleep(fleet.faults.delay())
+        if outcome == 'lost':
+            self.close_connection = 1
+            return
+        if outcome == 'failed':
+            code, contentType, body = 500, 'text/plain', 'emulated failure'
+        else:
+            code, contentType, body = handle()
+        self.send_response(code)
+        self.send_header('Content-Type', contentType)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.wfile.write(body)
+        self.close_connection = 1
+
+
+class ArduinoHandler(DeviceHandler):
+    """Serves the /state, /on, /off, /open and /close endpoints of the Arduino sketches"""
+    protocol = 'arduino'
+    commands = {'/on': 1, '/off': 0, '/open': 1, '/close': 0}
+
+    def do_GET(self):
+        self.answer(self.state)
+
+    def state(self):
+        key = (self.protocol, self.getAddress())
+        path = self.path.rstrip('/') or '/'
+        if path in self.commands:
+            self.server.fleet.setState(key, self.commands[path])
+            return 200, 'text/plain', 'OK'
+        if path == '/state':
+            return 200, 'application/json', json.dumps({'state': self.server.fleet.getState(key)})
+        return 404, 'text/plain', 'not found'
+
+
+class WemoHandler(DeviceHandler):
+    """Serves the setup.xml, service description and basicevent SOAP actions of a Wemo switch"""
+    protocol = 'wemo'
+
+    def do_GET(self):
+        self.answer(self.describe)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.getheader('Content-Length', 0)))
+        self.answer(lambda: self.control(body))
+
+    def describe(self):
+        if self.path == '/setup.xml':
+            return 200, 'text/xml', WEMO_SETUP % {'address': self.getAddress()}
+        if self.path == '/eventservice.xml':
+            return 200, 'text/xml', WEMO_SERVICE
+        return 404, 'text/plain', 'not found'
+
+    def control(self, body):
+        if self.path != '/upnp/control/basicevent1':
+            return 404, 'text/plain', 'not found'
+        action = (self.headers.getheader('SOAPACTION') or '').strip('"').split('#')[-1]
+        key = (self.protocol, self.getAddress())
+        if action == 'SetBinaryState':
+            match = re.search(r'<BinaryState>(\d)</BinaryState>', body)
+            if match is None:
+                return 400, 'text/plain', 'missing BinaryState'
+            state = int(match.group(1))
+            if self.server.fleet.getState(key) == state:
+                result = 'Error'
+            else:
+                self.server.fleet.setState(key, state)
+                result = str(state)
+        elif action == 'GetBinaryState':
+            result = str(self.server.fleet.getState(key))
+        else:
+            return 500, 'text/plain', 'unknown action'
+        return 200, 'text/xml; charset="utf-8"', WEMO_RESPONSE % {'action': action, 'state': result}
+
+
+def serveHTTP(fleet, handler, port, host='0.0.0.0'):
+    """
+    Starts an HTTP server for one protocol in a new thread and returns it
+
+    Arguments:
+    fleet -- the Fleet holding the devices' state
+    handler -- ArduinoHandler or WemoHandler
+    port -- the port to listen on
+    host -- the address to listen on, every loopback address by default
+    """
+    server = ThreadingHTTPServer((host, port), handler)
+    server.fleet = fleet
+    t = threading.Thread(target=server.serve_forever)
+    t.daemon = True
+    t.start()
+    return server
+
+
+class LightwaveEmulator(object):
+    """
+    Emulates WiFiLinks and energy monitors, one UDP socket per address served from a single thread
+    Commands are acknowledged with NNN,OK and energy polls are answered with a wattage reading
+    """
+    def __init__(self, fleet, addresses, port=LIGHTWAVE_PORT):
+        """
+        Arguments:
+        fleet -- the Fleet holding the devices' state
+        addresses -- the addresses of the virtual WiFiLinks
+        port -- the port they listen on
+        """
+        self.fleet = fleet
+        self.sockets = {}
+        self.poller = select.poll()
+        for address in addresses:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.bind((address, port))
+            self.sockets[sock.fileno()] = sock
+            self.poller.register(sock, select.POLLIN)
+        self.pending = []
+        self.watts = {}
+        self.rng = random.Random(0)
+
+    def start(self):
+        t = threading.Thread(target=self.loop)
+        t.daemon = True
+        t.start()
+
+    def loop(self):
+        while True:
+            timeout = None
+            if self.pending:
+                timeout = max(0, (self.pending[0][0] - time.time()) * 1000)
+            for fd, event in self.poller.poll(timeout):
+                sock = self.sockets[fd]
+                data, addr = sock.recvfrom(1024)
+                reply = self.receive(sock.getsockname()[0], data)
+                if reply is not None:
+                    heapq.heappush(self.pending, (time.time() + self.fleet.faults.delay(), sock, reply, addr))
+            while self.pending and self.pending[0][0] <= time.time():
+                due, sock, reply, addr = heapq.heappop(self.pending)
+                sock.sendto(reply, addr)
+
+    def receive(self, address, data):
+        """
+        Returns the reply to a packet, or None if it is lost
+
+        Arguments:
+        address -- the address of the virtual WiFiLink the packet was sent to
+        data -- the packet
+        """
+        outcome = self.fleet.faults.outcome()
+        self.fleet.count('lightwaveRF', outcome)
+        if outcome == 'lost':
+            return None
+        transaction, _, command = data.partition(',')
+        if '@?' in command:
+            watts = max(0, self.watts.get(address, 500) + self.rng.randint(-50, 50))
+            self.watts[address] = watts
+            return "%s,?W=%d,%d,0,0;" % (transaction, watts, watts)
+        if outcome == 'failed':
+            return "%s,ERR,1,\"Transmit fail\";" % transaction
+        match = re.match(r'!R(\d+)D(\d+)F(\d+)', command)
+        if match is not None:
+            room, device, function = match.groups()
+            self.fleet.setState(('lightwaveRF', "%s R%sD%s" % (address, room, device)), int(function))
+        return "%s,OK" % transaction
+
+
+class GadgeteerFleet(object):
+    """
+    Virtual Gadgeteers that push their state to the RoboHome server from their own loopback address
+    """
+    def __init__(self, fleet, server, addresses, interval=1.0):
+        """
+        Arguments:
+        fleet -- the Fleet holding the devices' state
+        server -- the URL of the RoboHome server
+        addresses -- the addresses of the virtual Gadgeteers
+        interval -- seconds between two state changes of each Gadgeteer on average
+        """
+        self.fleet = fleet
+        url = urlparse.urlparse(server)
+        self.host = url.hostname
+        self.port = url.port or 80
+        self.addresses = addresses
+        self.interval = interval
+        self.rng = random.Random(0)
+
+    def start(self):
+        t = threading.Thread(target=self.loop)
+        t.daemon = True
+        t.start()
+
+    def loop(self):
+        while True:
+            time.sleep(self.interval / max(len(self.addresses), 1))
+            self.push(self.rng.choice(self.addresses))
+
+    def push(self, address):
+        """
+        Flips the state of a Gadgeteer and sends it to the server, returns the HTTP status or None if it was lost
+
+        Arguments:
+        address -- the address of the Gadgeteer
+        """
+        key = ('gadgeteer', address)
+        state = 1 - self.fleet.getState(key)
+        self.fleet.setState(key, state)
+        outcome = self.fleet.faults.outcome()
+        self.fleet.count('gadgeteer', outcome)
+        if outcome != 'ok':
+            return None
+        time.sleep(self.fleet.faults.delay())
+        try:
+            conn = httplib.HTTPConnection(self.host, self.port, timeout=10, source_address=(address, 0))
+            conn.request('PUT', '/gadgeteer/state/%d/' % state)
+            status = conn.getresponse().status
+            conn.close()
+            return status
+        except Exception, e:
+            print "Error pushing state of Gadgeteer " + address + ": " + str(e)
+            return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Emulate a fleet of devices on loopback")
+    parser.add_argument("--arduino-port", type=int, default=ARDUINO_PORT, help="0 to disable")
+    parser.add_argument("--wemo-port", type=int, default=WEMO_PORT, help="0 to disable")
+    parser.add_argument("--lightwave", default="127.3.0.1", help="address of the first WiFiLink")
+    parser.add_argument("--lightwave-count", type=int, default=1, help="number of WiFiLinks and energy monitors")
+    parser.add_argument("--gadgeteer-server", help="URL of the RoboHome server Gadgeteers push to")
+    parser.add_argument("--gadgeteer", default="127.4.0.1", help="address of the first Gadgeteer")
+    parser.add_argument("--gadgeteer-count", type=int, default=0)
+    parser.add_argument("--gadgeteer-interval", type=float, default=1.0, help="seconds between state changes of a Gadgeteer")
+    parser.add_argument("--latency", type=float, default=0, help="seconds every answer is delayed by")
+    parser.add_argument("--jitter", type=float, default=0, help="up to this many more seconds at random")
+    parser.add_argument("--loss", type=float, default=0, help="probability of not answering")
+    parser.add_argument("--failure", type=float, default=0, help="probability of answering with an error")
+    parser.add_argument("--report", type=float, default=10, help="seconds between printing statistics as JSON")
+    args = parser.parse_args()
+
+    fleet = Fleet(Faults(args.latency, args.jitter, args.loss, args.failure))
+    if args.arduino_port:
+        serveHTTP(fleet, ArduinoHandler, args.arduino_port)
+    if args.wemo_port:
+        serveHTTP(fleet, WemoHandler, args.wemo_port)
+    if args.lightwave_count:
+        LightwaveEmulator(fleet, addresses(args.lightwave, args.lightwave_count)).start()
+    if args.gadgeteer_server and args.gadgeteer_count:
+        GadgeteerFleet(fleet, args.gadgeteer_server, addresses(args.gadgeteer, args.gadgeteer_count), args.gadgeteer_interval).start()
+
+    while True:
+        time.sleep(args.report)
+        print json.dumps(fleet.getStats(), sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
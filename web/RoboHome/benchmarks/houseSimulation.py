@@ -0,0 +1,73 @@
+"""
+Simulates synthetic houses of mock items on a virtual clock and measures how much faster than real time they run
+
+Every item with named states changes state at random and the rules react to it, e.g.
+python -m benchmarks.houseSimulation --rooms 100 --items 100 --rules 500 --duration 3600 --output results.jsonl
+"""
+import argparse
+import itertools
+import time
+import robohome.staticData as data
+from robohome.simulation import Simulation
+from robohome.triggerTrace import TraceRecorder
+from benchmarks import ruleEngine
+from benchmarks.timing import writeResults
+
+
+def run(rooms, items, rules, duration, meanInterval, seed=0, trace=None):
+    """
+    Simulates one synthetic house and returns its result
+
+    Arguments:
+    rooms -- number of rooms
+    items -- number of items in each room
+    rules -- number of rules
+    duration -- seconds of virtual time to simulate
+    meanInterval -- mean seconds between two state changes of an item
+    seed -- seed for the random choices
+    trace -- file to record the triggers and actions to, for benchmarks.traceReplay
+    """
+    simulation = Simulation(seed)
+    simulation.install()
+    try:
+        start = time.time()
+        house = ruleEngine.buildHouse(rooms, items, rules, seed, quiet=False)
+        built = time.time() - start
+    finally:
+        simulation.uninstall()
+
+    if trace is not None:
+        TraceRecorder(trace, simulation.clock).attach(house)
+    sensors = [ip for ip, layer in sorted(simulation.layers.items()) if len(data.stateNames[layer.item._type]) > 1]
+    for ip in sensors:
+        simulation.stochastic(ip, meanInterval)
+    start = time.time()
+    calls = simulation.run(duration)
+    elapsed = time.time() - start
+    changes = sum(layer.changes for layer in simulation.layers.values())
+    result = {'benchmark': 'houseSimulation', 'rooms': rooms, 'items': items, 'rules': rules, 'duration': duration,
+              'devices': len(simulation.layers), 'calls': calls, 'changes': changes, 'build': round(built, 4), 'elapsed': round(elapsed, 4)}
+    if elapsed > 0:
+        result['speedup'] = duration / elapsed
+        result['throughput'] = calls / elapsed
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate synthetic houses faster than real time")
+    parser.add_argument("--rooms", type=int, nargs="+", default=[10], help="numbers of rooms")
+    parser.add_argument("--items", type=int, nargs="+", default=[10], help="numbers of items per room")
+    parser.add_argument("--rules", type=int, nargs="+", default=[20], help="numbers of rules")
+    parser.add_argument("--duration", type=float, default=3600, help="seconds of virtual time")
+    parser.add_argument("--interval", type=float, default=300, help="mean seconds between state changes of an item")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--trace", help="file to record the triggers and actions to")
+    parser.add_argument("--output", help="file to append JSON lines to, stdout by default")
+    args = parser.parse_args()
+
+    for rooms, items, rules in itertools.product(args.rooms, args.items, args.rules):
+        writeResults([run(rooms, items, rules, args.duration, args.interval, args.seed, args.trace)], args.output)
+
+
+if __name__ == '__main__':
+    main()
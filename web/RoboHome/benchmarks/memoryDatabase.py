@@ -0,0 +1,262 @@
+import itertools
+import datetime
+from collections import OrderedDict
+from robohome.houseSystem import Room
+from robohome.eca import Event, Condition, Action
+import robohome.staticData as data
+
+"""
+Types and methods in the order Scripts/robohome.sql inserts them, so ids match a fresh MySQL install
+Methods are (type, name, signature)
+"""
+TYPES = ['motionSensor', 'lightSensor', 'temperatureSensor', 'energyMonitor', 'button', 'door', 'window', 'curtain', 'plug', 'light', 'radiator']
+METHODS = [('motionSensor', 'Motion Detected', 'getState'), ('lightSensor', 'Light Intensity', 'getState'), ('temperatureSensor', 'Temperature in Degrees', 'getState'), ('energyMonitor', 'Energy Level', 'getState'), ('button', 'Button Pressed', 'getState'),
+           ('door', 'Opened', 'getState'), ('door', 'Open', 'open'), ('door', 'Close', 'close'), ('door', 'Open By', 'setOpen'),
+           ('window', 'Opened', 'getState'), ('window', 'Open', 'open'), ('window', 'Close', 'close'), ('window', 'Open By', 'setOpen'),
+           ('curtain', 'Opened', 'getState'), ('curtain', 'Open', 'open'), ('curtain', 'Close', 'close'), ('curtain', 'Open By', 'setOpen'),
+           ('plug', 'On', 'getState'), ('plug', 'Turn On', 'on'), ('plug', 'Turn Off', 'off'),
+           ('light', 'Lights on', 'getState'), ('light', 'Turn On', 'on'), ('light', 'Turn Off', 'off'),
+           ('radiator', 'Temperature in Degrees', 'getState'), ('radiator', 'Set Temperature', 'setTemperature')]
+
+
+class MemoryTable(object):
+    """
+    Rows of a table kept in memory, keyed by an auto incremented id
+    """
+    def __init__(self):
+        self.rows = OrderedDict()
+        self.ids = itertools.count(1)
+
+    def insert(self, row):
+        _id = next(self.ids)
+        self.rows[_id] = row
+        return _id
+
+    def delete(self, _id):
+        self.rows.pop(_id, None)
+
+
+class RoomsTable(MemoryTable):
+
+    def addEntry(self, room):
+        room.id = self.insert(room.name)
+        return room.id
+
+    def removeEntry(self, room):
+        self.delete(room.id)
+
+    def retrieveAllData(self):
+        return [Room(_id, name) for _id, name in self.rows.items()]
+
+    def updateEntry(self, room):
+        self.rows[room.id] = room.name
+
+
+class TypesTable(object):
+
+    def getIdForName(self, name):
+        return TYPES.index(name) + 1
+
+    def getNameForId(self, id):
+        return TYPES[id - 1]
+
+
+class ItemsTable(MemoryTable):
+
+    def __init__(self, types):
+        MemoryTable.__init__(self)
+        self.types = types
+
+    def addEntry(self, item, roomId):
+        item._id = self.insert((item.name, item.brand, item.ip, roomId, self.types.getIdForName(item._type)))
+        return item._id
+
+    def retrieveForRoomId(self, room):
+        itemsList = []
+        for _id, (name, brand, ip, roomId, typeId) in self.rows.items():
+            if roomId == room.id:
+                _type = self.types.getNameForId(typeId)
+                itemsList.append(data.types[_type](_id, name, brand, _type, ip, None))
+        return itemsList
+
+    def removeEntry(self, item):
+        self.delete(item._id)
+
+    def updateEntry(self, item, roomId):
+        self.rows[item._id] = (item.name, item.brand, item.ip, roomId, self.types.getIdForName(item._type))
+        return item._id
+
+
+class MethodsTable(object):
+
+    def __init__(self, items):
+        self.items = items
+
+    def getNiceStateName(self, itemId):
+        _type = TYPES[self.items.rows[itemId][4] - 1]
+        return self.getMethod(_type, signature='getState')[1]
+
+    def getSignature(self, name, _type):
+        return self.getMethod(_type, name=name)[2]
+
+    def getId(self, name, type):
+        return METHODS.index(self.getMethod(type, name=name)) + 1
+
+    def getMethod(self, _type, name=None, signature=None):
+        for method in METHODS:
+            if method[0] == _type and name in (None, method[1]) and signature in (None, method[2]):
+                return method
+        raise IndexError("No method " + str(name or signature) + " for type " + str(_type))
+
+
+class EventsTable(MemoryTable):
+
+    def addEntry(self, event):
+        event.id = self.insert(self.toRow(event))
+
+    def removeEntry(self, event):
+        self.delete(event.id)
+
+    def updateEntry(self, event):
+        self.rows[event.id] = self.toRow(event)
+
+    def getEvents(self):
+        return [Event(_id, *row) for _id, row in self.rows.items()]
+
+    def toRow(self, event):
+        itemId = roomId = None
+        if event.item is not None:
+            itemId = event.item._id
+        if event.room is not None:
+            roomId = event.room.id
+        return (event.name, event.type, itemId, roomId, event.trigger, event.enabled)
+
+
+class ConditionsTable(MemoryTable):
+
+    def __init__(self, methods):
+        MemoryTable.__init__(self)
+        self.methods = methods
+
+    def addEntry(self, condition, eventId):
+        condition.id = self.insert(self.toRow(condition, eventId))
+
+    def removeEntry(self, condition):
+        self.delete(condition.id)
+
+    def updateEntry(self, condition, eventId):
+        self.rows[condition.id] = self.toRow(condition, eventId)
+
+    def getConditionsForEvent(self, event):
+        conditionsList = []
+        for _id, (itemId, methodId, equivalence, value, eventId) in self.rows.items():
+            if eventId == event.id:
+                _type, name, signature = METHODS[methodId - 1]
+                conditionsList.append(Condition(_id, itemId, signature, name, equivalence, value))
+        return conditionsList
+
+    def toRow(self, condition, eventId):
+        return (condition.item._id, self.methods.getId(condition.methodName, condition.item._type), condition.equivalence, condition.value, eventId)
+
+
+class ActionsTable(MemoryTable):
+
+    def __init__(self, methods):
+        MemoryTable.__init__(self)
+        self.methods = methods
+
+    def addEntry(self, action, eventId):
+        action.id = self.insert(self.toRow(action, eventId))
+
+    def removeEntry(self, action):
+        self.delete(action.id)
+
+    def updateEntry(self, action, eventId):
+        self.rows[action.id] = self.toRow(action, eventId)
+
+    def getActionsForEvent(self, event):
+        actionsList = []
+        for _id, (itemId, roomId, methodId, eventId) in self.rows.items():
+            if eventId == event.id:
+                _type, name, signature = METHODS[methodId - 1]
+                actionsList.append(Action(_id, itemId, roomId, signature, name, _type))
+        return actionsList
+
+    def toRow(self, action, eventId):
+        itemId = roomId = None
+        if action.item is not None:
+            itemId = action.item._id
+        if action.room is not None:
+            roomId = action.room.id
+        return (itemId, roomId, self.methods.getId(action.methodName, action.type), eventId)
+
+
+class UsersTable(MemoryTable):
+
+    def addEntry(self, name, email, openid):
+        return self.insert((name, email, openid))
+
+    def getUserByOpenid(self, openid):
+        for name, email, userOpenid in self.rows.values():
+            if userOpenid == openid:
+                return {'name' : name, 'email' : email, 'opnenid' : openid}
+        return None
+
+    def numOfRows(self):
+        return len(self.rows)
+
+
+class WhitelistTable(MemoryTable):
+
+    def addEntry(self, email):
+        return self.insert(email)
+
+    def getEmails(self):
+        return tuple((email,) for email in self.rows.values())
+
+    def isInWhitelist(self, email):
+        return email in self.rows.values()
+
+    def deleteEmail(self, email):
+        for _id, rowEmail in self.rows.items():
+            if rowEmail == email:
+                self.delete(_id)
+
+
+class EnergyTable(MemoryTable):
+
+    def addEntry(self, watts, time=None):
+        return self.insert((time or datetime.datetime.now(), watts))
+
+    def getEnergyByTime(self, startDate, endDate):
+        start = self.parse(startDate)
+        end = self.parse(endDate)
+        return [row for row in self.rows.values() if start <= row[0] <= end]
+
+    def getLatestEnergy(self):
+        return list(self.rows.values())[-1:]
+
+    def parse(self, date):
+        if len(date) > 10:
+            return datetime.datetime.strptime(date, '%Y-%m-%d %H:%M:%S')
+        return datetime.datetime.strptime(date, '%Y-%m-%d')
+
+
+class MemoryDatabase(object):
+    """
+    A stand in for databaseTables.Database that keeps every table in memory, so a House can run without MySQL
+    """
+    def __init__(self):
+        self.room = RoomsTable()
+        self.types = TypesTable()
+        self.items = ItemsTable(self.types)
+        self.methods = MethodsTable(self.items)
+        self.events = EventsTable()
+        self.conditions = ConditionsTable(self.methods)
+        self.actions = ActionsTable(self.methods)
+        self.users = UsersTable()
+        self.whitelist = WhitelistTable()
+        self.energy = EnergyTable()
+
+    def getMethodsWithTypes(self):
+        return tuple((_type, name) for _type, name, signature in METHODS)
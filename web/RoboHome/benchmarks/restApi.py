@@ -0,0 +1,260 @@
+"""
+Load tests the REST API of flaskServer on a synthetic house kept in memory
+
+Requests are sent by several threads either through Flask's test client or over HTTP to a local WSGI server, e.g.
+python -m benchmarks.restApi --mode wsgi --concurrency 1 4 16 --requests 2000 --output results.jsonl
+"""
+import argparse
+import datetime
+import itertools
+import json
+import random
+import sys
+import threading
+import time
+import urllib2
+from werkzeug.serving import make_server, WSGIRequestHandler
+import robohome.databaseTables as databaseTables
+import robohome.staticData as data
+from benchmarks import ruleEngine
+from benchmarks.timing import summarise, writeResults
+
+VERSION = '0.1'
+# How often each kind of request is sent, relative to the others
+DEFAULT_MIX = {'state': 50, 'command': 20, 'getRules': 10, 'addRule': 4, 'updateRule': 3, 'deleteRule': 3, 'energy': 10}
+# Readings stored in the energy table, one every ENERGY_INTERVAL seconds up to now
+ENERGY_READINGS = 2880
+ENERGY_INTERVAL = 30
+
+
+def loadApp(rooms, items, rules, seed=0):
+    """
+    Imports flaskServer with its database replaced by a MemoryDatabase holding a synthetic house, and returns the module
+
+    Arguments:
+    rooms -- number of rooms
+    items -- number of items in each room
+    rules -- number of rules
+    seed -- seed for the random choices
+    """
+    if 'robohome.flaskServer' in sys.modules:
+        raise Exception("flaskServer has already been imported")
+    database = ruleEngine.buildHouse(rooms, items, rules, seed).database
+    now = datetime.datetime.now().replace(microsecond=0)
+    for i in range(ENERGY_READINGS):
+        database.energy.addEntry(random.Random(i).randint(50, 3000), now - datetime.timedelta(seconds=ENERGY_INTERVAL * (ENERGY_READINGS - i)))
+    databaseTables.Database = lambda: database
+    import robohome.flaskServer as flaskServer
+    return flaskServer
+
+
+class Workload(object):
+    """
+    Picks the next request to send according to the mix, and keeps track of the rules it has created
+    """
+    def __init__(self, house, mix, seed=0):
+        """
+        Arguments:
+        house -- the house served by the app
+        mix -- dict of request name to relative weight
+        seed -- seed for the random choices
+        """
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.names = [name for name in sorted(mix) for i in range(mix[name])]
+        self.commands = [(roomId, item._id, method) for roomId, room in house.rooms.items() for item in room.items.values() for method in data.methodStates[item._type]]
+        self.triggerTypes = [(item._type, item._id) for room in house.rooms.values() for item in room.items.values() if data.stateNames[item._type]]
+        self.createdRules = []
+
+    def next(self):
+        """Returns the (name, method, path) of the next request"""
+        with self.lock:
+            name = self.rng.choice(self.names)
+            if name in ('updateRule', 'deleteRule') and not self.createdRules:
+                name = 'addRule'
+            if name == 'state':
+                return name, 'GET', '/version/%s/state/' % VERSION
+            if name == 'command':
+                roomId, itemId, method = self.rng.choice(self.commands)
+                return name, 'PUT', '/version/%s/rooms/%s/items/%s/%s/' % (VERSION, roomId, itemId, method)
+            if name == 'getRules':
+                return name, 'GET', '/version/%s/events/' % VERSION
+            if name == 'energy':
+                days = self.rng.randint(1, 7)
+                end = datetime.date.today() + datetime.timedelta(days=1)
+                start = end - datetime.timedelta(days=days)
+                return name, 'GET', '/version/%s/energy/?startTime=%s&endTime=%s' % (VERSION, start.strftime('%Y_%m_%d'), end.strftime('%Y_%m_%d'))
+            _type, itemId = self.rng.choice(self.triggerTypes)
+            query = 'ruleName=load&itemType=%s&id=%s&scope=item&value=%s&enabled=true' % (_type, itemId, self.rng.choice(data.stateNames[_type].keys()))
+            if name == 'addRule':
+                return name, 'POST', '/version/%s/events/?%s' % (VERSION, query)
+            if name == 'updateRule':
+                return name, 'PUT', '/version/%s/events/%s/?%s' % (VERSION, self.rng.choice(self.createdRules), query)
+            return name, 'DELETE', '/version/%s/events/%s/' % (VERSION, self.createdRules.pop(self.rng.randrange(len(self.createdRules))))
+
+    def created(self, name, content):
+        """
+        Records the id of a rule created by a request
+
+        Arguments:
+        name -- the name of the request
+        content -- the content of the response
+        """
+        if name == 'addRule':
+            with self.lock:
+                self.createdRules.append(content['ruleId'])
+
+
+class TestClientSender(object):
+    """Sends requests through Flask's test client, one client per thread"""
+    def __init__(self, app):
+        self.app = app
+        self.local = threading.local()
+
+    def send(self, method, path):
+        if not hasattr(self.local, 'client'):
+            self.local.client = self.app.test_client()
+        response = self.local.client.open(path, method=method, environ_base={'REMOTE_ADDR': '127.0.0.1'})
+        return response.status_code, response.data
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    """Does not log every request, which would slow down the server being measured"""
+    def log_request(self, *args):
+        pass
+
+
+class WSGISender(object):
+    """Sends requests over HTTP to the app served by a local WSGI server"""
+    def __init__(self, app):
+        self.server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=QuietRequestHandler)
+        self.url = 'http://127.0.0.1:%s' % self.server.server_port
+        t = threading.Thread(target=self.server.serve_forever)
+        t.daemon = True
+        t.start()
+
+    def send(self, method, path):
+        request = urllib2.Request(self.url + path)
+        request.get_method = lambda: method
+        try:
+            response = urllib2.urlopen(request)
+            return response.getcode(), response.read()
+        except urllib2.HTTPError, e:
+            return e.code, e.read()
+
+    def close(self):
+        self.server.shutdown()
+
+
+def run(sender, workload, concurrency, requests):
+    """
+    Sends requests from several threads and returns the latencies and errors of each kind of request
+
+    Arguments:
+    sender -- a TestClientSender or WSGISender
+    workload -- the Workload choosing the requests
+    concurrency -- number of threads sending requests
+    requests -- total number of requests to send
+    """
+    latencies = {}
+    errors = {}
+    lock = threading.Lock()
+    remaining = itertools.count(requests, -1)
+
+    def work():
+        while next(remaining) > 0:
+            name, method, path = workload.next()
+            start = time.time()
+            status, body = sender.send(method, path)
+            latency = time.time() - start
+            ok = status == 200
+            if ok:
+                try:
+                    response = json.loads(body)
+                    ok = response['statusCode'] == 200
+                    workload.created(name, response['content'])
+                except (ValueError, KeyError, TypeError):
+                    ok = False
+            with lock:
+                latencies.setdefault(name, []).append(latency)
+                if not ok:
+                    errors[name] = errors.get(name, 0) + 1
+
+    threads = [threading.Thread(target=work) for i in range(concurrency)]
+    start = time.time()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return latencies, errors, time.time() - start
+
+
+def report(latencies, errors, elapsed, **labels):
+    """
+    Returns one result per kind of request and one for all requests
+
+    Arguments:
+    latencies -- dict of request name to the seconds each request took
+    errors -- dict of request name to the number of failed requests
+    elapsed -- the wall clock seconds taken by the run
+    labels -- values added to every result
+    """
+    results = []
+    for name in sorted(latencies) + ['all']:
+        if name == 'all':
+            values = [l for ls in latencies.values() for l in ls]
+            failed = sum(errors.values())
+        else:
+            values = latencies[name]
+            failed = errors.get(name, 0)
+        result = {'benchmark': 'restApi', 'route': name, 'errors': failed}
+        result.update(labels)
+        result.update(summarise(values, elapsed))
+        results.append(result)
+    return results
+
+
+def parseMix(mix):
+    """
+    Parses a mix such as state=50,command=20 into a dict
+
+    Arguments:
+    mix -- the mix given on the command line
+    """
+    weights = {}
+    for part in mix.split(','):
+        name, weight = part.split('=')
+        if name not in DEFAULT_MIX:
+            raise Exception("Unknown request " + name + ", expected one of " + ", ".join(sorted(DEFAULT_MIX)))
+        weights[name] = int(weight)
+    return weights
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the REST API on a synthetic house")
+    parser.add_argument("--mode", choices=["client", "wsgi"], default="client", help="send through the test client or over HTTP")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4], help="numbers of threads sending requests")
+    parser.add_argument("--requests", type=int, default=1000, help="requests sent at each concurrency")
+    parser.add_argument("--mix", type=parseMix, default=DEFAULT_MIX, help="relative weights, e.g. state=50,command=20,energy=10")
+    parser.add_argument("--rooms", type=int, default=6)
+    parser.add_argument("--items", type=int, default=6, help="items in each room")
+    parser.add_argument("--rules", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="file to append JSON lines to, stdout by default")
+    args = parser.parse_args()
+
+    flaskServer = loadApp(args.rooms, args.items, args.rules, args.seed)
+    if args.mode == "wsgi":
+        sender = WSGISender(flaskServer.app)
+    else:
+        sender = TestClientSender(flaskServer.app)
+    for concurrency in args.concurrency:
+        workload = Workload(flaskServer.house, args.mix, args.seed)
+        latencies, errors, elapsed = run(sender, workload, concurrency, args.requests)
+        writeResults(report(latencies, errors, elapsed, mode=args.mode, concurrency=concurrency, rooms=args.rooms, items=args.items, rules=args.rules), args.output)
+    if args.mode == "wsgi":
+        sender.close()
+
+
+if __name__ == '__main__':
+    main()
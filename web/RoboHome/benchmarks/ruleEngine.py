@@ -0,0 +1,142 @@
+"""
+Benchmarks the rule engine on a synthetic house of mock items kept in memory
+
+The items are given the VirtualLayers of a Simulation, so no poller threads run alongside and actions do not
+start a thread each, and the timings are of the rule engine rather than of thread creation
+
+Every combination of the given room, item and rule counts is built and measured, e.g.
+python -m benchmarks.ruleEngine --rooms 5 20 --items 10 --rules 10 100 --output results.jsonl
+"""
+import argparse
+import itertools
+import random
+from robohome.houseSystem import House
+from robohome.simulation import Simulation
+import robohome.staticData as data
+from benchmarks.memoryDatabase import MemoryDatabase, METHODS
+from benchmarks.timing import measure, writeResults
+
+# Types an event can be triggered by and types an action can be performed on
+TRIGGER_TYPES = sorted(_type for _type in data.types if data.stateNames[_type])
+ACTION_TYPES = sorted(_type for _type in data.types if data.methodStates[_type])
+SCOPES = ["item", "room", "house"]
+
+
+class NullListener(object):
+    """Swallows item state changes, so actions do not set off further rules while measuring"""
+    def notify(self, ip, trigger):
+        pass
+
+
+def buildHouse(rooms, items, rules, seed=0, quiet=True):
+    """
+    Returns a house with the given number of rooms, mock items per room and rules, stored in a MemoryDatabase
+
+    Arguments:
+    rooms -- number of rooms
+    items -- number of items in each room
+    rules -- number of rules, each with a condition and an action
+    seed -- seed for the random choices, so runs are repeatable
+    quiet -- give every item a NullListener, so its state changes do not set off rules
+    """
+    rng = random.Random(seed)
+    house = House(MemoryDatabase())
+    types = sorted(data.types)
+    itemsByType = {}
+    for r in range(rooms):
+        roomId = house.addRoom("Room %d" % r)
+        for i in range(items):
+            _type = types[(r * items + i) % len(types)]
+            ip = "10.%d.%d.%d" % (r / 256, r % 256, i + 1)
+            itemId = house.addItem(roomId, "%s %d" % (_type, i), "mock", _type, ip)
+            itemsByType.setdefault(_type, []).append((roomId, itemId))
+
+    triggerTypes = [_type for _type in TRIGGER_TYPES if _type in itemsByType]
+    actionTypes = [_type for _type in ACTION_TYPES if _type in itemsByType]
+    for k in range(rules):
+        _type = rng.choice(triggerTypes)
+        scope, _id = pickScope(rng, itemsByType[_type])
+        eventId = house.addEvent("Rule %d" % k, _type, _id, scope, rng.choice(data.stateNames[_type].keys()), 1)
+
+        conditionType = rng.choice(triggerTypes)
+        roomId, itemId = rng.choice(itemsByType[conditionType])
+        house.addCondition(itemId, "is", rng.choice(data.stateNames[conditionType].keys()), eventId)
+
+        actionType = rng.choice(actionTypes)
+        methodName = rng.choice([name for t, name, signature in METHODS if t == actionType and signature in data.methodStates[actionType]])
+        scope, _id = pickScope(rng, itemsByType[actionType])
+        house.addAction(_id, actionType, scope, methodName, eventId)
+
+    if quiet:
+        for room in house.rooms.values():
+            for item in room.items.values():
+                item.listener = NullListener()
+    return house
+
+
+def pickScope(rng, candidates):
+    """
+    Returns a random scope and the id of the item or room it applies to
+
+    Arguments:
+    rng -- the random number generator
+    candidates -- (roomId, itemId) of the items of the right type
+    """
+    scope = rng.choice(SCOPES)
+    roomId, itemId = rng.choice(candidates)
+    if scope == "item":
+        return scope, itemId
+    elif scope == "room":
+        return scope, roomId
+    return scope, None
+
+
+def run(rooms, items, rules, iterations, seed=0):
+    """
+    Measures the rule engine on one synthetic house and returns a result per operation
+
+    Arguments:
+    rooms -- number of rooms
+    items -- number of items in each room
+    rules -- number of rules
+    iterations -- how many times each operation is called
+    seed -- seed for the random choices
+    """
+    simulation = Simulation(seed)
+    simulation.install()
+    try:
+        house = buildHouse(rooms, items, rules, seed)
+    finally:
+        simulation.uninstall()
+    rng = random.Random(seed)
+    allItems = [item for room in house.rooms.values() for item in room.items.values() if data.stateNames[item._type]]
+    triggers = [(item, rng.choice(data.stateNames[item._type].values())) for item in (rng.choice(allItems) for i in range(iterations))]
+
+    operations = [('reactToEvent', lambda i: house.reactToEvent(triggers[i][0].ip, triggers[i][1])),
+                  ('getEventsForTrigger', lambda i: house.getEventsForTrigger(*triggers[i])),
+                  ('getStructure', lambda i: house.getStructure()),
+                  ('getRules', lambda i: house.getRules())]
+    results = []
+    for name, func in operations:
+        result = {'benchmark': 'ruleEngine', 'operation': name, 'rooms': rooms, 'items': items, 'rules': rules}
+        result.update(measure(func, iterations))
+        results.append(result)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the rule engine on synthetic houses")
+    parser.add_argument("--rooms", type=int, nargs="+", default=[5], help="numbers of rooms")
+    parser.add_argument("--items", type=int, nargs="+", default=[10], help="numbers of items per room")
+    parser.add_argument("--rules", type=int, nargs="+", default=[20], help="numbers of rules")
+    parser.add_argument("--iterations", type=int, default=1000, help="calls of each operation")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="file to append JSON lines to, stdout by default")
+    args = parser.parse_args()
+
+    for rooms, items, rules in itertools.product(args.rooms, args.items, args.rules):
+        writeResults(run(rooms, items, rules, args.iterations, args.seed), args.output)
+
+
+if __name__ == '__main__':
+    main()
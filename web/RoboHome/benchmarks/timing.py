@@ -0,0 +1,76 @@
+import time
+import math
+import json
+
+
+def percentile(latencies, p):
+    """
+    Returns the p-th percentile of a sorted list of latencies, using the nearest rank
+
+    Arguments:
+    latencies -- the latencies sorted in ascending order
+    p -- the percentile, between 0 and 100
+    """
+    if not latencies:
+        return None
+    rank = int(math.ceil(p / 100.0 * len(latencies))) - 1
+    return latencies[min(max(rank, 0), len(latencies) - 1)]
+
+
+def summarise(latencies, elapsed):
+    """
+    Returns the throughput and latency percentiles of a set of timed calls as a dict
+    Throughput is in calls per second and latencies are in milliseconds
+
+    Arguments:
+    latencies -- the seconds each call took
+    elapsed -- the wall clock seconds taken by all of the calls
+    """
+    latencies = sorted(latencies)
+    count = len(latencies)
+    if elapsed > 0:
+        throughput = count / elapsed
+    else:
+        throughput = None
+    def ms(seconds):
+        if seconds is None:
+            return None
+        return round(seconds * 1000, 4)
+    if count:
+        mean = sum(latencies) / count
+    else:
+        mean = None
+    return {'count': count, 'throughput': throughput, 'mean': ms(mean), 'p50': ms(percentile(latencies, 50)), 'p95': ms(percentile(latencies, 95)), 'p99': ms(percentile(latencies, 99)), 'max': ms(latencies[-1] if latencies else None)}
+
+
+def measure(func, iterations):
+    """
+    Calls a function repeatedly and returns the summary of its latencies
+
+    Arguments:
+    func -- called with the iteration number
+    iterations -- how many times to call it
+    """
+    latencies = []
+    start = time.time()
+    for i in range(iterations):
+        callStart = time.time()
+        func(i)
+        latencies.append(time.time() - callStart)
+    return summarise(latencies, time.time() - start)
+
+
+def writeResults(results, output=None):
+    """
+    Writes results as one JSON object per line, to a file or stdout
+
+    Arguments:
+    results -- a list of dicts
+    output -- the path of the file, stdout if None
+    """
+    lines = "".join(json.dumps(result, sort_keys=True) + "\n" for result in results)
+    if output is None:
+        print lines,
+    else:
+        with open(output, "a") as f:
+            f.write(lines)
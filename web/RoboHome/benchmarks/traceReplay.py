@@ -0,0 +1,78 @@
+"""
+Replays a trace recorded with robohome.triggerTrace into a fresh house, timing the rule engine and checking the same actions fire
+
+The house is loaded from the database, or built with benchmarks.ruleEngine for traces of synthetic houses.
+Every brand is simulated, so no real device is sent anything, e.g.
+python -m benchmarks.traceReplay trace.jsonl --speed 10 --output results.jsonl
+python -m benchmarks.traceReplay trace.jsonl --synthetic 10 10 20 --seed 0 --mismatches
+"""
+import argparse
+import time
+import robohome.middleLayers as middleLayers
+from robohome.simulation import Simulation
+from robohome.triggerTrace import readTrace, replay, compare
+from benchmarks import ruleEngine
+from benchmarks.timing import summarise, writeResults
+
+
+def loadHouse(synthetic=None, seed=0):
+    """
+    Returns a fresh house whose items are all simulated
+
+    Arguments:
+    synthetic -- (rooms, items, rules) of a synthetic house, None to load the house from the database
+    seed -- seed the synthetic house was built with
+    """
+    simulation = Simulation(seed)
+    simulation.install(middleLayers.brands.keys())
+    try:
+        if synthetic is not None:
+            return ruleEngine.buildHouse(synthetic[0], synthetic[1], synthetic[2], seed)
+        from robohome.databaseTables import Database
+        from robohome.houseSystem import House
+        house = House(Database())
+        house.initFromDatabase()
+        return house
+    finally:
+        simulation.uninstall()
+
+
+def run(house, records, speed=None):
+    """
+    Replays records into a house and returns the result and the mismatched triggers
+
+    Arguments:
+    house -- the house to replay into
+    records -- the records read from a trace
+    speed -- 1 to replay at recorded speed, 10 for ten times faster, None for as fast as possible
+    """
+    start = time.time()
+    results = replay(house, records, speed)
+    elapsed = time.time() - start
+    mismatches = compare(results)
+    result = {'benchmark': 'traceReplay', 'operation': 'reactToEvent', 'speed': speed, 'mismatches': len(mismatches)}
+    result.update(summarise([r[5] for r in results], elapsed))
+    return result, mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a trigger trace into a fresh house")
+    parser.add_argument("trace", help="the trace file")
+    parser.add_argument("--speed", type=float, help="1 for recorded speed, 10 for ten times faster, as fast as possible by default")
+    parser.add_argument("--synthetic", type=int, nargs=3, metavar=("ROOMS", "ITEMS", "RULES"), help="replay into a synthetic house instead of the database's")
+    parser.add_argument("--seed", type=int, default=0, help="seed the synthetic house was built with")
+    parser.add_argument("--mismatches", action="store_true", help="print every trigger whose actions differ")
+    parser.add_argument("--output", help="file to append JSON lines to, stdout by default")
+    args = parser.parse_args()
+
+    house = loadHouse(args.synthetic, args.seed)
+    result, mismatches = run(house, readTrace(args.trace), args.speed)
+    result['trace'] = args.trace
+    writeResults([result], args.output)
+    if args.mismatches:
+        for notified, ip, trigger, recorded, performed, seconds in mismatches:
+            print "Mismatch at %s for %s from %s: recorded %s, replayed %s" % (notified, trigger, ip, recorded, performed)
+
+
+if __name__ == '__main__':
+    main()
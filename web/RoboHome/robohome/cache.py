@@ -0,0 +1,99 @@
+import time
+import threading
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    """
+    A thread safe least-recently-used cache with an optional time to live
+    """
+    def __init__(self, maxSize=128, ttl=None):
+        """
+        Arguments:
+        maxSize -- the maximum number of entries kept
+        ttl -- seconds an entry stays valid, entries never expire if None
+        """
+        self.maxSize = maxSize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """
+        Returns the value stored for a key, or default if it is missing or expired
+
+        Arguments:
+        key -- the key to look up
+        default -- returned when there is no valid entry
+        """
+        with self.lock:
+            if key not in self.entries:
+                return default
+            value, expires = self.entries.pop(key)
+            if expires is not None and expires < time.time():
+                return default
+            self.entries[key] = (value, expires)
+            return value
+
+    def put(self, key, value):
+        """
+        Stores a value, evicting the least recently used entry if the cache is full
+
+        Arguments:
+        key -- the key to store the value under
+        value -- the value to store
+        """
+        if self.ttl is None:
+            expires = None
+        else:
+            expires = time.time() + self.ttl
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = (value, expires)
+            while len(self.entries) > self.maxSize:
+                self.entries.popitem(last=False)
+
+    def setdefault(self, key, value):
+        """
+        Returns the value stored for a key, storing and returning value if there is no valid entry
+
+        Arguments:
+        key -- the key to look up
+        value -- the value to store if the key is missing
+        """
+        with self.lock:
+            if key in self.entries:
+                current, expires = self.entries.pop(key)
+                if expires is None or expires >= time.time():
+                    self.entries[key] = (current, expires)
+                    return current
+            if self.ttl is None:
+                expires = None
+            else:
+                expires = time.time() + self.ttl
+            self.entries[key] = (value, expires)
+            while len(self.entries) > self.maxSize:
+                self.entries.popitem(last=False)
+            return value
+
+    def invalidate(self, key):
+        """
+        Removes a single entry
+
+        Arguments:
+        key -- the key of the entry to remove
+        """
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        """Removes every entry"""
+        with self.lock:
+            self.entries.clear()
+
+    def __contains__(self, key):
+        return self.get(key, self) is not self
+
+    def __len__(self):
+        with self.lock:
+            return len(self.entries)
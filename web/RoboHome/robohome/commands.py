@@ -0,0 +1,90 @@
+import time
+import threading
+
+"""
+Status of a queued command
+"""
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class CommandFuture(object):
+    """
+    Records the progress and outcome of a command added to the queue
+    """
+    def __init__(self, commandId, roomId, itemId, method, args=[]):
+        """
+        Arguments:
+        commandId -- the id given to the command by the queue
+        roomId -- id of the room
+        itemId -- id of the item
+        method -- method to be called
+        args -- arguments of the method
+        """
+        self.id = commandId
+        self.roomId = roomId
+        self.itemId = itemId
+        self.method = method
+        self.args = args
+        self.status = QUEUED
+        self.result = None
+        self.error = None
+        self.queuedAt = time.time()
+        self.startedAt = None
+        self.finishedAt = None
+        self.finished = threading.Event()
+
+    def setRunning(self):
+        """Marks the command as being executed"""
+        self.startedAt = time.time()
+        self.status = RUNNING
+
+    def setResult(self, result):
+        """
+        Records the value returned by the method
+
+        Arguments:
+        result -- the return value
+        """
+        self.result = result
+        self.finish(DONE)
+
+    def setError(self, error):
+        """
+        Records the exception raised by the method
+
+        Arguments:
+        error -- the exception
+        """
+        self.error = str(error)
+        self.finish(FAILED)
+
+    def finish(self, status):
+        self.finishedAt = time.time()
+        self.status = status
+        self.finished.set()
+
+    def isDone(self):
+        return self.finished.is_set()
+
+    def wait(self, timeout=None):
+        """
+        Waits for the command to finish, returns True if it has
+
+        Arguments:
+        timeout -- the maximum number of seconds to wait, forever if None
+        """
+        return self.finished.wait(timeout)
+
+    def toDict(self):
+        """Returns the command in the correct format for the API"""
+        result = self.result
+        if not isinstance(result, (int, long, float, basestring, bool, list, dict, type(None))):
+            result = str(result)
+        if self.finishedAt is not None:
+            latency = self.finishedAt - self.queuedAt
+        else:
+            latency = None
+        return {'commandId': self.id, 'roomId': self.roomId, 'itemId': self.itemId, 'cmd': self.method, 'args': self.args, 'status': self.status, 'result': result, 'error': self.error, 'latency': latency}
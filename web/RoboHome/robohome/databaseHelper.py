@@ -1,7 +1,14 @@
 import MySQLdb as mdb
+import time
+import metrics
+
+querySeconds = metrics.histogram('robohome_db_query_seconds', 'Time taken by database queries', ['operation'])
 
 class DatabaseHelper(object):
-    
+
+    # A queryProfiler.QueryProfiler every query is recorded with, None to not profile
+    profiler = None
+
     try:
         con = mdb.connect(host = '127.0.0.1', user = 'root', passwd = '', db = 'robohome')
     except Exception, e:
@@ -11,11 +18,13 @@ class DatabaseHelper(object):
         self.database = database
 
     def executeQuery(self, query):
+        start = time.time()
         cursor = DatabaseHelper.con.cursor()
         cursor.execute(query)
         id = cursor.lastrowid
         cursor.close()
         DatabaseHelper.con.commit()
+        self.recordQuery(query, 'execute', time.time() - start)
         return id
 
     def addEntry(self, tablename, columns, values):
@@ -31,11 +40,18 @@ class DatabaseHelper(object):
         self.executeQuery(query)
 
     def retrieveData(self, query):
+        start = time.time()
         cursor = DatabaseHelper.con.cursor()
         cursor.execute(query)
         rows = cursor.fetchall()
         cursor.close()
+        self.recordQuery(query, 'retrieve', time.time() - start)
         return rows
 
+    def recordQuery(self, query, operation, seconds):
+        querySeconds.observe(seconds, (operation,))
+        if DatabaseHelper.profiler is not None:
+            DatabaseHelper.profiler.record(query, seconds)
+
 if __name__=='__main__':
     database = DatabaseHelper('127.0.0.1', 'root', 'root', 'robohome')
@@ -1,3 +1,6 @@
+import spans
+
+
 class Event():
     """
     Represents an event that can br triggered by items in the house
@@ -64,9 +67,10 @@ class Action():
         else:
             return False
 
+    @spans.traced('doAction', lambda self, itemsForType=[]: {'actionId': self.id, 'method': self.method})
     def doAction(self, itemsForType=[]):
         """
-        Performs the action on the correct items
+        Performs the action on the correct items and returns the items it was performed on
 
         Arguments:
         itemsForType -- all items in the house of the correct type (needed if there is nether a room or item)
@@ -75,17 +79,17 @@ class Action():
             raise Exception("Invalid action at Id " + str(self.id))
 
         elif self.item != None:
-            getattr(self.item, self.method)()
+            items = [self.item]
 
         elif self.room != None:
-            items = self.room.items
-            for key in items:
-                if items[key]._type is self.type:
-                    getattr(items[key], self.method)()
+            items = [item for item in self.room.items.values() if item._type is self.type]
 
         else:
-            for item in itemsForType:
-                getattr(item, self.method)()
+            items = list(itemsForType)
+
+        for item in items:
+            getattr(item, self.method)()
+        return items
 
     def getItemsActedOn(self):
         """
@@ -0,0 +1,180 @@
+import time
+import threading
+from Queue import Queue, Full, Empty
+
+"""
+Overflow policies for a subscriber whose queue is full
+
+DROP_OLDEST -- discard the oldest queued event to make room for the new one
+DROP_NEWEST -- discard the event being published
+"""
+DROP_OLDEST = 'dropOldest'
+DROP_NEWEST = 'dropNewest'
+
+
+class Subscriber(object):
+    """
+    A consumer of the event bus with its own bounded queue and worker thread
+    """
+    def __init__(self, name, callback, maxSize=100, policy=DROP_OLDEST):
+        """
+        Arguments:
+        name -- unique name of the subscriber
+        callback -- called with the published arguments on the worker thread
+        maxSize -- the maximum number of events waiting to be delivered
+        policy -- what to do when the queue is full (DROP_OLDEST/DROP_NEWEST)
+        """
+        if policy not in (DROP_OLDEST, DROP_NEWEST):
+            raise Exception("Invalid overflow policy: " + str(policy))
+        self.name = name
+        self.callback = callback
+        self.policy = policy
+        self.queue = Queue(maxSize)
+        self.lock = threading.Lock()
+        self.delivered = 0
+        self.dropped = 0
+        self.errors = 0
+        self.totalLatency = 0.0
+        self.maxLatency = 0.0
+        self.lastError = None
+
+        self.worker = threading.Thread(name="Event Bus " + str(name), target=self.work)
+        self.worker.daemon = True
+        self.worker.start()
+
+    def offer(self, args):
+        """
+        Queues an event without blocking, applying the overflow policy if the queue is full
+        Returns False if an event had to be dropped
+
+        Arguments:
+        args -- the tuple of arguments to deliver to the callback
+        """
+        try:
+            self.queue.put_nowait(args)
+            return True
+        except Full:
+            pass
+
+        if self.policy == DROP_OLDEST:
+            try:
+                self.queue.get_nowait()
+            except Empty:
+                pass
+            try:
+                self.queue.put_nowait(args)
+            except Full:
+                pass
+
+        with self.lock:
+            self.dropped += 1
+        return False
+
+    def work(self):
+        """Delivers queued events to the callback, run in a seperate thread"""
+        while True:
+            args = self.queue.get()
+            if args is None:
+                break
+
+            start = time.time()
+            try:
+                self.callback(*args)
+                error = None
+            except Exception, e:
+                error = e
+            latency = time.time() - start
+
+            with self.lock:
+                self.delivered += 1
+                self.totalLatency += latency
+                self.maxLatency = max(self.maxLatency, latency)
+                if error is not None:
+                    self.errors += 1
+                    self.lastError = str(error)
+
+    def stop(self):
+        """Discards any undelivered events and stops the worker thread"""
+        while True:
+            try:
+                self.queue.get_nowait()
+            except Empty:
+                break
+        self.queue.put(None)
+
+    def getStats(self):
+        """Returns the delivery statistics of this subscriber as a dict"""
+        with self.lock:
+            if self.delivered > 0:
+                averageLatency = self.totalLatency / self.delivered
+            else:
+                averageLatency = 0.0
+            return {'queued': self.queue.qsize(), 'delivered': self.delivered, 'dropped': self.dropped, 'errors': self.errors, 'averageLatency': averageLatency, 'maxLatency': self.maxLatency, 'lastError': self.lastError}
+
+
+class EventBus(object):
+    """
+    Delivers published events to subscribers asynchronously so a slow subscriber never blocks the publisher
+    """
+    def __init__(self, maxSize=100, policy=DROP_OLDEST):
+        """
+        Arguments:
+        maxSize -- default queue size for new subscribers
+        policy -- default overflow policy for new subscribers
+        """
+        self.maxSize = maxSize
+        self.policy = policy
+        self.subscribers = {}
+        self.lock = threading.Lock()
+
+    def subscribe(self, name, callback, maxSize=None, policy=None):
+        """
+        Adds a subscriber to the bus, replacing any existing subscriber with the same name
+
+        Arguments:
+        name -- unique name of the subscriber
+        callback -- called with the published arguments
+        maxSize -- the queue size, the bus default if None
+        policy -- the overflow policy, the bus default if None
+        """
+        if maxSize is None:
+            maxSize = self.maxSize
+        if policy is None:
+            policy = self.policy
+        subscriber = Subscriber(name, callback, maxSize, policy)
+        with self.lock:
+            old = self.subscribers.get(name)
+            self.subscribers[name] = subscriber
+        if old is not None:
+            old.stop()
+        return subscriber
+
+    def unsubscribe(self, name):
+        """
+        Removes a subscriber from the bus and stops its worker
+
+        Arguments:
+        name -- the name of the subscriber
+        """
+        with self.lock:
+            subscriber = self.subscribers.pop(name, None)
+        if subscriber is not None:
+            subscriber.stop()
+
+    def publish(self, *args):
+        """
+        Queues an event for every subscriber without waiting for them
+
+        Arguments:
+        args -- the arguments passed to each subscriber's callback
+        """
+        with self.lock:
+            subscribers = self.subscribers.values()
+        for subscriber in subscribers:
+            subscriber.offer(args)
+
+    def getStats(self):
+        """Returns the statistics of every subscriber keyed by name"""
+        with self.lock:
+            subscribers = self.subscribers.items()
+        return dict((name, s.getStats()) for name, s in subscribers)
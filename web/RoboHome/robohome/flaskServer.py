@@ -16,11 +16,21 @@
 from flask import *
 from houseSystem import House
 from databaseTables import Database
+from databaseHelper import DatabaseHelper
+from queryProfiler import QueryProfiler
+from samplingProfiler import SamplingProfiler
 from flask_openid import OpenID
-from IPy import IP
+from cache import LRUCache
+from localNetwork import LocalNetwork
+from triggerTrace import TraceRecorder
+import metrics
+import spans
+import pollerWatchdog
 import updateManager
 import threading
+import time
 import middleLayers
+import lightwaveRF
 
 """
 This file contains the following Flask routes:
@@ -49,9 +59,47 @@ SETTINGS = {
         'HOST': '127.0.0.1',
         'PORT': 9090
     },
+    'NETWORK': {
+        # Clients on these networks do not need to log in, IPv6 networks (e.g. fd00::/8) may be added
+        'LOCAL': ['10.0.0.0/24', '192.168.0.0/24', '127.0.0.0/24', '::1/128'],
+        # X-Forwarded-For is only believed for requests from these proxies
+        'TRUSTED_PROXIES': ['127.0.0.1', '::1']
+    },
+    # Emails of the logged in users allowed to use the admin routes
+    'ADMINS': [],
+    # Whether clients on the local network may use the admin routes without logging in
+    'ADMIN_LOCAL_NETWORK': False,
     'API': {
         'STATUS_CODE': 'statusCode',
-        'CONTENT': 'content'
+        'CONTENT': 'content',
+        # Longest a request may wait for commands to finish with ?wait=<ms>
+        'MAX_WAIT': 30000
+    },
+    # File every trigger and the actions it set off are appended to, for replaying with benchmarks.traceReplay, None to disable
+    'TRACE': None,
+    # Profile database queries, logging those taking SLOW seconds or more and shapes run REPEATED times in one request
+    'QUERY_PROFILER': {
+        'ENABLED': False,
+        'SLOW': 0.1,
+        'REPEATED': 5
+    },
+    # Trace each state change from the poll that saw it to the commands its rules sent, shown by /debug/traces/
+    'SPANS': {
+        'ENABLED': True,
+        # File every finished span is appended to as a line of JSON, None to only keep them in memory
+        'FILE': None
+    },
+    # Sampling profiler started by POST /debug/profile/, sampling every INTERVAL seconds for at most MAX_SECONDS
+    'PROFILER': {
+        'INTERVAL': 0.02,
+        'MAX_SECONDS': 60
+    },
+    # Restart pollers whose poll has taken STALL seconds, quarantining for QUARANTINE seconds the devices restarted MAX_RESTARTS times
+    'WATCHDOG': {
+        'ENABLED': True,
+        'STALL': 60,
+        'MAX_RESTARTS': 3,
+        'QUARANTINE': 300
     }
 }
 
@@ -66,6 +114,29 @@ def pack(content={}, statusCode=200):
     }
 
 
+def getNumberArg(args, name, default=None, cast=int, minimum=0):
+    """
+    Returns a numeric query argument, or default if it was not given
+    Raises ValueError with a message for the client if it is not a finite number of at least minimum
+
+    Arguments:
+    args -- the query arguments
+    name -- the name of the argument
+    default -- returned if the argument was not given
+    cast -- int or float
+    minimum -- the smallest value allowed
+    """
+    if name not in args:
+        return default
+    try:
+        value = cast(args[name])
+    except (ValueError, TypeError):
+        value = None
+    if value is None or not (minimum <= value < float('inf')):
+        raise ValueError(name + " must be a number no less than " + str(minimum))
+    return value
+
+
 def parrot(request):
     dict = {
         'method': request.method,
@@ -86,11 +157,176 @@ app.config.update(
 
 app.register_blueprint(middleLayers.gadgeteerBlueprint)
 
+if SETTINGS['QUERY_PROFILER']['ENABLED']:
+    DatabaseHelper.profiler = QueryProfiler(SETTINGS['QUERY_PROFILER']['SLOW'], SETTINGS['QUERY_PROFILER']['REPEATED'])
+
+spans.tracer.enabled = SETTINGS['SPANS']['ENABLED']
+if SETTINGS['SPANS']['FILE'] is not None:
+    spans.tracer.export(SETTINGS['SPANS']['FILE'])
+
 db = Database()
 house = House(db)
-house.initFromDatabase()
+if DatabaseHelper.profiler is not None:
+    with DatabaseHelper.profiler.scope('initFromDatabase'):
+        house.initFromDatabase()
+else:
+    house.initFromDatabase()
+if SETTINGS['TRACE'] is not None:
+    TraceRecorder(SETTINGS['TRACE']).attach(house)
+if SETTINGS['WATCHDOG']['ENABLED']:
+    pollerWatchdog.Watchdog(pollerWatchdog.registry, SETTINGS['WATCHDOG']['STALL'], SETTINGS['WATCHDOG']['MAX_RESTARTS'], SETTINGS['WATCHDOG']['QUARANTINE']).start()
 oid = OpenID(app)
 
+# Logged in users keyed by openid and whitelist membership keyed by email, so
+# authenticated requests do not query the database every time
+userCache = LRUCache(256, 300)
+whitelistCache = LRUCache(256, 300)
+
+localNetwork = LocalNetwork(SETTINGS['NETWORK']['LOCAL'], SETTINGS['NETWORK']['TRUSTED_PROXIES'])
+
+samplingProfiler = SamplingProfiler()
+
+"""
+METRICS
+"""
+
+requestSeconds = metrics.histogram('robohome_http_request_seconds', 'Time taken to handle a request', ['route', 'method', 'status'])
+
+
+@app.before_request
+def startRequestTimer():
+    g.requestStart = time.time()
+
+
+@app.after_request
+def observeRequest(response):
+    start = getattr(g, 'requestStart', None)
+    if start is not None:
+        # Labelled by the route's rule rather than the path, so ids do not create a series each
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        requestSeconds.observe(time.time() - start, (route, request.method, response.status_code))
+    return response
+
+
+def beginQueryScope():
+    if DatabaseHelper.profiler is not None:
+        route = request.url_rule.rule if request.url_rule is not None else request.path
+        DatabaseHelper.profiler.begin(request.method + ' ' + route)
+
+# Run before every other hook, so the queries they make, e.g. loading the user, are counted against the request
+app.before_request_funcs.setdefault(None, []).insert(0, beginQueryScope)
+
+
+@app.teardown_request
+def endQueryScope(exception=None):
+    if DatabaseHelper.profiler is not None:
+        DatabaseHelper.profiler.end()
+
+
+@app.route('/debug/queries/', methods=['GET'])
+def getQueryProfile():
+    if g.user is None and not isIpOnLocalNetwork():
+        return redirect(url_for('login'))
+
+    if request.method == 'GET':
+        if DatabaseHelper.profiler is None:
+            return jsonify(pack('query profiling is disabled', 404))
+        return jsonify(pack(DatabaseHelper.profiler.getStats()))
+
+
+@app.route('/debug/traces/', methods=['GET'])
+def getTraces():
+    if g.user is None and not isIpOnLocalNetwork():
+        return redirect(url_for('login'))
+
+    if request.method == 'GET':
+        args = request.args.to_dict()
+        try:
+            limit = getNumberArg(args, 'limit', 20)
+        except ValueError, e:
+            return jsonify(pack(str(e), 400))
+        return jsonify(pack(spans.tracer.getTraces(limit)))
+
+
+@app.route('/debug/traces/<traceId>/', methods=['GET'])
+def getTrace(traceId):
+    if g.user is None and not isIpOnLocalNetwork():
+        return redirect(url_for('login'))
+
+    if request.method == 'GET':
+        trace = spans.tracer.getTrace(traceId)
+        if trace is None:
+            return jsonify(pack('trace not found', 404))
+        return jsonify(pack(trace))
+
+
+@app.route('/debug/profile/', methods=['GET', 'POST'])
+def profile():
+    if g.user is None and not isIpOnLocalNetwork():
+        return redirect(url_for('login'))
+    if not isAdmin():
+        return jsonify(pack('admin only', 403))
+
+    args = request.args.to_dict()
+
+    if request.method == 'GET':
+        current = samplingProfiler.getProfile()
+        if current is None:
+            return jsonify(pack('no profile has been started', 404))
+        if args.get('format') == 'collapsed':
+            response = make_response(current.collapsed())
+            response.headers['Content-Type'] = 'text/plain'
+            return response
+        try:
+            limit = getNumberArg(args, 'limit', 50)
+        except ValueError, e:
+            return jsonify(pack(str(e), 400))
+        content = current.toDict(limit)
+        content['running'] = samplingProfiler.running
+        return jsonify(pack(content))
+
+    if request.method == 'POST':
+        try:
+            seconds = min(getNumberArg(args, 'seconds', 10, float), SETTINGS['PROFILER']['MAX_SECONDS'])
+            interval = max(getNumberArg(args, 'interval', SETTINGS['PROFILER']['INTERVAL'], float), SETTINGS['PROFILER']['INTERVAL'])
+        except ValueError, e:
+            return jsonify(pack(str(e), 400))
+        if not samplingProfiler.start(seconds, interval, args.get('idle') == 'true'):
+            return jsonify(pack('a profile is already running', 409))
+        return jsonify(pack({'seconds': seconds, 'interval': interval}, 202))
+
+
+@app.route('/debug/pollers/', methods=['GET'])
+def getPollers():
+    if g.user is None and not isIpOnLocalNetwork():
+        return redirect(url_for('login'))
+
+    if request.method == 'GET':
+        return jsonify(pack(pollerWatchdog.registry.getStatus()))
+
+
+@app.route('/debug/lightwaverf/', methods=['GET'])
+def getLightwaveRFStats():
+    if g.user is None and not isIpOnLocalNetwork():
+        return redirect(url_for('login'))
+
+    if request.method == 'GET':
+        if lightwaveRF.transport is None:
+            return jsonify(pack('no LightwaveRF device has been added', 404))
+        return jsonify(pack(lightwaveRF.transport.getStats()))
+
+
+@app.route('/metrics', methods=['GET'])
+def getMetrics():
+    if g.user is None and not isIpOnLocalNetwork():
+        return redirect(url_for('login'))
+
+    if request.method == 'GET':
+        response = make_response(metrics.registry.render())
+        response.headers['Content-Type'] = 'text/plain; version=0.0.4'
+        return response
+
+
 """
 TOP LEVEL PAGES
 """
@@ -177,10 +413,14 @@ def whitelist(version):
 
     if request.method == 'POST':
         db.whitelist.addEntry(args['email'])
+        whitelistCache.invalidate(args['email'])
+        userCache.clear()
         return jsonify(pack('success'))
 
     if request.method == 'DELETE':
         db.whitelist.deleteEmail(args['email'])
+        whitelistCache.invalidate(args['email'])
+        userCache.clear()
         return jsonify(pack('success'))
 
 
@@ -282,9 +522,129 @@ def rooms_roomId_items_itemId_cmd(version, roomId, itemId, cmd):
         return parrot(request)
 
     if request.method == 'PUT':
-        # Command item
-        house.addToQueue(int(roomId), int(itemId), cmd)
-        return jsonify(pack('success'))
+        # Command item, optionally waiting up to ?wait=<ms> for it to finish
+        try:
+            wait = getNumberArg(args, 'wait')
+        except ValueError, e:
+            return jsonify(pack(str(e), 400))
+        commandId = house.addToQueue(int(roomId), int(itemId), cmd)
+        return jsonify(pack(getCommandResults([commandId], wait)[0]))
+
+
+@app.route('/version/<string:version>/rooms/<int:roomId>/<string:itemType>/<string:cmd>/', methods=['PUT'])
+def rooms_roomId_itemType_cmd(version, roomId, itemType, cmd):
+    if g.user is None and not isIpOnLocalNetwork():
+        return redirect(url_for('login'))
+
+    args = request.args.to_dict()
+    if('test' in args):
+        return parrot(request)
+
+    if request.method == 'PUT':
+        # Command every item of a type in a room
+        return queueTypeCommand(itemType, cmd, args, int(roomId))
+
+
+@app.route('/version/<string:version>/house/<string:itemType>/<string:cmd>/', methods=['PUT'])
+def house_itemType_cmd(version, itemType, cmd):
+    if g.user is None and not isIpOnLocalNetwork():
+        return redirect(url_for('login'))
+
+    args = request.args.to_dict()
+    if('test' in args):
+        return parrot(request)
+
+    if request.method == 'PUT':
+        # Command every item of a type in the house
+        return queueTypeCommand(itemType, cmd, args)
+
+
+def queueTypeCommand(itemType, cmd, args, roomId=None):
+    """
+    Queues a command for every item of a type and returns the command ids, optional args are given as a JSON list
+    """
+    try:
+        wait = getNumberArg(args, 'wait')
+        cmdArgs = json.loads(args.get('args', '[]'))
+        queued = house.addTypeCommandToQueue(itemType, cmd, cmdArgs, roomId)
+    except KeyError, e:
+        # str() of a KeyError quotes its message
+        return jsonify(pack(e.args[0] if e.args else str(e), 400))
+    except Exception, e:
+        return jsonify(pack(str(e), 400))
+    return jsonify(pack({'commands': getCommandResults([c for r, i, c in queued], wait)}))
+
+
+@app.route('/version/<string:version>/commands/', methods=['POST'])
+def commands(version):
+    if g.user is None and not isIpOnLocalNetwork():
+        return redirect(url_for('login'))
+
+    args = request.args.to_dict()
+    if('test' in args):
+        return parrot(request)
+
+    if request.method == 'POST':
+        # Queue a batch of commands, either all of them or none if any is invalid
+        # Body: {"commands": [{"roomId": 1, "itemId": 2, "cmd": "setBrightness", "args": [50]}, ...]}
+        try:
+            wait = getNumberArg(args, 'wait')
+        except ValueError, e:
+            return jsonify(pack(str(e), 400))
+        try:
+            commandList = json.loads(request.data)['commands']
+            commands = [(c['roomId'], c['itemId'], c['cmd'], c.get('args', [])) for c in commandList]
+        except (ValueError, KeyError, TypeError, AttributeError):
+            return jsonify(pack('Body must be {"commands": [{"roomId", "itemId", "cmd", "args"}, ...]}', 400))
+
+        errors = [house.validateCommand(*c) for c in commands]
+        if any(errors):
+            results = [{'roomId': c[0], 'itemId': c[1], 'cmd': c[2], 'error': e} for c, e in zip(commands, errors)]
+            return jsonify(pack({'commands': results}, 400))
+
+        commandIds = house.addCommandsToQueue(commands)
+        return jsonify(pack({'commands': getCommandResults(commandIds, wait)}))
+
+
+@app.route('/version/<string:version>/commands/<int:commandId>/', methods=['GET'])
+def commands_commandId(version, commandId):
+    if g.user is None and not isIpOnLocalNetwork():
+        return redirect(url_for('login'))
+
+    args = request.args.to_dict()
+    if('test' in args):
+        return parrot(request)
+
+    if request.method == 'GET':
+        # Return the status of a queued command, optionally waiting up to ?wait=<ms> for it to finish
+        try:
+            wait = getNumberArg(args, 'wait')
+        except ValueError, e:
+            return jsonify(pack(str(e), 400))
+        if house.getCommand(commandId) is None:
+            return jsonify(pack('Invalid commandId', 404))
+        return jsonify(pack(getCommandResults([commandId], wait)[0]))
+
+
+def getCommandResults(commandIds, wait=None):
+    """
+    Returns the status of queued commands, first waiting up to wait milliseconds for them to finish if it is given
+    """
+    if wait is not None:
+        deadline = time.time() + min(wait, SETTINGS['API']['MAX_WAIT']) / 1000.0
+        for commandId in commandIds:
+            command = house.getCommand(commandId)
+            if command is not None:
+                command.wait(max(0, deadline - time.time()))
+
+    results = []
+    for commandId in commandIds:
+        command = house.getCommand(commandId)
+        if command is None:
+            results.append({'commandId': commandId, 'status': None})
+        else:
+            results.append(command.toDict())
+    return results
 
 
 """
@@ -429,10 +789,10 @@ def pluginPage(pluginName, path):
     if('test' in args):
         return parrot(request)
     if request.method == 'GET':
-        if pluginName not in plugins:
+        if pluginName not in house.pluginManager.plugins:
             abort(404)
         else:
-            return (plugins[pluginName].getPage(path))
+            return (house.pluginManager.plugins[pluginName].getPage(path))
 
 
 @app.route('/plugins/<string:pluginName>/', methods=['GET', 'DELETE'])
@@ -459,6 +819,8 @@ def getPlugins():
         return parrot(request)
 
     if request.method == 'GET':
+        if('stats' in args):
+            return jsonify(pack(house.pluginManager.getStats()))
         return jsonify(pack(house.pluginManager.getPlugins()))
 
     if request.method == 'POST':
@@ -490,21 +852,51 @@ Licence: https://github.com/mitsuhiko/flask-openid/blob/master/LICENSE
 def before_request():
     g.user = None
     if 'openid' in session:
-        g.user = db.users.getUserByOpenid(session['openid'])
+        g.user = getUser(session['openid'])
+
+
+def getUser(openid):
+    """
+    Returns the user for an openid, only querying the database if it is not cached
+    """
+    user = userCache.get(openid, userCache)
+    if user is userCache:
+        user = db.users.getUserByOpenid(openid)
+        userCache.put(openid, user)
+    return user
+
+
+def isInWhitelist(email):
+    """
+    Returns whether an email is whitelisted, only querying the database if it is not cached
+    """
+    whitelisted = whitelistCache.get(email)
+    if whitelisted is None:
+        whitelisted = db.whitelist.isInWhitelist(email)
+        whitelistCache.put(email, whitelisted)
+    return whitelisted
 
 
 def getIp():
-    if not request.headers.getlist("X-Forwarded-For"):
-        return request.remote_addr
-    else:
-        return request.headers.getlist("X-Forwarded-For")[0]
+    return localNetwork.getClientIp(request.remote_addr, request.headers.getlist("X-Forwarded-For"))
+
+
+# Gadgeteers are looked up by the address of the request, which must not be spoofable with X-Forwarded-For either
+middleLayers.getClientIp = getIp
 
 
 def isIpOnLocalNetwork():
-    network10 = IP("10.0.0.0/24")
-    network192 = IP("192.168.0.0/24")
-    network127 = IP("127.0.0.0/24")
-    return getIp() in network10 or getIp() in network192 or getIp() in network127
+    return localNetwork.isLocal(getIp())
+
+
+def isAdmin():
+    """
+    Returns whether the client may use the admin routes, i.e. it is logged in as one of SETTINGS['ADMINS'],
+    or it is on the local network and SETTINGS['ADMIN_LOCAL_NETWORK'] allows that
+    """
+    if g.user is not None and g.user['email'] in SETTINGS['ADMINS']:
+        return True
+    return SETTINGS['ADMIN_LOCAL_NETWORK'] and isIpOnLocalNetwork()
 
 
 @app.route('/login', methods=['GET', 'POST'])
@@ -528,7 +920,8 @@ def login():
 def create_or_login(resp):
     # Called when the login was successful
     session['openid'] = resp.identity_url
-    user = db.users.getUserByOpenid(resp.identity_url)
+    userCache.invalidate(resp.identity_url)
+    user = getUser(resp.identity_url)
     if user is not None:
         g.user = user
         return redirect(oid.get_next_url())
@@ -537,9 +930,12 @@ def create_or_login(resp):
     if db.users.numOfRows() == 0:
         db.users.addEntry(name, email, session['openid'])
         db.whitelist.addEntry(email)
+        userCache.invalidate(session['openid'])
+        whitelistCache.invalidate(email)
         return redirect(oid.get_next_url())
-    elif db.whitelist.isInWhitelist(email):
+    elif isInWhitelist(email):
         db.users.addEntry(name, email, session['openid'])
+        userCache.invalidate(session['openid'])
         return redirect(oid.get_next_url())
     else:
         return render_template('html/loginerror.html')
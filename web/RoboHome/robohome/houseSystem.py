@@ -1,9 +1,25 @@
 import eca
-from priorityQueue import MyPriorityQueue
+from priorityQueue import RoutedQueue, priorities
 from threading import Thread
 import staticData as data
 from listeners import ListenerManager
 from pluginManager import PluginManager
+from commands import CommandFuture
+from cache import LRUCache
+import metrics
+import spans
+import pollerWatchdog
+import time
+
+# Number of threads executing methods from the queue, each item's methods always run on the same one
+METHOD_THREADS = 4
+# Number of finished or queued commands whose status is remembered
+COMMAND_HISTORY = 1000
+
+commandWaitSeconds = metrics.histogram('robohome_command_wait_seconds', 'Time commands spent in the queue before being executed', ['method'])
+commandSeconds = metrics.histogram('robohome_command_seconds', 'Time taken to execute a command', ['method', 'status'])
+ruleEvaluationSeconds = metrics.histogram('robohome_rule_evaluation_seconds', 'Time taken by reactToEvent to evaluate the rules for a trigger and perform their actions')
+rulesMatched = metrics.counter('robohome_rules_matched_total', 'Rules whose conditions matched a trigger')
 
 class House(object):
     """
@@ -14,12 +30,18 @@ class House(object):
         self.database = database
         self.rooms = {}
         self.events = []
-        self.queue = MyPriorityQueue()
+        self.typeIndex = None
+        self.queue = RoutedQueue(METHOD_THREADS)
+        self.commands = LRUCache(COMMAND_HISTORY)
+        metrics.gauge('robohome_queue_depth', 'Commands waiting in the queue', callback=self.queue.qsize)
         self.listenerManager = ListenerManager()
         self.listenerManager.addListener(self.reactToEvent)
-        self.methodThread = Thread(name="Method Thread", target=self.executeFromQueue)
-        self.methodThread.daemon = True
-        self.methodThread.start()
+        self.methodThreads = []
+        for i in range(METHOD_THREADS):
+            t = Thread(name="Method Thread " + str(i), target=self.executeFromQueue, args=[i])
+            t.daemon = True
+            t.start()
+            self.methodThreads.append(t)
         self.pluginManager = PluginManager(self.rooms, self.events, self.queue)
         self.listenerManager.addListener(self.pluginManager.notify)
 
@@ -34,6 +56,7 @@ class House(object):
                 for item in items:
                     self.rooms[room.id].items[item._id] = item
                     item.listener = self.listenerManager
+        self.invalidateTypeIndex()
 
         #a bit of a hack...
         self.events = self.database.events.getEvents()
@@ -88,7 +111,10 @@ class House(object):
         """
         if roomId in self.rooms:
             self.database.room.removeEntry(self.rooms[roomId])
+            for item in self.rooms[roomId].items.values():
+                self.stopPolling(item)
             del self.rooms[roomId]
+            self.invalidateTypeIndex()
         else:
             raise KeyError("Invalid roomId")
 
@@ -108,6 +134,7 @@ class House(object):
             item = data.types[type](None, name, brand, type, ip, self.listenerManager)
             itemId = self.database.items.addEntry(item, roomId)
             self.rooms[roomId].addItem(itemId, item)
+            self.invalidateTypeIndex()
         else:
             raise KeyError("Invalid roomId")
         return itemId
@@ -131,6 +158,7 @@ class House(object):
             self.rooms[roomId].items[itemId]._type = type
             self.rooms[roomId].items[itemId].roomId = roomId
             self.database.items.updateEntry(self.rooms[roomId].items[itemId], roomId)
+            self.invalidateTypeIndex()
         else:
             raise KeyError("Invalid roomId or itemId")
         return itemId
@@ -145,10 +173,24 @@ class House(object):
         """
         if roomId in self.rooms and itemId in self.rooms[roomId].items:
             self.database.items.removeEntry(self.rooms[roomId].items[itemId])
+            self.stopPolling(self.rooms[roomId].items[itemId])
             del self.rooms[roomId].items[itemId]
+            self.invalidateTypeIndex()
         else:
             raise KeyError("Invalid roomId or itemId")
 
+    def stopPolling(self, item):
+        """
+        Stops polling the device of a deleted item and removes it from the watchdog's registry
+
+        Arguments:
+        item -- the deleted item
+        """
+        layer = getattr(item, 'middleLayer', None)
+        if getattr(layer, 'poller', None) is not None:
+            layer.stopPolling()
+            pollerWatchdog.registry.unregister(layer)
+
     def getItemById(self, itemId):
         """
         Returns the item with the specified id
@@ -180,12 +222,25 @@ class House(object):
         Arguments:
         type -- the type of the item
         """
-        items = []
-        for room in self.rooms:
-            for item in self.rooms[room].items:
-                if self.rooms[room].items[item]._type == _type:
-                    items.append(self.rooms[room].items[item])
-        return items
+        return [self.rooms[roomId].items[itemId] for roomId, itemId in self.getTypeIndex().get(_type, [])]
+
+    def getTypeIndex(self):
+        """
+        Returns the (roomId, itemId) of every item keyed by item type
+        The index is built on first use and rebuilt after the rooms or items change
+        """
+        index = self.typeIndex
+        if index is None:
+            index = {}
+            for roomId in self.rooms:
+                for itemId in self.rooms[roomId].items:
+                    index.setdefault(self.rooms[roomId].items[itemId]._type, []).append((roomId, itemId))
+            self.typeIndex = index
+        return index
+
+    def invalidateTypeIndex(self):
+        """Marks the type index as out of date"""
+        self.typeIndex = None
 
     def getRoomByItemId(self, itemId):
         """
@@ -233,7 +288,7 @@ class House(object):
         methodsJSON = zip(namesList, methodList)
         dictVersion = {}
         for m in methodsJSON:
-            dictVersion[m[0]] = {'name' : data.typesNice[m[0]], 'isPassive' : data.passive[data.types[m[0]]], 'methods': m[1], 'supportedBrands' : data.supportedBrands[m[0]], 'states' : data.states[m[0]]}
+            dictVersion[m[0]] = dict(data.typeInfo[m[0]], methods=m[1])
         finalDict = {}
         finalDict['supportedTypes'] = dictVersion
         return finalDict
@@ -250,13 +305,7 @@ class House(object):
 
             eventJSON = {"itemType": event.type}
 
-            value = None
-            for state in data.states[event.type]:
-                if state["name"] == event.trigger:
-                    value = state["id"]
-                    break
-
-            eventJSON["value"] = value
+            eventJSON["value"] = data.stateIds[event.type].get(event.trigger)
 
             if not event.item is None:
                 eventJSON["id"] = event.item._id
@@ -310,11 +359,7 @@ class House(object):
         value -- the triggering state of the item
         enabled -- whether the rule is enabled (1/0)
         """
-        trigger = None
-        for state in data.states[_type]:
-            if state["id"] == value:
-                trigger = state["name"]
-                break
+        trigger = data.stateNames[_type].get(value)
         if trigger is None:
             raise Exception("Invalid type and value combination")
         if scope == "item":
@@ -345,11 +390,7 @@ class House(object):
         value -- the triggering state of the item
         enabled -- whether the rule is enabled (1/0)
         """
-        trigger = None
-        for state in data.states[_type]:
-            if state["id"] == value:
-                trigger = state["name"]
-                break
+        trigger = data.stateNames[_type].get(value)
         if trigger is None:
             raise Exception("Invalid type and value combination")
         if scope == "item":
@@ -601,21 +642,25 @@ class House(object):
 
         return possibleEvents
 
+    @spans.traced('reactToEvent', lambda self, ip, trigger: {'ip': ip, 'trigger': trigger})
     def reactToEvent(self, ip, trigger):
         """
         Process a trigger event from a particular IP
+        Returns the (ip, method) of every action performed on an item, in the order they were performed
 
         Arguments:
         ip -- the IP address of the item that sent the trigger
         trigger -- the name of the trigger
         """
 
+        start = time.time()
         item = self.getItemByIP(ip)
 
         possibleEvents = self.getEventsForTrigger(item, trigger)
 
         itemsActedOn = []
         events = []
+        performed = []
 
         for event in possibleEvents:
             eventItemsActedOn = []
@@ -640,17 +685,35 @@ class House(object):
             if not conditionsMatched:
                 continue
 
+            rulesMatched.inc()
             for action in event.actions:
                 if action.isAllItemsInHouse():
-                    action.doAction(self.getItemsByType(action._type))
+                    actedOn = action.doAction(self.getItemsByType(action.type))
                 else:
-                    action.doAction()
+                    actedOn = action.doAction()
+                performed.extend((item.ip, action.method) for item in actedOn)
+        ruleEvaluationSeconds.observe(time.time() - start)
+        return performed
+
+    def executeFromQueue(self, worker):
+        """
+        Executes methods from a worker's queue, run in several seperate threads
+        Every method for an item is routed to the same worker, so they run one at a time in queue order
 
-    def executeFromQueue(self):
-        """Executes method from the queue, run in a seperate thread"""
+        Arguments:
+        worker -- the index of the worker's queue
+        """
         while True:
-            if not self.queue.empty():
-                self.executeMethod(*self.queue.get())
+            commandId, roomId, itemId, method, args = self.queue.getWithId(worker)
+            command = self.trackCommand(commandId, roomId, itemId, method, args)
+            command.setRunning()
+            try:
+                command.setResult(self.executeMethod(roomId, itemId, method, args))
+            except Exception, e:
+                print "Error executing " + str(method) + ": " + str(e)
+                command.setError(e)
+            commandWaitSeconds.observe(command.startedAt - command.queuedAt, (method,))
+            commandSeconds.observe(command.finishedAt - command.startedAt, (method, command.status))
 
     def addToQueue(self, roomId, itemId, method, args=[]):
         """
@@ -662,7 +725,89 @@ class House(object):
         method -- method to be called
         args -- arguments od the method, empty list by detault 
         """
-        self.queue.put(roomId, itemId, method, args)
+        commandId = self.queue.put(roomId, itemId, method, args)
+        self.trackCommand(commandId, roomId, itemId, method, args)
+        return commandId
+
+    def trackCommand(self, commandId, roomId, itemId, method, args=[]):
+        """
+        Returns the CommandFuture recording a queued command, creating it if needed
+
+        Arguments:
+        commandId -- the id given to the command by the queue
+        roomId -- id of the room
+        itemId -- id of the item
+        method -- method to be called
+        args -- arguments of the method
+        """
+        return self.commands.setdefault(commandId, CommandFuture(commandId, roomId, itemId, method, args))
+
+    def getCommand(self, commandId):
+        """
+        Returns the CommandFuture for a command id, or None if it is unknown or has been forgotten
+
+        Arguments:
+        commandId -- the id given to the command by the queue
+        """
+        return self.commands.get(commandId)
+
+    def validateCommand(self, roomId, itemId, method, args=[]):
+        """
+        Returns a description of why a command cannot be queued, or None if it is valid
+
+        Arguments:
+        roomId -- id of the room
+        itemId -- id of the item
+        method -- method to be called
+        args -- arguments of the method
+        """
+        if roomId not in self.rooms:
+            return "Invalid roomId"
+        if itemId not in self.rooms[roomId].items:
+            return "Invalid itemId"
+        if method not in priorities or not callable(getattr(self.rooms[roomId].items[itemId], method, None)):
+            return "Invalid command \"" + str(method) + "\" for item"
+        if not isinstance(args, list):
+            return "Command arguments must be a list"
+        return None
+
+    def addCommandsToQueue(self, commands):
+        """
+        Adds several methods to the queue at once, so no method thread starts any of them before all of them are queued
+        Returns their command ids, the commands should be checked with validateCommand first
+
+        Arguments:
+        commands -- a list of (roomId, itemId, method, args) tuples
+        """
+        commandIds = self.queue.putAll(commands)
+        for commandId, command in zip(commandIds, commands):
+            self.trackCommand(commandId, *command)
+        return commandIds
+
+    def addTypeCommandToQueue(self, _type, method, args=[], roomId=None):
+        """
+        Adds a method to the queue for every item of a type in a room, or in the whole house
+        Returns a list of (roomId, itemId, commandId)
+
+        Arguments:
+        _type -- the type of the items
+        method -- method to be called
+        args -- arguments of the method, empty list by default
+        roomId -- id of the room, every room in the house if None
+        """
+        if _type not in data.types:
+            raise KeyError("Invalid item type")
+        if roomId is not None and roomId not in self.rooms:
+            raise KeyError("Invalid roomId")
+
+        commands = [(r, i, method, args) for r, i in self.getTypeIndex().get(_type, []) if roomId is None or r == roomId]
+        for command in commands:
+            error = self.validateCommand(*command)
+            if error is not None:
+                raise Exception(error)
+
+        commandIds = self.addCommandsToQueue(commands)
+        return [(c[0], c[1], i) for c, i in zip(commands, commandIds)]
 
     def executeMethod(self, roomId, itemId, method, args=[]):
         """
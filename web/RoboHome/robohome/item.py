@@ -1,4 +1,6 @@
 import middleLayers as Layers
+from stateFilter import StateFilter
+import spans
 
 """
 A defualt class for any item in the house
@@ -12,17 +14,32 @@ class Item(object):
         self.brand = brand
         self.ip = ip
         self._type = _type
+        self.stateFilter = StateFilter(self.notifyListener, **staticData.stateFilters.get(_type, {}))
         self.middleLayer = Layers.brands[brand](self.ip, self)
         self.listener = listener
 
     def getState(self):
         return self.middleLayer.send('getState')
 
+    @spans.traced('stateChanged', lambda self, newState: {'ip': self.ip, 'state': newState})
     def stateChanged(self, newState):
-        states = staticData.states[self._type]
-        for state in states:
-            if state["id"] == newState:
-                self.listener.notify(self.ip, state["name"])
+        self.stateFilter.update(newState)
+
+    def setStateFilter(self, debounce=0, minDwell=0, hysteresis=None):
+        """
+        Replaces the filter applied to this item's state changes
+
+        Arguments:
+        debounce -- seconds a new state must be held before it is reported
+        minDwell -- minimum seconds between two reported changes
+        hysteresis -- (low, high) band for items whose state comes from a numeric reading
+        """
+        self.stateFilter = StateFilter(self.notifyListener, debounce, minDwell, hysteresis)
+
+    def notifyListener(self, newState):
+        name = staticData.stateNames[self._type].get(newState)
+        if name is not None:
+            self.listener.notify(self.ip, name)
 
 
 """
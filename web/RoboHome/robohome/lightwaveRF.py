@@ -0,0 +1,414 @@
+import time
+import heapq
+import socket
+import threading
+import itertools
+from Queue import Queue, Empty
+import metrics
+
+# The WiFiLink listens for commands on SEND_PORT and replies to LISTEN_PORT
+SEND_PORT = 9760
+LISTEN_PORT = 9761
+# Minimum seconds between two packets sent to the same WiFiLink, it drops commands sent closer together
+SEND_INTERVAL = 0.25
+# Seconds between two polls of every energy monitor
+ENERGY_POLL_INTERVAL = 5
+# Seconds to wait for the WiFiLink to acknowledge a command, multiplied by ACK_BACKOFF after each retry
+ACK_TIMEOUT = 0.5
+ACK_BACKOFF = 2
+MAX_RETRIES = 3
+
+packets = metrics.counter('robohome_lightwaverf_packets_total', 'Packets sent to and received from LightwaveRF devices', ['direction'])
+deliverySeconds = metrics.histogram('robohome_lightwaverf_delivery_seconds', 'Time from queueing a command to its acknowledgement by the WiFiLink', ['ip'])
+deliveryResends = metrics.counter('robohome_lightwaverf_resends_total', 'Commands resent to a WiFiLink after it did not acknowledge them in time', ['ip'])
+deliveryFailures = metrics.counter('robohome_lightwaverf_failures_total', 'Commands given up on without an acknowledgement from the WiFiLink', ['ip'])
+
+transport = None
+transportLock = threading.Lock()
+
+
+def getTransport():
+    """
+    Returns the LightwaveRF transport shared by the whole process, starting it on first use
+    """
+    global transport
+    with transportLock:
+        if transport is None:
+            transport = LightwaveTransport()
+            transport.start()
+        return transport
+
+
+class LightwaveTransport(object):
+    """
+    A single UDP socket used by every LightwaveRF layer
+    Outgoing packets are paced per WiFiLink and incoming packets are routed to the layers registered for their source address
+    """
+    def __init__(self, port=LISTEN_PORT, interval=SEND_INTERVAL, pollInterval=ENERGY_POLL_INTERVAL):
+        """
+        Arguments:
+        port -- the local port replies are received on
+        interval -- minimum seconds between two packets sent to the same address
+        pollInterval -- seconds between two polls of the energy monitors
+        """
+        self.port = port
+        self.interval = interval
+        self.pollInterval = pollInterval
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            self.sock.bind(("0.0.0.0", port))
+        except socket.error as e:
+            print "Error binding LightwaveRF port %s: %s" % (port, e)
+        self.outgoing = Queue()
+        # Packets waiting for their WiFiLink's pacing as (due, sequence, ip, port, message), and when each address may next be sent to
+        self.pending = []
+        self.nextSend = {}
+        self.sequence = itertools.count()
+        self.handlers = {}
+        self.links = {}
+        self.monitors = []
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.threads = []
+        self.sent = 0
+        self.received = 0
+        self.unrouted = 0
+
+    def start(self):
+        """Starts the send, receive and energy poll threads"""
+        for target in [self.sendLoop, self.receiveLoop, self.pollLoop]:
+            t = threading.Thread(target=target)
+            t.daemon = True
+            t.start()
+            self.threads.append(t)
+
+    def close(self, timeout=1):
+        """
+        Stops the threads of the transport and its links and closes its socket
+
+        Arguments:
+        timeout -- seconds to wait for each thread to finish
+        """
+        if self.stopped.is_set():
+            return
+        self.stopped.set()
+        self.outgoing.put(None)
+        with self.lock:
+            links = list(self.links.values())
+        for link in links:
+            link.close()
+        try:
+            # Wake the receive thread with a packet to itself
+            port = self.sock.getsockname()[1]
+            if port:
+                self.sock.sendto("", ("127.0.0.1", port))
+        except socket.error:
+            pass
+        for t in self.threads:
+            t.join(timeout)
+        self.sock.close()
+
+    def send(self, ip, message, port=SEND_PORT):
+        """
+        Queues a packet to be sent once the pacing allows it
+
+        Arguments:
+        ip -- address of the WiFiLink or monitor
+        message -- the packet to send
+        port -- the destination port
+        """
+        self.outgoing.put((ip, port, message))
+
+    def sendLoop(self):
+        """
+        Sends each packet once its address's pacing allows it, packets to other addresses are not held up meanwhile
+        """
+        while not self.stopped.is_set():
+            try:
+                if self.pending:
+                    packet = self.outgoing.get(True, max(self.pending[0][0] - time.time(), 0.001))
+                else:
+                    packet = self.outgoing.get()
+            except Empty:
+                packet = None
+            if packet is not None:
+                ip, port, message = packet
+                due = max(time.time(), self.nextSend.get(ip, 0))
+                self.nextSend[ip] = due + self.interval
+                heapq.heappush(self.pending, (due, next(self.sequence), ip, port, message))
+
+            now = time.time()
+            while self.pending and self.pending[0][0] <= now and not self.stopped.is_set():
+                due, sequence, ip, port, message = heapq.heappop(self.pending)
+                try:
+                    self.sock.sendto(message, (ip, port))
+                    self.sent += 1
+                    packets.inc(('sent',))
+                except socket.error as e:
+                    print "Error sending to LightwaveRF device %s: %s" % (ip, e)
+
+    def getLink(self, ip, port=SEND_PORT):
+        """
+        Returns the command pipeline of a WiFiLink, creating it on first use
+
+        Arguments:
+        ip -- address of the WiFiLink
+        port -- the port it listens for commands on
+        """
+        with self.lock:
+            link = self.links.get(ip)
+            if link is None:
+                link = WiFiLink(self, ip, port)
+                self.links[ip] = link
+                self.handlers.setdefault(ip, []).append(link.receive)
+        return link
+
+    def register(self, ip, callback):
+        """
+        Routes packets received from an address to a callback
+
+        Arguments:
+        ip -- the source address
+        callback -- called with the packet's data
+        """
+        with self.lock:
+            self.handlers.setdefault(ip, []).append(callback)
+
+    def unregister(self, ip, callback):
+        """
+        Stops routing packets from an address to a callback
+
+        Arguments:
+        ip -- the source address
+        callback -- the callback given to register
+        """
+        with self.lock:
+            callbacks = self.handlers.get(ip, [])
+            if callback in callbacks:
+                callbacks.remove(callback)
+            if not callbacks:
+                self.handlers.pop(ip, None)
+
+    def receiveLoop(self):
+        while not self.stopped.is_set():
+            try:
+                data, addr = self.sock.recvfrom(1024)
+            except socket.error as e:
+                if self.stopped.is_set():
+                    break
+                print "Error receiving from LightwaveRF devices: %s" % e
+                self.stopped.wait(1)
+                continue
+            if self.stopped.is_set():
+                break
+            self.dispatch(data, addr)
+
+    def dispatch(self, data, addr):
+        """
+        Passes a received packet to every callback registered for its source address
+
+        Arguments:
+        data -- the packet's data
+        addr -- the (ip, port) it came from
+        """
+        self.received += 1
+        packets.inc(('received',))
+        with self.lock:
+            callbacks = list(self.handlers.get(addr[0], []))
+        if not callbacks:
+            self.unrouted += 1
+            packets.inc(('unrouted',))
+        for callback in callbacks:
+            try:
+                callback(data)
+            except Exception as e:
+                print "Error handling LightwaveRF packet from %s: %s" % (addr[0], e)
+
+    def addMonitor(self, monitor):
+        """
+        Adds an energy monitor to be polled, its pollEnergy method is called every poll interval
+
+        Arguments:
+        monitor -- the monitor's layer
+        """
+        with self.lock:
+            self.monitors.append(monitor)
+
+    def removeMonitor(self, monitor):
+        with self.lock:
+            if monitor in self.monitors:
+                self.monitors.remove(monitor)
+
+    def pollLoop(self):
+        while not self.stopped.is_set():
+            with self.lock:
+                monitors = list(self.monitors)
+            for monitor in monitors:
+                try:
+                    monitor.pollEnergy()
+                except Exception as e:
+                    print "Error polling energy monitor %s: %s" % (monitor.ip, e)
+            self.stopped.wait(self.pollInterval)
+
+    def getStats(self):
+        with self.lock:
+            links = dict(self.links)
+            stats = {'sent': self.sent, 'received': self.received, 'unrouted': self.unrouted, 'queued': self.outgoing.qsize() + len(self.pending), 'addresses': len(self.handlers), 'monitors': len(self.monitors)}
+        stats['links'] = dict((ip, link.getStats()) for ip, link in links.items())
+        return stats
+
+
+class Delivery(object):
+    """
+    A command waiting to be acknowledged by a WiFiLink
+    """
+    def __init__(self, transaction, command, timeout=None):
+        """
+        Arguments:
+        transaction -- the transaction number the WiFiLink acknowledges it with
+        command -- the command without its transaction number
+        timeout -- the longest it can take to be acknowledged or given up on, including the commands queued before it
+        """
+        self.transaction = transaction
+        self.command = command
+        self.timeout = timeout
+        self.attempts = 0
+        self.delivered = False
+        self.queuedAt = time.time()
+        self.latency = None
+        self.acked = threading.Event()
+        self.finished = threading.Event()
+
+    def getMessage(self):
+        return "%03d,%s" % (self.transaction, self.command)
+
+    def wait(self, timeout=None):
+        """
+        Waits until the command is acknowledged or given up on, returns True if it was acknowledged
+
+        Arguments:
+        timeout -- the maximum number of seconds to wait, forever if None
+        """
+        self.finished.wait(timeout)
+        return self.delivered
+
+
+class WiFiLink(object):
+    """
+    Sends commands to a WiFiLink one at a time, retrying each until the link replies OK to its transaction number
+    """
+    def __init__(self, transport, ip, port=SEND_PORT, timeout=ACK_TIMEOUT, retries=MAX_RETRIES):
+        """
+        Arguments:
+        transport -- the transport packets are sent through
+        ip -- address of the WiFiLink
+        port -- the port it listens for commands on
+        timeout -- seconds to wait for the first acknowledgement
+        retries -- how many times a command is resent before giving up
+        """
+        self.transport = transport
+        self.ip = ip
+        self.port = port
+        self.timeout = timeout
+        self.retries = retries
+        self.queue = Queue()
+        self.transactions = itertools.cycle(range(1, 1000))
+        self.current = None
+        self.delivered = 0
+        self.failed = 0
+        self.resent = 0
+        self.totalLatency = 0
+        self.maxLatency = 0
+        self.stopped = False
+
+        self.thread = threading.Thread(target=self.work)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def send(self, command):
+        """
+        Queues a command and returns its Delivery
+
+        Arguments:
+        command -- the command without its transaction number, e.g. !R1D2F1|Light|On
+        """
+        # Every command ahead of it, and the one being sent, may use up all of its attempts
+        timeout = (self.queue.qsize() + 2) * self.getMaxDeliverySeconds()
+        delivery = Delivery(next(self.transactions), command, timeout)
+        self.queue.put(delivery)
+        if self.stopped:
+            self.giveUp()
+        return delivery
+
+    def getMaxDeliverySeconds(self):
+        """Returns how long one command takes to be given up on when no attempt is acknowledged"""
+        return sum(self.timeout * ACK_BACKOFF ** attempt for attempt in range(self.retries + 1))
+
+    def close(self):
+        """Stops sending commands once the current one is finished, giving up on those still queued"""
+        self.stopped = True
+        self.queue.put(None)
+
+    def giveUp(self):
+        """Finishes the commands still queued as failed, so nothing waits for them forever"""
+        while True:
+            try:
+                delivery = self.queue.get_nowait()
+            except Empty:
+                return
+            if delivery is not None:
+                self.failed += 1
+                deliveryFailures.inc((self.ip,))
+                delivery.finished.set()
+
+    def work(self):
+        while not self.stopped:
+            delivery = self.queue.get()
+            if delivery is None:
+                break
+            self.current = delivery
+            timeout = self.timeout
+            while delivery.attempts <= self.retries:
+                if delivery.attempts > 0:
+                    self.resent += 1
+                    deliveryResends.inc((self.ip,))
+                delivery.attempts += 1
+                self.transport.send(self.ip, delivery.getMessage(), self.port)
+                if delivery.acked.wait(timeout):
+                    break
+                timeout *= ACK_BACKOFF
+            self.current = None
+            if delivery.acked.is_set():
+                delivery.delivered = True
+                delivery.latency = time.time() - delivery.queuedAt
+                self.delivered += 1
+                self.totalLatency += delivery.latency
+                self.maxLatency = max(self.maxLatency, delivery.latency)
+                deliverySeconds.observe(delivery.latency, (self.ip,))
+            else:
+                self.failed += 1
+                deliveryFailures.inc((self.ip,))
+            delivery.finished.set()
+        self.giveUp()
+
+    def receive(self, data):
+        """
+        Called by the transport with each packet received from the link, acknowledges the current command if it matches
+
+        Arguments:
+        data -- the packet's data, e.g. 001,OK
+        """
+        transaction, _, reply = data.strip().partition(",")
+        if not reply.startswith("OK") or not transaction.isdigit():
+            return
+        delivery = self.current
+        if delivery is not None and delivery.transaction == int(transaction):
+            delivery.acked.set()
+
+    def getStats(self):
+        if self.delivered:
+            averageLatency = self.totalLatency / self.delivered
+        else:
+            averageLatency = 0
+        return {'queued': self.queue.qsize(), 'delivered': self.delivered, 'failed': self.failed, 'resent': self.resent, 'averageLatency': averageLatency, 'maxLatency': self.maxLatency}
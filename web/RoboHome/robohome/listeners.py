@@ -10,6 +10,10 @@ class ListenerManager:
         if listener in self.listeners:
             self.listeners.remove(listener)
 
+    def replaceListener(self, listener, replacement):
+        if listener in self.listeners:
+            self.listeners[self.listeners.index(listener)] = replacement
+
     def notify(self, ip, event):
         for listener in self.listeners:
             listener(ip, event)
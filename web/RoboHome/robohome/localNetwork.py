@@ -0,0 +1,94 @@
+from IPy import IP
+from cache import LRUCache
+
+
+class LocalNetwork(object):
+    """
+    Decides whether clients are on the local network
+    The networks are parsed once into integer network/mask pairs and the result for each client is cached
+    """
+    def __init__(self, networks, trustedProxies=[], cacheSize=1024):
+        """
+        Arguments:
+        networks -- the local networks in CIDR notation, IPv4 or IPv6 (e.g. 192.168.0.0/24, fd00::/8)
+        trustedProxies -- addresses of proxies whose X-Forwarded-For header is believed
+        cacheSize -- the number of client addresses to remember
+        """
+        self.networks = [self.compile(n) for n in networks]
+        self.trustedProxies = set(self.key(p) for p in trustedProxies)
+        self.cache = LRUCache(cacheSize)
+
+    def key(self, address):
+        """
+        Returns (version, address) with the address as an integer
+
+        Arguments:
+        address -- the IP address as a string
+        """
+        ip = IP(address)
+        return (ip.version(), ip.int())
+
+    def compile(self, network):
+        """
+        Returns (version, network, mask) with the network and mask as integers
+
+        Arguments:
+        network -- the network in CIDR notation
+        """
+        ip = IP(network)
+        return (ip.version(), ip.int(), ip.netmask().int())
+
+    def isLocal(self, address):
+        """
+        Returns True if the address is on one of the local networks
+
+        Arguments:
+        address -- the IP address as a string
+        """
+        local = self.cache.get(address)
+        if local is None:
+            local = False
+            try:
+                version, value = self.key(address)
+                for v, network, mask in self.networks:
+                    if v == version and value & mask == network:
+                        local = True
+                        break
+            except ValueError:
+                pass
+            self.cache.put(address, local)
+        return local
+
+    def isTrustedProxy(self, address):
+        """
+        Returns True if the address is one of the trusted proxies
+
+        Arguments:
+        address -- the IP address as a string
+        """
+        try:
+            return self.key(address) in self.trustedProxies
+        except ValueError:
+            return False
+
+    def getClientIp(self, remoteAddr, forwardedFor=[]):
+        """
+        Returns the address of the client, following X-Forwarded-For only through trusted proxies
+
+        Arguments:
+        remoteAddr -- the address the request came from
+        forwardedFor -- the values of any X-Forwarded-For headers
+        """
+        if not self.trustedProxies or not forwardedFor:
+            return remoteAddr
+
+        forwarded = []
+        for header in forwardedFor:
+            forwarded.extend(h.strip() for h in header.split(",") if h.strip())
+
+        # Walk back from the nearest hop towards the original client
+        hops = [remoteAddr] + list(reversed(forwarded))
+        for hop in hops:
+            if not self.isTrustedProxy(hop):
+                return hop
+        return hops[-1]
@@ -0,0 +1,214 @@
+import bisect
+import threading
+from collections import OrderedDict
+
+"""
+Counters, gauges and histograms kept in memory and rendered in the Prometheus text format by the /metrics route
+
+Metrics are declared once at import and updated on the hot paths, which only costs a lock and a dict lookup, e.g.
+polls = metrics.histogram('robohome_poll_seconds', 'Time taken to poll a device', ['brand'])
+polls.observe(0.02, ('arduino',))
+"""
+
+# Upper bounds in seconds of the histogram buckets, from a cached lookup to a device timing out
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def formatLabels(labelNames, labels, extra=()):
+    """
+    Returns the {name="value",...} part of a sample, or an empty string if it has no labels
+
+    Arguments:
+    labelNames -- the names of the labels
+    labels -- their values, in the same order
+    extra -- more (name, value) pairs, e.g. the le of a bucket
+    """
+    pairs = list(zip(labelNames, labels)) + list(extra)
+    if not pairs:
+        return ''
+    def escape(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join('%s="%s"' % (name, escape(value)) for name, value in pairs) + '}'
+
+
+def formatValue(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+class Metric(object):
+    """
+    Base class of the metrics, holding a value for each combination of label values
+    """
+    kind = None
+
+    def __init__(self, name, help, labelNames=()):
+        """
+        Arguments:
+        name -- the name exposed to Prometheus
+        help -- what it measures
+        labelNames -- the names of the labels each sample is split by
+        """
+        self.name = name
+        self.help = help
+        self.labelNames = tuple(labelNames)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def render(self):
+        lines = ['# HELP %s %s' % (self.name, self.help), '# TYPE %s %s' % (self.name, self.kind)]
+        lines.extend(self.samples())
+        return lines
+
+    def samples(self):
+        with self.lock:
+            values = sorted(self.values.items())
+        return ['%s%s %s' % (self.name, formatLabels(self.labelNames, labels), formatValue(value)) for labels, value in values]
+
+
+class Counter(Metric):
+    """A count that only goes up, e.g. of errors"""
+    kind = 'counter'
+
+    def inc(self, labels=(), amount=1):
+        """
+        Arguments:
+        labels -- the values of the labels
+        amount -- how much to add
+        """
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def get(self, labels=()):
+        return self.values.get(labels, 0)
+
+
+class Gauge(Metric):
+    """A value that goes up and down, either set as it changes or read from a callback when scraped"""
+    kind = 'gauge'
+
+    def __init__(self, name, help, labelNames=(), callback=None):
+        """
+        Arguments:
+        name -- the name exposed to Prometheus
+        help -- what it measures
+        labelNames -- the names of the labels each sample is split by
+        callback -- returns the value when scraped, so keeping it up to date costs nothing
+        """
+        super(Gauge, self).__init__(name, help, labelNames)
+        self.callback = callback
+
+    def set(self, value, labels=()):
+        with self.lock:
+            self.values[labels] = value
+
+    def samples(self):
+        if self.callback is not None:
+            try:
+                self.set(self.callback())
+            except Exception, e:
+                print "Error reading gauge " + self.name + ": " + str(e)
+        return super(Gauge, self).samples()
+
+
+class Histogram(Metric):
+    """Counts observations, e.g. latencies, in buckets along with their sum"""
+    kind = 'histogram'
+
+    def __init__(self, name, help, labelNames=(), buckets=DEFAULT_BUCKETS):
+        """
+        Arguments:
+        name -- the name exposed to Prometheus
+        help -- what it measures
+        labelNames -- the names of the labels each sample is split by
+        buckets -- the upper bounds of the buckets in ascending order
+        """
+        super(Histogram, self).__init__(name, help, labelNames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, labels=()):
+        """
+        Arguments:
+        value -- the observation, e.g. seconds taken
+        labels -- the values of the labels
+        """
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            counts = self.values.get(labels)
+            if counts is None:
+                # One count per bucket, one for +Inf, then the sum
+                counts = self.values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[index] += 1
+            counts[-1] += value
+
+    def getCount(self, labels=()):
+        counts = self.values.get(labels)
+        if counts is None:
+            return 0
+        return sum(counts[:-1])
+
+    def samples(self):
+        with self.lock:
+            values = sorted((labels, list(counts)) for labels, counts in self.values.items())
+        lines = []
+        for labels, counts in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts[:-1]):
+                cumulative += count
+                lines.append('%s_bucket%s %s' % (self.name, formatLabels(self.labelNames, labels, [('le', formatValue(bound))]), cumulative))
+            lines.append('%s_sum%s %s' % (self.name, formatLabels(self.labelNames, labels), formatValue(counts[-1])))
+            lines.append('%s_count%s %s' % (self.name, formatLabels(self.labelNames, labels), cumulative))
+        return lines
+
+
+class Registry(object):
+    """
+    The metrics exposed by the server, by name
+    """
+    def __init__(self):
+        self.metrics = OrderedDict()
+        self.lock = threading.Lock()
+
+    def register(self, metric):
+        """
+        Adds a metric and returns it, or returns the metric already registered under its name
+
+        Arguments:
+        metric -- the metric
+        """
+        with self.lock:
+            existing = self.metrics.get(metric.name)
+            if existing is None:
+                self.metrics[metric.name] = metric
+                return metric
+        if existing.kind != metric.kind:
+            raise Exception("Metric " + metric.name + " is already registered as a " + existing.kind)
+        return existing
+
+    def render(self):
+        """Returns every metric in the Prometheus text format"""
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+def counter(name, help, labelNames=()):
+    return registry.register(Counter(name, help, labelNames))
+
+
+def gauge(name, help, labelNames=(), callback=None):
+    metric = registry.register(Gauge(name, help, labelNames, callback))
+    if callback is not None:
+        metric.callback = callback
+    return metric
+
+
+def histogram(name, help, labelNames=(), buckets=DEFAULT_BUCKETS):
+    return registry.register(Histogram(name, help, labelNames, buckets))
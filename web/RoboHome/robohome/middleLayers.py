@@ -1,5 +1,4 @@
 import time
-import socket
 import threading
 import requests
 import json
@@ -9,24 +8,98 @@ import urllib2
 from flask import Blueprint
 from flask import *
 import databaseTables as db
+import lightwaveRF
+from eventBus import Subscriber
+import metrics
+import spans
+import pollerWatchdog
 
 
 items = {}
+# States pushed by Gadgeteers waiting to be applied, as (layer, state), created on the first push
+gadgeteerUpdates = None
+gadgeteerUpdatesLock = threading.Lock()
+# Returns the address of the client of the current request, the server replaces it to follow X-Forwarded-For through its trusted proxies
+getClientIp = lambda: request.remote_addr
 
 gadgeteerBlueprint = Blueprint('item', __name__, url_prefix='/gadgeteer')
 
 
+def getGadgeteerUpdates():
+    """
+    Returns the subscriber applying the states pushed by Gadgeteers, starting its thread on first use
+    """
+    global gadgeteerUpdates
+    with gadgeteerUpdatesLock:
+        if gadgeteerUpdates is None:
+            gadgeteerUpdates = Subscriber("gadgeteer", lambda layer, state: layer.updateState(state), 1000)
+        return gadgeteerUpdates
+
+
+def getGadgeteerLayer():
+    return items.get(getClientIp())
+
+
+def queueGadgeteerStates(layer, states):
+    """
+    Queues the states pushed by a Gadgeteer to be applied off the request thread, skipping unchanged states
+    Returns the number of states queued
+
+    Arguments:
+    layer -- the layer of the Gadgeteer
+    states -- the states in the order they were read
+    """
+    queued = 0
+    for state in states:
+        if state != layer.pushedState:
+            layer.pushedState = state
+            getGadgeteerUpdates().offer((layer, state))
+            queued += 1
+    return queued
+
+
 @gadgeteerBlueprint.route('/state/<int:status>/', methods=['PUT'])
 def gadgeteerStatusUpdate(status):
     if request.method == 'PUT':
-        if not request.headers.getlist("X-Forwarded-For"):
-            ip = request.remote_addr
-        else:
-            ip = request.headers.getlist("X-Forwarded-For")[0]
-        items[ip].updateState(status)
+        layer = getGadgeteerLayer()
+        if layer is None:
+            return ("unknown device", 404)
+        queueGadgeteerStates(layer, [status])
         return ("success")
 
 
+@gadgeteerBlueprint.route('/state/', methods=['PUT'])
+def gadgeteerStatusBatchUpdate():
+    if request.method == 'PUT':
+        layer = getGadgeteerLayer()
+        if layer is None:
+            return ("unknown device", 404)
+        try:
+            states = [int(state) for state in json.loads(request.data)['states']]
+        except (ValueError, TypeError, KeyError):
+            return ("invalid states", 400)
+        queueGadgeteerStates(layer, states)
+        return ("success")
+
+
+# Bounds in seconds on the interval between polls of a device, for types not in staticData.pollIntervals
+DEFAULT_POLL_INTERVALS = (2, 30)
+# How much the poll interval grows each time an idle or unreachable device is polled
+POLL_BACKOFF = 1.5
+# Seconds an unreachable device backs off to, whatever the maximum of its type, until it answers again
+UNREACHABLE_POLL_INTERVAL = 60
+# After a command, how long to keep re-checking a device that has not yet reached the expected state
+CONFIRM_TIMEOUT = 5
+CONFIRM_INTERVAL = 0.5
+# Seconds an HTTP request polling a device may take, the watchdog restarts pollers that hang regardless
+POLL_TIMEOUT = 10
+# Seconds between two readings of an energy monitor being stored
+ENERGY_STORE_INTERVAL = 30
+
+pollSeconds = metrics.histogram('robohome_poll_seconds', 'Time taken to poll the state of a device', ['brand'])
+pollErrors = metrics.counter('robohome_poll_errors_total', 'Polls that failed to reach the device', ['brand'])
+
+
 class MiddleLayer(object):
 
     def __init__(self, ip, item):
@@ -34,26 +107,130 @@ class MiddleLayer(object):
         self.mockState = 1
         self.item = item
         self.ip = ip
-
-        t = threading.Thread(target=self.checkForStateChange)
+        self.pollRequested = threading.Event()
+        self.pollInterval = 0
+        self.confirmUntil = 0
+        self.pollGeneration = 0
+        self.poller = pollerWatchdog.registry.register(self)
+        self.startPolling()
+
+    def startPolling(self):
+        """Starts a new poller thread, abandoning the previous one, e.g. if it is stuck in a call to the device"""
+        self.pollGeneration += 1
+        t = threading.Thread(name="Poller " + str(self.ip), target=self.checkForStateChange, args=[self.pollGeneration])
         t.daemon = True
+        self.poller.thread = t
         t.start()
 
-    def checkForStateChange(self):
-        while True:
-            realState = self.checkState()
+    def stopPolling(self):
+        """Makes the poller thread exit once its current poll or wait is over"""
+        self.pollGeneration += 1
+        self.pollRequested.set()
+
+    def checkForStateChange(self, generation):
+        """
+        Polls the device until the poller is restarted or stopped
+
+        Arguments:
+        generation -- the generation of the poller running this, a newer one replaces it
+        """
+        while generation == self.pollGeneration:
+            self.pollRequested.clear()
+            start = time.time()
+            self.poller.started()
+            try:
+                realState = self.checkState()
+            except Exception:
+                if generation != self.pollGeneration:
+                    return
+                # Unreachable, back off
+                self.poller.finished(False)
+                pollSeconds.observe(time.time() - start, (self.item.brand,))
+                pollErrors.inc((self.item.brand,))
+                self.pollRequested.wait(self.updatePollInterval(False, False))
+                continue
+            if generation != self.pollGeneration:
+                # Abandoned by the watchdog while the device was hanging
+                return
+            self.poller.finished(True)
+            pollSeconds.observe(time.time() - start, (self.item.brand,))
+
+            if realState != self.state and self.confirmUntil > time.time():
+                # The device may not have caught up with the last command yet
+                self.pollRequested.wait(CONFIRM_INTERVAL)
+                continue
+            self.confirmUntil = 0
 
             if realState != self.state:
                 self.state = realState
-                t = threading.Thread(target=self.item.stateChanged, args=[realState])
-                t.daemon = True
-                t.start()
+                # The poll that saw the change starts its trace
+                span = spans.tracer.begin('poll', start, ip=self.ip, brand=self.item.brand, state=realState)
+                self.notifyStateChanged(realState)
+                spans.tracer.finish(span)
+                self.pollRequested.wait(self.updatePollInterval(True))
+            else:
+                self.pollRequested.wait(self.updatePollInterval(False))
+
+    def updatePollInterval(self, active, reachable=True):
+        """
+        Shrinks the poll interval to the minimum for the item's type after activity,
+        otherwise backs it off towards the maximum, or towards UNREACHABLE_POLL_INTERVAL if the device did not answer, and returns it
+
+        Arguments:
+        active -- whether the device's state just changed or it was sent a command
+        reachable -- whether the device answered the poll
+        """
+        import staticData
+        minimum, maximum = staticData.pollIntervals.get(self.item._type, DEFAULT_POLL_INTERVALS)
+        if not reachable:
+            maximum = max(maximum, UNREACHABLE_POLL_INTERVAL)
+        if active:
+            self.pollInterval = minimum
+        else:
+            self.pollInterval = min(max(self.pollInterval * POLL_BACKOFF, minimum), maximum)
+        return self.pollInterval
 
-            time.sleep(2)
+    def notifyStateChanged(self, state):
+        t = threading.Thread(target=spans.tracer.wrap(self.item.stateChanged), args=[state])
+        t.daemon = True
+        t.start()
 
     def getState(self):
         return self.state
 
+    @spans.traced('send', lambda self, command, *args: {'ip': self.ip, 'command': command})
+    def send(self, command, *args):
+        """
+        Sends a command to the device, then optimistically applies the state it should result in
+        and polls the device straight away to confirm it
+
+        Arguments:
+        command -- the name of the command method
+        args -- arguments of the command
+        """
+        previous = self.state
+        result = getattr(self, command)(*args)
+
+        expected = self.getExpectedState(command)
+        if expected is not None:
+            self.updatePollInterval(True)
+            self.confirmUntil = time.time() + CONFIRM_TIMEOUT
+            self.state = expected
+            if expected != previous:
+                self.notifyStateChanged(expected)
+            self.pollRequested.set()
+        return result
+
+    def getExpectedState(self, command):
+        """
+        Returns the state a command should leave the device in, or None if it is not known
+
+        Arguments:
+        command -- the name of the command method
+        """
+        import staticData
+        return staticData.methodStates.get(self.item._type, {}).get(command)
+
 
 class MockLayer(MiddleLayer):
 
@@ -63,9 +240,6 @@ class MockLayer(MiddleLayer):
     def checkState(self):
         return self.mockState
 
-    def send(self, command, *args):
-        return getattr(self, command)(*args)
-
     def open(self):
         self.mockState = 1
 
@@ -93,14 +267,8 @@ class ArduinoLayer(MiddleLayer):
         super(ArduinoLayer, self).__init__(ip, item)
 
     def checkState(self):
-        try:
-            response = requests.get('http://'+self.ip+'/state')
-            return json.loads(response.content)['state']
-        except Exception:
-            return self.mockState
-
-    def send(self, command, *args):
-        return getattr(self, command)(*args)
+        response = requests.get('http://'+self.ip+'/state', timeout=POLL_TIMEOUT)
+        return json.loads(response.content)['state']
 
     def open(self):
         requests.get('http://'+self.ip+'/open')
@@ -124,9 +292,6 @@ class WemoLayer(MiddleLayer):
             self.wemoHelper = wemo.WemoHelper(ip)
             self.ready = True
 
-    def send(self, command, *args):
-        return getattr(self, command)(*args)
-
     def checkState(self):
         if (platform.system() == 'Linux' or platform.system() == 'Darwin') and self.ready:
             return self.wemoHelper.getState()
@@ -147,6 +312,7 @@ class GadgeteerLayer(MiddleLayer):
     def __init__(self, ip, item):
         #super(GadgeteerLayer, self).__init__(ip, item) -- No need to poll the state now since Gadgeteer can send PUT requests
         self.state = 1
+        self.pushedState = 1
         self.item = item
         self.ip = ip
         items[ip] = self
@@ -158,17 +324,14 @@ class GadgeteerLayer(MiddleLayer):
         self.state = state
         self.item.stateChanged(state)
 
-    def send(self, command, *args):
-        return getattr(self, command)(*args)
-
 
 class LightwaveRFLayer(MiddleLayer):
     def __init__(self, ip, item):
         self.ready = False
+        self.monitoring = False
         super(LightwaveRFLayer, self).__init__(ip, item)
 
-        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.transport = lightwaveRF.getTransport()
         self.state = 0
 
         if(item._type != "energyMonitor"):
@@ -179,22 +342,35 @@ class LightwaveRFLayer(MiddleLayer):
             self.device = ip.split("D")[1]
         else:
             self.contState = 0
+            self.lastStored = 0
             self.db = db.Database()
-            self.sock.bind(("0.0.0.0", 9761))
-            t1 = threading.Thread(target=self.pollEnergy)
-            t1.daemon = True
-            t1.start()
-
-            t2 = threading.Thread(target=self.listenForEnergy)
-            t2.daemon = True
-            t2.start()
-
-            t3 = threading.Thread(target=self.storeEnergy)
-            t3.daemon = True
-            t3.start()
+            self.attachMonitor()
 
         self.ready = True
 
+    def startPolling(self):
+        """Also has the transport poll an energy monitor again, e.g. when the watchdog ends its quarantine"""
+        super(LightwaveRFLayer, self).startPolling()
+        if self.ready:
+            self.attachMonitor()
+
+    def stopPolling(self):
+        """Also detaches an energy monitor from the transport, so it is no longer polled and its readings no longer stored"""
+        super(LightwaveRFLayer, self).stopPolling()
+        self.detachMonitor()
+
+    def attachMonitor(self):
+        if self.item._type == "energyMonitor" and not self.monitoring:
+            self.monitoring = True
+            self.transport.register(self.ip, self.receiveEnergy)
+            self.transport.addMonitor(self)
+
+    def detachMonitor(self):
+        if self.monitoring:
+            self.monitoring = False
+            self.transport.removeMonitor(self)
+            self.transport.unregister(self.ip, self.receiveEnergy)
+
     def checkState(self):
         # Force state stored in memory so the system knows the true state
         #if self.item._type != "energyMonitor" and self.ready:
@@ -204,33 +380,31 @@ class LightwaveRFLayer(MiddleLayer):
         #        self.off()
         return self.state
 
-    def send(self, command, *args):
-        return getattr(self, command)(*args)
-
     def sendToWiFiLink(self, roomId, deviceId, commandId, messageTop, messageBottom):
-        self.sock.sendto("533!R%sD%sF%s|||" % (roomId, deviceId, commandId), (self.ip, 9760))
+        delivery = self.transport.getLink(self.ip).send("!R%sD%sF%s|%s|%s" % (roomId, deviceId, commandId, messageTop, messageBottom))
+        if not delivery.wait(delivery.timeout):
+            raise Exception("WiFiLink %s did not acknowledge the command after %s attempts" % (self.ip, delivery.attempts))
+        return delivery.latency
 
     def pollEnergy(self):
-        while True:
-            self.sock.sendto(",@?\0", (self.ip, 9760))
-            time.sleep(5)
-
-    def listenForEnergy(self):
-        while True:
-            data, addr = self.sock.recvfrom(1024)
-            if(len(data) > 8):
-                s = data.split("=")[1]
-                s = int(s.split(",")[0])
-                self.contState = s
-                if s > 300:
-                    self.state = 1
-                else:
-                    self.state = 0
-
-    def storeEnergy(self):
-        while True:
+        """Called by the transport every poll interval, asks the monitor for a reading and stores the last one"""
+        self.transport.send(self.ip, ",@?\0")
+        if time.time() - self.lastStored >= ENERGY_STORE_INTERVAL:
+            self.lastStored = time.time()
             self.db.energy.addEntry(self.contState)
-            time.sleep(30)
+
+    def receiveEnergy(self, data):
+        """
+        Called by the transport with each packet received from the monitor
+
+        Arguments:
+        data -- the packet's data
+        """
+        if(len(data) > 8):
+            s = data.split("=")[1]
+            s = int(s.split(",")[0])
+            self.contState = s
+            self.state = self.item.stateFilter.threshold(s, self.state, 300)
 
     def on(self):
         if self.item._type != "energyMonitor":
@@ -1,7 +1,20 @@
 import os
+import sys
+import json
 import zipfile
 import shutil
+import tempfile
+import importlib
+import threading
 from werkzeug import secure_filename
+from eventBus import EventBus
+
+MANIFEST = "plugin.json"
+
+# Limits on uploaded plugin zips
+MAX_PLUGIN_MEMBERS = 1000
+MAX_PLUGIN_SIZE = 50 * 1024 * 1024
+CHUNK_SIZE = 64 * 1024
 
 
 class PluginManager():
@@ -9,33 +22,140 @@ class PluginManager():
     def __init__(self, rooms, events, queue):
         self.pluginsDir = "./plugins/"
         self.plugins = {}
+        self.discovered = {}
         self.rooms = rooms
         self.events = events
         self.queue = queue
+        self.bus = EventBus()
+        # Held while plugins are discovered, loaded or unloaded, e.g. by two requests at once
+        self.lock = threading.RLock()
         self.loadPlugins()
 
     def loadPlugins(self):
         """
-        Loads plugins into the manager for later use
+        Discovers plugins and loads any that are new or have changed since the last call, called again by getPlugins
+        Plugins are only imported the first time they are used
         """
+        with self.lock:
+            discovered = self.discoverPlugins()
 
-        # Incase of reloading plugins - Teardown and empty
-        for plugin in self.plugins:
-            self.plugins[plugin].teardown()
-        self.plugins = {}
+            for name in self.plugins.keys():
+                if self.plugins[name].directory not in discovered:
+                    self.unloadPlugin(name)
+
+            loaded = dict((p.directory, p) for p in self.plugins.values())
+            for directory in discovered:
+                if directory not in loaded or loaded[directory].mtime != discovered[directory][0]:
+                    self.loadPlugin(directory)
+
+    def loadPlugin(self, directory):
+        """
+        Loads or reloads the plugin in a single directory without touching any other plugin
+
+        Arguments:
+        directory -- the name of the plugin's directory inside the plugins directory
+        """
+        with self.lock:
+            for name in self.plugins.keys():
+                if self.plugins[name].directory == directory:
+                    self.unloadPlugin(name)
 
-        subclasses = self.find_subclasses("./plugins/", Plugin)
-        for s in subclasses:
             try:
-                s = s()
-                name = s.getName()
-                s.setup(self.rooms, self.events, self.queue)
+                mtime, manifest = self.discoverPlugin(directory)
+                name = manifest["name"]
                 if(name in self.plugins):
                     raise Exception("Plugin name '" + name + "'' already in use")
-                self.plugins[name] = s
+                plugin = LazyPlugin(self, directory, manifest, mtime)
+                self.plugins[name] = plugin
+                self.bus.subscribe(name, plugin.notify)
             except Exception, e:
                 print "Error loading plugin: " + str(e)
 
+    def unloadPlugin(self, pluginName):
+        """
+        Tears down a plugin and stops sending it events
+
+        Arguments:
+        pluginName -- the name of the plugin to unload
+        """
+        self.bus.unsubscribe(pluginName)
+        plugin = self.plugins.pop(pluginName)
+        try:
+            plugin.teardown()
+        except Exception, e:
+            print "Error unloading plugin: " + str(e)
+
+    def discoverPlugins(self):
+        """
+        Returns (mtime, manifest) for every plugin directory, keyed by directory name
+        """
+        discovered = {}
+        if not os.path.isdir(self.pluginsDir):
+            return discovered
+        for directory in os.listdir(self.pluginsDir):
+            if directory.startswith(".") or directory.startswith("__"):
+                continue
+            if os.path.isdir(os.path.join(self.pluginsDir, directory)):
+                try:
+                    discovered[directory] = self.discoverPlugin(directory)
+                except Exception, e:
+                    print "Error reading plugin manifest: " + str(e)
+        for directory in self.discovered.keys():
+            if directory not in discovered:
+                del self.discovered[directory]
+        return discovered
+
+    def discoverPlugin(self, directory):
+        """
+        Returns (mtime, manifest) for a plugin directory, only re-reading the manifest if it or the directory has changed
+        Files are only added to or removed from a plugin by uploading it again, which replaces the whole directory,
+        so touch the manifest to have the next call to loadPlugins reload a plugin edited in place
+
+        Arguments:
+        directory -- the name of the plugin's directory inside the plugins directory
+        """
+        path = os.path.join(self.pluginsDir, directory)
+        manifestPath = os.path.join(path, MANIFEST)
+        mtime = os.path.getmtime(path)
+        if os.path.exists(manifestPath):
+            mtime = max(mtime, os.path.getmtime(manifestPath))
+
+        if directory in self.discovered and self.discovered[directory][0] == mtime:
+            return self.discovered[directory]
+
+        if os.path.exists(manifestPath):
+            with open(manifestPath, "r") as f:
+                manifest = dict((str(k), str(v)) for k, v in json.load(f).items())
+        else:
+            manifest = {}
+        if "name" not in manifest:
+            manifest["name"] = directory
+
+        self.discovered[directory] = (mtime, manifest)
+        return self.discovered[directory]
+
+    def importPlugin(self, directory, manifest):
+        """
+        Imports a plugin's modules afresh and returns its Plugin subclass
+
+        Arguments:
+        directory -- the name of the plugin's directory inside the plugins directory
+        manifest -- the plugin's manifest, the whole directory is searched if it does not name a module and class
+        """
+        package = self.pluginsDir.replace("./", "").strip("/").replace("/", ".") + "." + directory
+        for modulename in sys.modules.keys():
+            if modulename == package or modulename.startswith(package + "."):
+                del sys.modules[modulename]
+
+        if "module" in manifest and "class" in manifest:
+            module = importlib.import_module(package + "." + manifest["module"])
+            return getattr(module, manifest["class"])
+
+        subclasses = self.find_subclasses(os.path.join(self.pluginsDir, directory), Plugin)
+        if len(subclasses) != 1:
+            raise Exception("Expected one plugin in '" + directory + "', found " + str(len(subclasses)))
+        return subclasses[0]
+
     def find_subclasses(self, path, cls):
         """
         SOURCE: http://www.executionunit.com/blog/2008/01/28/python-style-plugins-made-easy/
@@ -87,8 +207,10 @@ class PluginManager():
 
     def getPlugins(self):
         """
-        Returns a list of loaded plugins in the correct format for the API
+        Rediscovers the plugins, so ones added, changed or removed on disk are picked up,
+        and returns a list of loaded plugins in the correct format for the API
         """
+        self.loadPlugins()
         pluginNames = []
         for p in self.plugins:
             pluginNames.append(p)
@@ -97,37 +219,100 @@ class PluginManager():
     def uploadPlugin(self, file):
         """
         Saves and unzips a file uploaded through Flask
+        The plugin is extracted into a staging directory and only swapped into place once complete
 
         SOURCE: http://flask.pocoo.org/docs/patterns/fileuploads/
-        SOURCE: http://stackoverflow.com/questions/7806563/how-to-unzip-a-zip-file-with-python-2-4
 
         Arguments:
         file -- the file being uploaded
         """
 
-        if file and file.filename.rsplit('.', 1)[1] == 'zip':
-            zipName = file.filename.rsplit('.', 1)[0]
-            filename = secure_filename(file.filename)
-            path = os.path.join("./plugins", filename)
-            file.save(path)
+        if not file or not file.filename.endswith('.zip'):
+            return "File must be a .zip file"
 
-            zfile = zipfile.ZipFile(path)
+        zipName = secure_filename(file.filename).rsplit('.', 1)[0]
+        if not zipName:
+            return "Invalid plugin file name"
 
-            if not os.path.exists(self.pluginsDir + zipName):
-                os.mkdir(self.pluginsDir + zipName)
+        handle, path = tempfile.mkstemp(suffix=".zip", dir=self.pluginsDir)
+        os.close(handle)
+        staging = tempfile.mkdtemp(prefix=".staging-", dir=self.pluginsDir)
+        try:
+            file.save(path)
+            self.extractPlugin(path, staging)
+            self.swapPlugin(staging, zipName)
+        except Exception, e:
+            shutil.rmtree(staging, True)
+            return "Error installing plugin: " + str(e)
+        finally:
+            os.remove(path)
+
+        self.loadPlugin(zipName)
+        return "Plugin Installed"
+
+    def extractPlugin(self, path, destination):
+        """
+        Extracts a plugin zip in chunks, refusing archives that are too large or write outside the destination
 
-            for name in zfile.namelist():
-                (dirname, filename) = os.path.split(name)
-                dirname = self.pluginsDir + zipName + "/" + dirname
-                if not os.path.exists(dirname):
-                    os.mkdir(dirname)
-                fd = open(self.pluginsDir + zipName + "/" + name, "w")
-                fd.write(zfile.read(name))
-                fd.close()
+        Arguments:
+        path -- the path of the zip file
+        destination -- the directory to extract into
+        """
+        root = os.path.realpath(destination)
+        with zipfile.ZipFile(path) as zfile:
+            members = zfile.infolist()
+            if len(members) > MAX_PLUGIN_MEMBERS:
+                raise Exception("Plugin contains more than " + str(MAX_PLUGIN_MEMBERS) + " files")
+
+            total = 0
+            for member in members:
+                target = os.path.realpath(os.path.join(root, member.filename))
+                if os.path.isabs(member.filename) or not target.startswith(root + os.sep):
+                    raise Exception("Invalid path in plugin: " + member.filename)
+
+                if member.filename.endswith("/"):
+                    if not os.path.exists(target):
+                        os.makedirs(target)
+                    continue
+                if not os.path.exists(os.path.dirname(target)):
+                    os.makedirs(os.path.dirname(target))
 
-            self.loadPlugins()
-            return "Plugin Installed"
-        return "File must be a .zip file"
+                source = zfile.open(member)
+                try:
+                    with open(target, "wb") as fd:
+                        while True:
+                            chunk = source.read(CHUNK_SIZE)
+                            if not chunk:
+                                break
+                            total += len(chunk)
+                            if total > MAX_PLUGIN_SIZE:
+                                raise Exception("Plugin is larger than " + str(MAX_PLUGIN_SIZE) + " bytes")
+                            fd.write(chunk)
+                finally:
+                    source.close()
+
+    def swapPlugin(self, staging, directory):
+        """
+        Moves a fully extracted plugin into place, replacing any previous version
+
+        Arguments:
+        staging -- the directory the plugin was extracted into
+        directory -- the name of the plugin's directory inside the plugins directory
+        """
+        target = os.path.join(self.pluginsDir, directory)
+        if os.path.exists(target):
+            old = tempfile.mkdtemp(prefix=".old-", dir=self.pluginsDir)
+            os.rmdir(old)
+            os.rename(target, old)
+            try:
+                os.rename(staging, target)
+            except Exception:
+                # Put the previous version back rather than leave no plugin at all
+                os.rename(old, target)
+                raise
+            shutil.rmtree(old, True)
+        else:
+            os.rename(staging, target)
 
     def deletePlugin(self, pluginName):
         """
@@ -136,24 +321,87 @@ class PluginManager():
         Arguments:
         pluginName -- the name (Plugin.getName()) of the plugin to be deleted
         """
-        self.plugins[pluginName].teardown()
-        shutil.rmtree(self.pluginsDir + pluginName)
-        self.loadPlugins()
+        with self.lock:
+            directory = self.plugins[pluginName].directory
+            self.unloadPlugin(pluginName)
+            shutil.rmtree(self.pluginsDir + directory)
+            self.discovered.pop(directory, None)
         return "Plugin Deleted"
 
     def notify(self, ip, trigger):
         """
-        Informs all plugins of an event
+        Informs all plugins of an event without waiting for them to react
 
         Arguments:
         ip -- the IP address of the item that sent the trigger
         trigger -- the name of the trigger
         """
-        for p in self.plugins:
-            try:
-                self.plugins[p].notify(ip, trigger)
-            except Exception, e:
-                print e
+        self.bus.publish(ip, trigger)
+
+    def getStats(self):
+        """
+        Returns the queue, latency and error statistics of each plugin's notifications
+        """
+        return {"plugins": self.bus.getStats()}
+
+
+class LazyPlugin(object):
+    """
+    A discovered plugin that is only imported and set up the first time it is used
+    A plugin that fails to load is not imported again until it changes and is rediscovered
+    """
+    def __init__(self, manager, directory, manifest, mtime):
+        """
+        Arguments:
+        manager -- the PluginManager that discovered the plugin
+        directory -- the name of the plugin's directory inside the plugins directory
+        manifest -- the plugin's manifest
+        mtime -- the modification time of the plugin's directory or manifest when it was discovered
+        """
+        self.manager = manager
+        self.directory = directory
+        self.manifest = manifest
+        self.mtime = mtime
+        self.name = manifest["name"]
+        self.instance = None
+        self.error = None
+        self.lock = threading.Lock()
+
+    def load(self):
+        """Imports and sets up the plugin if that has not happened yet, then returns it"""
+        with self.lock:
+            if self.error is not None:
+                raise Exception("Plugin '" + self.name + "' failed to load: " + self.error)
+            if self.instance is None:
+                try:
+                    instance = self.manager.importPlugin(self.directory, self.manifest)()
+                    if instance.getName() != self.name:
+                        raise Exception("Plugin name '" + instance.getName() + "' does not match manifest name '" + self.name + "'")
+                    instance.setup(self.manager.rooms, self.manager.events, self.manager.queue)
+                except Exception, e:
+                    print "Error loading plugin: " + str(e)
+                    self.error = str(e)
+                    raise
+                self.instance = instance
+            return self.instance
+
+    def isLoaded(self):
+        return self.instance is not None
+
+    def getName(self):
+        return self.name
+
+    def getPage(self, path):
+        return self.load().getPage(path)
+
+    def notify(self, ip, trigger):
+        return self.load().notify(ip, trigger)
+
+    def teardown(self):
+        with self.lock:
+            if self.instance is not None:
+                self.instance.teardown()
+                self.instance = None
 
 
 class Plugin(object):
@@ -0,0 +1,223 @@
+import time
+import threading
+
+"""
+Supervision of the threads polling the devices
+
+Every middle layer registers with the registry and reports the start and end of each poll. A poll to a device
+that hangs, e.g. inside a request without a timeout, never ends, so the watchdog checks the registry periodically
+and gives a poller whose poll has taken too long, or whose thread has died, a fresh thread. The hung thread is
+abandoned and exits when its call returns. A device that keeps stalling is quarantined: it is not polled
+until the quarantine is over, when it is given one more chance
+"""
+
+# Seconds a poll may take before its poller is considered stalled
+STALL_SECONDS = 60
+# A device whose poller is restarted this many times within RESTART_WINDOW seconds is quarantined
+MAX_RESTARTS = 3
+RESTART_WINDOW = 600
+# Seconds a quarantined device is not polled for
+QUARANTINE_SECONDS = 300
+# Seconds between two checks of the watchdog
+CHECK_INTERVAL = 10
+
+
+class PollerStatus(object):
+    """
+    What is known about the poller of one device
+    """
+    def __init__(self, layer):
+        """
+        Arguments:
+        layer -- the middle layer polling the device
+        """
+        self.layer = layer
+        # The address the poller is registered under, a layer may change its ip afterwards
+        self.key = layer.ip
+        self.thread = None
+        self.pollStarted = None
+        self.lastPoll = None
+        self.lastLatency = None
+        self.consecutiveFailures = 0
+        self.polls = 0
+        self.failures = 0
+        self.restarts = []
+        self.quarantinedAt = None
+
+    def started(self):
+        self.pollStarted = time.time()
+
+    def finished(self, succeeded):
+        """
+        Records the end of the poll in progress
+
+        Arguments:
+        succeeded -- whether the device answered
+        """
+        now = time.time()
+        if self.pollStarted is not None:
+            self.lastLatency = now - self.pollStarted
+        self.pollStarted = None
+        self.lastPoll = now
+        self.polls += 1
+        if succeeded:
+            self.consecutiveFailures = 0
+        else:
+            self.consecutiveFailures += 1
+            self.failures += 1
+
+    def isStalled(self, now, stallSeconds):
+        """
+        Returns whether the poller's thread has died or its poll has taken longer than stallSeconds
+
+        Arguments:
+        now -- the current time
+        stallSeconds -- how long a poll may take
+        """
+        if self.thread is not None and not self.thread.is_alive():
+            return True
+        return self.pollStarted is not None and now - self.pollStarted > stallSeconds
+
+    def toDict(self, now):
+        item = self.layer.item
+        return {
+            'ip': self.layer.ip,
+            'brand': item.brand if item is not None else None,
+            'thread': self.thread.name if self.thread is not None else None,
+            'alive': self.thread is not None and self.thread.is_alive(),
+            'polling': None if self.pollStarted is None else now - self.pollStarted,
+            'lastPoll': self.lastPoll,
+            'lastLatency': self.lastLatency,
+            'consecutiveFailures': self.consecutiveFailures,
+            'polls': self.polls,
+            'failures': self.failures,
+            'restarts': len(self.restarts),
+            'quarantined': self.quarantinedAt is not None
+        }
+
+
+class PollerRegistry(object):
+    """
+    The status of every device's poller, by the device's ip
+    """
+    def __init__(self):
+        self.pollers = {}
+        self.lock = threading.Lock()
+
+    def register(self, layer):
+        """
+        Adds a layer's poller, replacing any registered for the same ip, and returns its status
+
+        Arguments:
+        layer -- the middle layer
+        """
+        status = PollerStatus(layer)
+        with self.lock:
+            self.pollers[status.key] = status
+        return status
+
+    def unregister(self, layer):
+        """
+        Removes a layer's poller, looked up by the address it was registered under
+
+        Arguments:
+        layer -- the middle layer
+        """
+        with self.lock:
+            for key, status in self.pollers.items():
+                if status.layer is layer:
+                    del self.pollers[key]
+
+    def getPollers(self):
+        with self.lock:
+            return list(self.pollers.values())
+
+    def getStatus(self):
+        """Returns the status of every poller and the name of every thread running"""
+        now = time.time()
+        pollers = sorted(self.getPollers(), key=lambda status: status.layer.ip)
+        return {
+            'pollers': [status.toDict(now) for status in pollers],
+            'threads': sorted(thread.name for thread in threading.enumerate())
+        }
+
+
+class Watchdog(object):
+    """
+    Restarts stalled pollers and quarantines the devices whose pollers keep stalling
+    """
+    def __init__(self, registry, stallSeconds=STALL_SECONDS, maxRestarts=MAX_RESTARTS, quarantineSeconds=QUARANTINE_SECONDS):
+        """
+        Arguments:
+        registry -- the PollerRegistry to watch
+        stallSeconds -- how long a poll may take
+        maxRestarts -- restarts within RESTART_WINDOW after which the device is quarantined
+        quarantineSeconds -- how long a quarantined device is not polled for
+        """
+        self.registry = registry
+        self.stallSeconds = stallSeconds
+        self.maxRestarts = maxRestarts
+        self.quarantineSeconds = quarantineSeconds
+
+    def start(self, interval=CHECK_INTERVAL):
+        """
+        Starts checking the pollers every interval seconds
+
+        Arguments:
+        interval -- seconds between two checks
+        """
+        t = threading.Thread(name="Poller Watchdog", target=self.watch, args=[interval])
+        t.daemon = True
+        t.start()
+        return t
+
+    def watch(self, interval):
+        """Checks the pollers forever, run in a seperate thread"""
+        while True:
+            time.sleep(interval)
+            try:
+                self.check()
+            except Exception, e:
+                print "Error checking pollers: " + str(e)
+
+    def check(self, now=None):
+        """
+        Restarts or quarantines the stalled pollers and ends the quarantines that are over
+        Returns the (ip, action) of everything it did
+
+        Arguments:
+        now -- the current time
+        """
+        if now is None:
+            now = time.time()
+        done = []
+        for status in self.registry.getPollers():
+            ip = status.layer.ip
+            if status.quarantinedAt is not None:
+                if now - status.quarantinedAt >= self.quarantineSeconds:
+                    status.quarantinedAt = None
+                    self.restart(status, now)
+                    done.append((ip, 'released'))
+                continue
+            if not status.isStalled(now, self.stallSeconds):
+                continue
+            status.restarts = [restart for restart in status.restarts if now - restart < RESTART_WINDOW]
+            if len(status.restarts) >= self.maxRestarts:
+                print "Quarantining " + str(ip) + " after " + str(len(status.restarts)) + " restarts of its poller"
+                status.quarantinedAt = now
+                status.pollStarted = None
+                status.layer.stopPolling()
+                done.append((ip, 'quarantined'))
+            else:
+                print "Restarting the stalled poller of " + str(ip)
+                self.restart(status, now)
+                done.append((ip, 'restarted'))
+        return done
+
+    def restart(self, status, now):
+        status.restarts.append(now)
+        status.pollStarted = None
+        status.layer.startPolling()
+
+
+registry = PollerRegistry()
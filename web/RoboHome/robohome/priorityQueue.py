@@ -1,18 +1,25 @@
 from Queue import PriorityQueue
+import itertools
 
-priorities = {'open' : 1, 'close' : 0, 'getState' : 2, 'on' : 1, 'off' : 1, 'setBrightness' : 2, 'setTemperature' : 2}
+priorities = {'open' : 1, 'close' : 0, 'getState' : 2, 'on' : 1, 'off' : 1, 'setOpen' : 2, 'setBrightness' : 2, 'setTemperature' : 2}
 
 class MyPriorityQueue(PriorityQueue):
     """
     A class that defines a priority queue for method calls
     The highest priority is 0, lowest is 2
+    Methods with the same priority are returned in the order they were added
     """
-    def __init__(self):
+    def __init__(self, counter=None):
+        """
+        Arguments:
+        counter -- gives out the command ids, shared by the queues of a RoutedQueue so ids are unique across them
+        """
         PriorityQueue.__init__(self)
+        self.counter = counter if counter is not None else itertools.count(1)
 
     def put(self, roomId, itemId, method, args=[]):
         """
-        Adds an item to the queue
+        Adds an item to the queue and returns its command id
 
         Arguments:
         roomId -- id of the room
@@ -20,11 +27,118 @@ class MyPriorityQueue(PriorityQueue):
         method -- method to be called
         args -- arguments of the method, empty list by default
         """
-        PriorityQueue.put(self, (priorities[method], roomId, itemId, method, args))
+        commandId = next(self.counter)
+        PriorityQueue.put(self, (priorities[method], commandId, roomId, itemId, method, args))
+        return commandId
+
+    def putAll(self, commands):
+        """
+        Adds several items to the queue at once, so no other item is taken before all of them are queued
+        Returns the command ids in the same order
+
+        Arguments:
+        commands -- a list of (roomId, itemId, method, args) tuples
+        """
+        entries = [(priorities[method], roomId, itemId, method, args) for roomId, itemId, method, args in commands]
+        with self.mutex:
+            commandIds = [next(self.counter) for entry in entries]
+            self.putEntries(zip(commandIds, entries), False)
+        return commandIds
+
+    def putEntries(self, entries, lock=True):
+        """
+        Adds items that already have a command id to the queue at once
+
+        Arguments:
+        entries -- a list of (commandId, (priority, roomId, itemId, method, args))
+        lock -- whether the queue's mutex still has to be taken
+        """
+        if lock:
+            with self.mutex:
+                self.putEntries(entries, False)
+            return
+        for commandId, (priority, roomId, itemId, method, args) in entries:
+            self._put((priority, commandId, roomId, itemId, method, args))
+            self.unfinished_tasks += 1
+        self.not_empty.notify(len(entries))
 
     def get(self, *args, **kwargs):
         """
         Gets the item with highest priority from the queue
         """
-        _, roomId, itemId, method, args = PriorityQueue.get(self, *args, **kwargs)
-        return (roomId, itemId, method, args)
\ No newline at end of file
+        _, roomId, itemId, method, args = self.getWithId(*args, **kwargs)
+        return (roomId, itemId, method, args)
+
+    def getWithId(self, *args, **kwargs):
+        """
+        Gets the item with highest priority from the queue along with its command id
+        """
+        _, commandId, roomId, itemId, method, args = PriorityQueue.get(self, *args, **kwargs)
+        return (commandId, roomId, itemId, method, args)
+
+
+class RoutedQueue(object):
+    """
+    A MyPriorityQueue for each worker thread, with every command for an item routed to the same worker
+    Commands for one item are therefore executed one at a time in the order the queue returns them,
+    and a slow device only holds up the commands that share its worker
+    """
+    def __init__(self, workers):
+        """
+        Arguments:
+        workers -- the number of worker threads, each taking commands from its own queue
+        """
+        self.counter = itertools.count(1)
+        self.queues = [MyPriorityQueue(self.counter) for i in range(workers)]
+
+    def getQueueIndex(self, roomId, itemId):
+        return hash((roomId, itemId)) % len(self.queues)
+
+    def put(self, roomId, itemId, method, args=[]):
+        """
+        Adds an item to the queue of its worker and returns its command id
+
+        Arguments:
+        roomId -- id of the room
+        itemId -- id of the item
+        method -- method to be called
+        args -- arguments of the method, empty list by default
+        """
+        return self.queues[self.getQueueIndex(roomId, itemId)].put(roomId, itemId, method, args)
+
+    def putAll(self, commands):
+        """
+        Adds several items to the queues at once, so no worker takes any of them before all of them are queued
+        Returns the command ids in the same order
+
+        Arguments:
+        commands -- a list of (roomId, itemId, method, args) tuples
+        """
+        entries = [(priorities[method], roomId, itemId, method, args) for roomId, itemId, method, args in commands]
+        routes = [self.getQueueIndex(roomId, itemId) for roomId, itemId, method, args in commands]
+
+        # The mutexes are always taken in the order of the queues, so two batches cannot deadlock
+        indexes = sorted(set(routes))
+        for index in indexes:
+            self.queues[index].mutex.acquire()
+        try:
+            commandIds = [next(self.counter) for entry in entries]
+            for index in indexes:
+                queueEntries = [(commandId, entry) for commandId, entry, route in zip(commandIds, entries, routes) if route == index]
+                self.queues[index].putEntries(queueEntries, False)
+        finally:
+            for index in reversed(indexes):
+                self.queues[index].mutex.release()
+        return commandIds
+
+    def getWithId(self, worker, *args, **kwargs):
+        """
+        Gets the item with highest priority from a worker's queue along with its command id
+
+        Arguments:
+        worker -- the index of the worker
+        """
+        return self.queues[worker].getWithId(*args, **kwargs)
+
+    def qsize(self):
+        return sum(queue.qsize() for queue in self.queues)
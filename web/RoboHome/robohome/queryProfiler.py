@@ -0,0 +1,170 @@
+import re
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+"""
+Optional profiling of the statements run by DatabaseHelper
+
+Statements are normalised to their shape, e.g. SELECT * FROM items WHERE roomId=? for any room,
+so the time spent can be added up per shape. Queries slower than a threshold are logged, and a shape
+run many times within one request or scope is reported as a likely N+1 pattern
+"""
+
+# Entries kept of the slow query log and of the repeated query reports
+LOG_SIZE = 100
+# Thread names counted separately, the queries of threads beyond these are counted under OTHER_THREADS
+THREAD_NAMES = 100
+OTHER_THREADS = 'other'
+
+STRING = re.compile(r"'(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.|\"\")*\"")
+NUMBER = re.compile(r"(?<![\w.`])-?\d+(?:\.\d+)?(?![\w`])")
+VALUE_LIST = re.compile(r"\((?:\s*\?\s*,)+\s*\?\s*\)")
+WHITESPACE = re.compile(r"\s+")
+
+
+def normalize(query):
+    """
+    Returns the shape of a statement, with its literal values replaced by ?
+
+    Arguments:
+    query -- the SQL statement
+    """
+    shape = STRING.sub("?", query)
+    shape = NUMBER.sub("?", shape)
+    shape = VALUE_LIST.sub("(?)", shape)
+    shape = WHITESPACE.sub(" ", shape).strip()
+    return shape.rstrip(";").strip()
+
+
+class Scope(object):
+    """
+    The queries run by one request or one piece of background work
+    """
+    def __init__(self, name):
+        self.name = name
+        self.started = time.time()
+        self.queries = 0
+        self.seconds = 0.0
+        self.shapes = {}
+
+    def record(self, shape, seconds):
+        self.queries += 1
+        self.seconds += seconds
+        counts = self.shapes.get(shape)
+        if counts is None:
+            counts = self.shapes[shape] = [0, 0.0]
+        counts[0] += 1
+        counts[1] += seconds
+
+
+class QueryProfiler(object):
+    """
+    Adds up the time spent on each statement shape, logs slow queries and reports shapes repeated within a scope
+    """
+    def __init__(self, slowSeconds=0.1, repeatThreshold=5, threadNames=THREAD_NAMES):
+        """
+        Arguments:
+        slowSeconds -- queries taking at least this long are logged
+        repeatThreshold -- a shape run this many times in one scope is reported as repeated
+        threadNames -- the number of thread names whose queries are counted separately
+        """
+        self.slowSeconds = slowSeconds
+        self.repeatThreshold = repeatThreshold
+        self.threadNames = threadNames
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.shapes = {}
+        self.threads = {}
+        self.slow = deque(maxlen=LOG_SIZE)
+        self.repeated = deque(maxlen=LOG_SIZE)
+
+    def begin(self, name):
+        """
+        Starts a scope on the current thread, queries are counted against the innermost one
+
+        Arguments:
+        name -- what the scope is, e.g. the route of a request
+        """
+        scopes = getattr(self.local, 'scopes', None)
+        if scopes is None:
+            scopes = self.local.scopes = []
+        scope = Scope(name)
+        scopes.append(scope)
+        return scope
+
+    def end(self):
+        """Ends the innermost scope of the current thread, reporting the shapes it repeated, and returns it"""
+        scopes = getattr(self.local, 'scopes', None)
+        if not scopes:
+            return None
+        scope = scopes.pop()
+        for shape, (count, seconds) in scope.shapes.items():
+            if count >= self.repeatThreshold:
+                print "Repeated query in %s, %d times taking %.3fs: %s" % (scope.name, count, seconds, shape)
+                with self.lock:
+                    self.repeated.append({'scope': scope.name, 'time': scope.started, 'shape': shape, 'count': count, 'seconds': seconds})
+        return scope
+
+    @contextmanager
+    def scope(self, name):
+        """
+        Runs the body of a with statement in its own scope, e.g. for background work
+
+        Arguments:
+        name -- what the scope is
+        """
+        self.begin(name)
+        try:
+            yield
+        finally:
+            self.end()
+
+    def record(self, query, seconds):
+        """
+        Records a query run by DatabaseHelper
+
+        Arguments:
+        query -- the SQL statement
+        seconds -- how long it took
+        """
+        shape = normalize(query)
+        scopes = getattr(self.local, 'scopes', None)
+        if scopes:
+            scope = scopes[-1]
+            scope.record(shape, seconds)
+            scopeName = scope.name
+        else:
+            scopeName = threading.current_thread().name
+        with self.lock:
+            counts = self.shapes.get(shape)
+            if counts is None:
+                counts = self.shapes[shape] = [0, 0.0, 0.0]
+            counts[0] += 1
+            counts[1] += seconds
+            counts[2] = max(counts[2], seconds)
+            thread = threading.current_thread().name
+            if thread not in self.threads and len(self.threads) >= self.threadNames:
+                thread = OTHER_THREADS
+            self.threads[thread] = self.threads.get(thread, 0) + 1
+            if seconds >= self.slowSeconds:
+                self.slow.append({'scope': scopeName, 'time': time.time(), 'seconds': seconds, 'query': query})
+        if seconds >= self.slowSeconds:
+            print "Slow query in %s taking %.3fs: %s" % (scopeName, seconds, query)
+
+    def getStats(self, limit=20):
+        """
+        Returns the shapes that took longest in total, the queries run by each thread, the slow query log and the repeated query reports
+
+        Arguments:
+        limit -- the number of shapes to return
+        """
+        with self.lock:
+            shapes = sorted(self.shapes.items(), key=lambda entry: entry[1][1], reverse=True)[:limit]
+            return {
+                'shapes': [{'shape': shape, 'count': count, 'seconds': seconds, 'max': maximum} for shape, (count, seconds, maximum) in shapes],
+                'threads': dict(self.threads),
+                'slow': list(self.slow),
+                'repeated': list(self.repeated)
+            }
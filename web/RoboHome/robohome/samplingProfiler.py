@@ -0,0 +1,184 @@
+import os
+import sys
+import time
+import threading
+
+"""
+A sampling profiler for finding where the server spends its time while it is running, without attaching anything to it
+
+A background thread reads the stack of every other thread with sys._current_frames() at a fixed interval,
+so the cost does not depend on how busy the profiled code is. Stacks are counted in the collapsed format
+read by flamegraph.pl and speedscope, one line per stack, e.g.
+Poller 10.0.0.5;checkForStateChange (middleLayers.py:103);checkState (middleLayers.py:181) 12
+"""
+
+# Innermost frames of threads that are blocked waiting rather than running, left out unless idle stacks are asked for
+IDLE_FRAMES = set([
+    ('threading.py', 'wait'),
+    ('threading.py', 'join'),
+    ('Queue.py', 'get'),
+    ('socket.py', 'accept'),
+    ('socket.py', 'readline'),
+    ('socket.py', 'read'),
+    ('SocketServer.py', 'serve_forever'),
+    ('SocketServer.py', '_eintr_retry')
+])
+
+
+def frameName(frame):
+    code = frame.f_code
+    return "%s (%s:%d)" % (code.co_name, os.path.basename(code.co_filename), code.co_firstlineno)
+
+
+def isIdle(frame):
+    code = frame.f_code
+    return (os.path.basename(code.co_filename), code.co_name) in IDLE_FRAMES
+
+
+def collapse(threadName, frame):
+    """
+    Returns the stack of a frame as one line, from the thread down to the frame, with ; between the frames
+
+    Arguments:
+    threadName -- the name of the thread, used as the root of the stack
+    frame -- the innermost frame
+    """
+    names = []
+    while frame is not None:
+        names.append(frameName(frame).replace(';', ':'))
+        frame = frame.f_back
+    names.append(threadName.replace(';', ':'))
+    names.reverse()
+    return ';'.join(names)
+
+
+class Profile(object):
+    """
+    The stacks sampled by one run of the profiler and how many times each was seen
+    """
+    def __init__(self, seconds, interval, idle):
+        """
+        Arguments:
+        seconds -- how long the profiler is to run for
+        interval -- seconds between samples
+        idle -- whether stacks of blocked threads are counted
+        """
+        self.seconds = seconds
+        self.interval = interval
+        self.idle = idle
+        self.started = time.time()
+        self.finished = None
+        self.samples = 0
+        self.stacks = {}
+        self.threads = {}
+        # Held while sampling, so the counts are not read while they change
+        self.lock = threading.Lock()
+
+    def sample(self, frames, names, exclude=()):
+        """
+        Counts the current stack of every thread
+
+        Arguments:
+        frames -- the innermost frame of each thread by ident, as returned by sys._current_frames()
+        names -- the name of each thread by ident
+        exclude -- idents of threads not to count, e.g. the profiler's own
+        """
+        counted = []
+        for ident, frame in frames.items():
+            if ident in exclude:
+                continue
+            if not self.idle and isIdle(frame):
+                continue
+            threadName = names.get(ident, "Thread " + str(ident))
+            counted.append((threadName, collapse(threadName, frame)))
+        with self.lock:
+            self.samples += 1
+            for threadName, stack in counted:
+                self.stacks[stack] = self.stacks.get(stack, 0) + 1
+                self.threads[threadName] = self.threads.get(threadName, 0) + 1
+
+    def copy(self):
+        """Returns the number of samples and copies of the stack and thread counts"""
+        with self.lock:
+            return self.samples, dict(self.stacks), dict(self.threads)
+
+    def collapsed(self):
+        """Returns the stacks in the collapsed format, most frequent first"""
+        samples, stacks, threads = self.copy()
+        stacks = sorted(stacks.items(), key=lambda entry: entry[1], reverse=True)
+        return ''.join("%s %d\n" % (stack, count) for stack, count in stacks)
+
+    def toDict(self, limit=50):
+        """
+        Returns a summary of the profile with its most frequent stacks
+
+        Arguments:
+        limit -- the number of stacks to return
+        """
+        samples, stacks, threads = self.copy()
+        stacks = sorted(stacks.items(), key=lambda entry: entry[1], reverse=True)[:limit]
+        return {
+            'started': self.started,
+            'finished': self.finished,
+            'interval': self.interval,
+            'samples': samples,
+            'threads': threads,
+            'stacks': [{'stack': stack, 'count': count} for stack, count in stacks]
+        }
+
+
+class SamplingProfiler(object):
+    """
+    Runs one profile at a time on a background thread and keeps the last one
+    """
+    def __init__(self, sleep=time.sleep):
+        """
+        Arguments:
+        sleep -- waits between samples
+        """
+        self.sleep = sleep
+        self.lock = threading.Lock()
+        self.profile = None
+        self.running = False
+
+    def start(self, seconds, interval, idle=False):
+        """
+        Starts profiling every thread for a number of seconds, returns False if a profile is already running
+
+        Arguments:
+        seconds -- how long to profile for
+        interval -- seconds between samples
+        idle -- whether stacks of blocked threads are counted
+        """
+        with self.lock:
+            if self.running:
+                return False
+            self.running = True
+            self.profile = Profile(seconds, interval, idle)
+        t = threading.Thread(name="Sampling Profiler", target=self.run, args=[self.profile])
+        t.daemon = True
+        t.start()
+        return True
+
+    def run(self, profile):
+        """Samples the threads until the profile's time is up, run in a seperate thread"""
+        try:
+            exclude = (threading.current_thread().ident,)
+            deadline = profile.started + profile.seconds
+            while True:
+                names = dict((thread.ident, thread.name) for thread in threading.enumerate())
+                profile.sample(sys._current_frames(), names, exclude)
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                self.sleep(min(profile.interval, remaining))
+        except Exception, e:
+            print "Error sampling threads: " + str(e)
+        finally:
+            profile.finished = time.time()
+            with self.lock:
+                self.running = False
+
+    def getProfile(self):
+        """Returns the running or last profile, or None if none has been started"""
+        return self.profile
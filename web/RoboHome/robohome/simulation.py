@@ -0,0 +1,234 @@
+import heapq
+import itertools
+import random
+import time
+import middleLayers as Layers
+from stateFilter import StateFilter
+import spans
+
+"""
+Simulates houses of mock items on a single virtual clock instead of a polling thread per item,
+so a large house can be run faster than real time
+
+Once a Simulation is installed, items of brand 'mock' get a VirtualLayer, e.g.
+simulation = Simulation(seed=1)
+simulation.install()
+house = House(database)
+simulation.stochastic(ip, 60)
+simulation.run(3600)
+"""
+
+
+class ScheduledCall(object):
+    """
+    A callback waiting on a VirtualClock, which can be cancelled before it is due
+    """
+    def __init__(self, due, callback, args):
+        self.due = due
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class VirtualClock(object):
+    """
+    A clock that only moves when the calls scheduled on it are run, in the order they are due
+    """
+    def __init__(self, start=None):
+        """
+        Arguments:
+        start -- the time the clock starts at, the current wall clock time by default
+        """
+        if start is None:
+            start = time.time()
+        self.now = start
+        self.queue = []
+        self.sequence = itertools.count()
+        self.processed = 0
+
+    def time(self):
+        return self.now
+
+    def schedule(self, delay, callback, *args):
+        """
+        Calls callback with args once the clock has moved on by delay, and returns the ScheduledCall
+
+        Arguments:
+        delay -- seconds from now
+        callback -- the function to call
+        args -- its arguments
+        """
+        return self.scheduleAt(self.now + max(delay, 0), callback, *args)
+
+    def scheduleAt(self, due, callback, *args):
+        """
+        Calls callback with args once the clock reaches due, and returns the ScheduledCall
+
+        Arguments:
+        due -- the time to call it at
+        callback -- the function to call
+        args -- its arguments
+        """
+        call = ScheduledCall(max(due, self.now), callback, args)
+        heapq.heappush(self.queue, (call.due, next(self.sequence), call))
+        return call
+
+    def pending(self):
+        return sum(1 for due, sequence, call in self.queue if not call.cancelled)
+
+    def run(self, until=None):
+        """
+        Runs the scheduled calls in order, including those they schedule, and returns how many were run
+
+        Arguments:
+        until -- stop once the next call is due after this time and move the clock to it, None to run until nothing is left
+        """
+        count = 0
+        while self.queue and (until is None or self.queue[0][0] <= until):
+            due, sequence, call = heapq.heappop(self.queue)
+            if call.cancelled:
+                continue
+            self.now = due
+            call.callback(*call.args)
+            count += 1
+        if until is not None and until > self.now:
+            self.now = until
+        self.processed += count
+        return count
+
+
+class VirtualLayer(Layers.MockLayer):
+    """
+    A MockLayer without a polling thread, whose state changes are delivered to its item on the simulation's clock
+    """
+    def __init__(self, clock, ip, item):
+        """
+        Arguments:
+        clock -- the VirtualClock shared by the simulation
+        ip -- the address of the item
+        item -- the item
+        """
+        self.state = 1
+        self.mockState = 1
+        self.clock = clock
+        self.ip = ip
+        self.item = item
+        self.changes = 0
+        current = item.stateFilter
+        item.stateFilter = StateFilter(item.notifyListener, current.debounce, current.minDwell, current.hysteresis, clock)
+
+    @spans.traced('send', lambda self, command, *args: {'ip': self.ip, 'command': command})
+    def send(self, command, *args):
+        """
+        Runs a command and delivers the resulting state change, if any, once the current call on the clock has finished
+
+        Arguments:
+        command -- the name of the command method
+        args -- arguments of the command
+        """
+        result = getattr(self, command)(*args)
+        self.applyMockState()
+        return result
+
+    def inject(self, state):
+        """
+        Changes the device's state as if it had been read from the real device
+
+        Arguments:
+        state -- the new state
+        """
+        self.mockState = state
+        self.applyMockState()
+
+    def applyMockState(self):
+        if self.mockState != self.state:
+            self.state = self.mockState
+            self.changes += 1
+            self.notifyStateChanged(self.state)
+
+    def notifyStateChanged(self, state):
+        self.clock.schedule(0, spans.tracer.wrap(self.item.stateChanged), state)
+
+
+class Simulation(object):
+    """
+    Drives the VirtualLayers of mock items with scripted or random state changes
+    """
+    def __init__(self, seed=None, clock=None):
+        """
+        Arguments:
+        seed -- seed for the random state changes, so runs are repeatable
+        clock -- the VirtualClock to use, a new one by default
+        """
+        self.clock = clock or VirtualClock()
+        self.rng = random.Random(seed)
+        self.layers = {}
+        self.replaced = {}
+
+    def install(self, brands=('mock',)):
+        """
+        Makes items of the given brands created from now on use a VirtualLayer on this simulation's clock
+
+        Arguments:
+        brands -- the brands to simulate, e.g. every key of middleLayers.brands to keep a house off the real devices
+        """
+        for brand in brands:
+            if brand not in self.replaced:
+                self.replaced[brand] = Layers.brands[brand]
+                Layers.brands[brand] = self.createLayer
+
+    def uninstall(self):
+        """Goes back to the layers used before install"""
+        for brand, layer in self.replaced.items():
+            Layers.brands[brand] = layer
+        self.replaced = {}
+
+    def createLayer(self, ip, item):
+        layer = VirtualLayer(self.clock, ip, item)
+        self.layers[ip] = layer
+        return layer
+
+    def script(self, ip, changes):
+        """
+        Schedules the state changes of an item
+
+        Arguments:
+        ip -- the address of the item
+        changes -- (seconds from now, state) pairs
+        """
+        layer = self.layers[ip]
+        for delay, state in changes:
+            self.clock.schedule(delay, layer.inject, state)
+
+    def stochastic(self, ip, meanInterval, states=None):
+        """
+        Changes the state of an item at random, with exponentially distributed intervals between changes
+
+        Arguments:
+        ip -- the address of the item
+        meanInterval -- mean seconds between two changes
+        states -- the states to pick from, the named states of the item's type by default
+        """
+        layer = self.layers[ip]
+        if states is None:
+            import staticData
+            states = sorted(staticData.stateNames[layer.item._type])
+        if len(states) < 2:
+            raise Exception("Item " + ip + " needs at least two states to change between")
+
+        def change():
+            layer.inject(self.rng.choice([state for state in states if state != layer.state]))
+            self.clock.schedule(self.rng.expovariate(1.0 / meanInterval), change)
+        self.clock.schedule(self.rng.expovariate(1.0 / meanInterval), change)
+
+    def run(self, duration):
+        """
+        Runs the simulation for duration virtual seconds and returns the number of calls run
+
+        Arguments:
+        duration -- seconds of virtual time
+        """
+        return self.clock.run(self.clock.now + duration)
@@ -0,0 +1,251 @@
+import json
+import time
+import random
+import threading
+from collections import deque, OrderedDict
+from contextlib import contextmanager
+from functools import wraps
+
+"""
+Lightweight span tracing of a state change, from the poll that saw it to the commands its rules sent
+
+A state change is handled by several threads in turn: the poller, the thread notifying the item,
+the state filter's timer and the rule engine. Each span carries the id of the trace it belongs to,
+the current span of a thread is kept thread local and wrap() carries it over to work handed to another thread, e.g.
+threading.Thread(target=spans.tracer.wrap(item.stateChanged), args=[state])
+"""
+
+# Finished spans kept in memory for the /debug/traces/ route
+BUFFER_SIZE = 2000
+
+
+def newId():
+    return '%016x' % random.getrandbits(64)
+
+
+class Span(object):
+    """
+    One timed step of a trace
+    """
+    def __init__(self, name, traceId, parentId, start, attributes, previous):
+        """
+        Arguments:
+        name -- what the step is, e.g. reactToEvent
+        traceId -- the correlation id shared by every span of the trace
+        parentId -- the id of the span that caused this one, None for the first span of a trace
+        start -- when the step started
+        attributes -- a dictionary describing the step, e.g. the ip of the item
+        previous -- the span that was current on the thread before this one began
+        """
+        self.name = name
+        self.traceId = traceId
+        self.spanId = newId()
+        self.parentId = parentId
+        self.start = start
+        self.end = None
+        self.attributes = attributes
+        self.previous = previous
+
+    def toDict(self):
+        return {
+            'name': self.name,
+            'traceId': self.traceId,
+            'spanId': self.spanId,
+            'parentId': self.parentId,
+            'start': self.start,
+            'seconds': None if self.end is None else self.end - self.start,
+            'attributes': self.attributes
+        }
+
+
+class Tracer(object):
+    """
+    Records finished spans in a ring buffer, optionally appending each one to a file as a line of JSON
+    """
+    def __init__(self, size=BUFFER_SIZE):
+        """
+        Arguments:
+        size -- the number of finished spans kept in memory
+        """
+        self.enabled = True
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.spans = deque(maxlen=size)
+        self.exportFile = None
+
+    def current(self):
+        """Returns the current span of this thread, or None"""
+        return getattr(self.local, 'span', None)
+
+    def begin(self, name, start=None, **attributes):
+        """
+        Starts a span as a child of the current one, or as the first span of a new trace, and makes it current
+        Returns None when tracing is disabled
+
+        Arguments:
+        name -- what the step is
+        start -- when the step started, if it was before this call e.g. the start of a poll
+        attributes -- describe the step
+        """
+        if not self.enabled:
+            return None
+        parent = self.current()
+        if parent is None:
+            traceId, parentId = newId(), None
+        else:
+            traceId, parentId = parent.traceId, parent.spanId
+        span = Span(name, traceId, parentId, time.time() if start is None else start, attributes, parent)
+        self.local.span = span
+        return span
+
+    def finish(self, span, error=None):
+        """
+        Ends a span started by begin, records it and makes the span before it current again
+
+        Arguments:
+        span -- the span, may be None if tracing was disabled when it began
+        error -- the exception that ended the step, if any
+        """
+        if span is None:
+            return
+        span.end = time.time()
+        if error is not None:
+            span.attributes['error'] = str(error)
+        if self.current() is span:
+            self.local.span = span.previous
+        span.previous = None
+        with self.lock:
+            self.spans.append(span)
+            if self.exportFile is not None:
+                try:
+                    self.exportFile.write(json.dumps(span.toDict()) + '\n')
+                except Exception, e:
+                    print "Error exporting span: " + str(e)
+
+    @contextmanager
+    def span(self, name, **attributes):
+        """
+        Runs the body of a with statement in a span
+
+        Arguments:
+        name -- what the step is
+        attributes -- describe the step
+        """
+        span = self.begin(name, **attributes)
+        try:
+            yield span
+        except Exception, e:
+            self.finish(span, e)
+            raise
+        self.finish(span)
+
+    def traced(self, name, describe=None):
+        """
+        Returns a decorator running every call of a function in a span
+
+        Arguments:
+        name -- what the step is
+        describe -- called with the function's arguments, returns the attributes of the span
+        """
+        def decorator(function):
+            @wraps(function)
+            def call(*args, **kwargs):
+                if not self.enabled:
+                    return function(*args, **kwargs)
+                attributes = describe(*args, **kwargs) if describe is not None else {}
+                span = self.begin(name, **attributes)
+                try:
+                    result = function(*args, **kwargs)
+                except Exception, e:
+                    self.finish(span, e)
+                    raise
+                self.finish(span)
+                return result
+            return call
+        return decorator
+
+    def wrap(self, function):
+        """
+        Returns a function that runs the given one with the current span of this thread, to carry the trace to another thread
+
+        Arguments:
+        function -- the work handed to the other thread
+        """
+        parent = self.current()
+        if parent is None:
+            return function
+
+        def run(*args, **kwargs):
+            previous = self.current()
+            self.local.span = parent
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.local.span = previous
+        return run
+
+    def export(self, path):
+        """
+        Appends every span finished from now on to a file, as one line of JSON each
+
+        Arguments:
+        path -- the file, None to stop exporting
+        """
+        with self.lock:
+            if self.exportFile is not None:
+                self.exportFile.close()
+                self.exportFile = None
+            if path is not None:
+                self.exportFile = open(path, 'a', 1)
+
+    def getTraces(self, limit=20):
+        """
+        Returns the most recent traces, newest first, each with its spans in the order they started
+
+        Arguments:
+        limit -- the number of traces to return
+        """
+        with self.lock:
+            spans = list(self.spans)
+        traces = OrderedDict()
+        for span in reversed(spans):
+            if span.traceId not in traces:
+                if len(traces) == limit:
+                    continue
+                traces[span.traceId] = []
+            traces[span.traceId].append(span)
+        return [self.summarize(traceId, traceSpans) for traceId, traceSpans in traces.items()]
+
+    def getTrace(self, traceId):
+        """
+        Returns the trace with the given id, or None if none of its spans are still in memory
+
+        Arguments:
+        traceId -- the correlation id
+        """
+        with self.lock:
+            spans = [span for span in self.spans if span.traceId == traceId]
+        if not spans:
+            return None
+        return self.summarize(traceId, spans)
+
+    def summarize(self, traceId, spans):
+        spans = sorted(spans, key=lambda span: span.start)
+        start = spans[0].start
+        return {
+            'traceId': traceId,
+            'start': start,
+            'seconds': max(span.end for span in spans) - start,
+            'spans': [span.toDict() for span in spans]
+        }
+
+    def clear(self):
+        with self.lock:
+            self.spans.clear()
+
+
+tracer = Tracer()
+
+
+def traced(name, describe=None):
+    return tracer.traced(name, describe)
@@ -0,0 +1,119 @@
+import time
+import threading
+import spans
+
+
+class StateFilter(object):
+    """
+    Filters the state changes reported by a noisy item before they reach the rule engine
+    A new state is only reported once it has been held for the debounce window,
+    and no state is reported until the previous one has been held for the minimum dwell time
+    """
+    def __init__(self, callback, debounce=0, minDwell=0, hysteresis=None, clock=None):
+        """
+        Arguments:
+        callback -- called with the new state once a change is accepted
+        debounce -- seconds a new state must be held before it is reported
+        minDwell -- minimum seconds between two reported changes
+        hysteresis -- (low, high) band used by threshold to turn readings into states, None for a plain threshold
+        clock -- a simulation.VirtualClock to use instead of wall clock time and timer threads
+        """
+        self.callback = callback
+        self.debounce = debounce
+        self.minDwell = minDwell
+        self.hysteresis = hysteresis
+        self.clock = clock
+        self.reported = None
+        self.reportedAt = None
+        self.pending = None
+        self.timer = None
+        self.generation = 0
+        self.suppressed = 0
+        self.lock = threading.Lock()
+
+    def update(self, state):
+        """
+        Takes a state read from the device, reporting it now or once it has settled
+
+        Arguments:
+        state -- the new state of the item
+        """
+        with self.lock:
+            if self.timer is not None:
+                if state == self.pending:
+                    return
+                # The state flipped again before the previous one settled
+                self.timer.cancel()
+                self.timer = None
+                self.suppressed += 1
+            self.pending = state
+            self.generation += 1
+            if state == self.reported:
+                return
+            delay = self.debounce
+            if self.reportedAt is not None:
+                delay = max(delay, self.reportedAt + self.minDwell - self.now())
+            if delay > 0:
+                self.timer = self.startTimer(delay)
+                return
+            self.reported = state
+            self.reportedAt = self.now()
+        self.callback(state)
+
+    def flush(self, generation):
+        """
+        Reports the pending state once its timer expires, unless a newer state has replaced it
+
+        Arguments:
+        generation -- the generation the timer was started for
+        """
+        with self.lock:
+            if generation != self.generation:
+                return
+            self.timer = None
+            state = self.pending
+            if state == self.reported:
+                return
+            self.reported = state
+            self.reportedAt = self.now()
+        self.callback(state)
+
+    def now(self):
+        if self.clock is None:
+            return time.time()
+        return self.clock.time()
+
+    def startTimer(self, delay):
+        """
+        Schedules flush for the current generation and returns a handle that can be cancelled
+
+        Arguments:
+        delay -- seconds until the flush
+        """
+        # The flush continues the trace of the change that started the timer
+        flush = spans.tracer.wrap(self.flush)
+        if self.clock is not None:
+            return self.clock.schedule(delay, flush, self.generation)
+        timer = threading.Timer(delay, flush, [self.generation])
+        timer.daemon = True
+        timer.start()
+        return timer
+
+    def threshold(self, value, current, limit):
+        """
+        Turns a numeric reading into an on/off state, keeping the current state while inside the hysteresis band
+
+        Arguments:
+        value -- the reading
+        current -- the current state
+        limit -- the threshold used when no hysteresis band is set
+        """
+        if self.hysteresis is None:
+            low, high = limit, limit
+        else:
+            low, high = self.hysteresis
+        if value > high:
+            return 1
+        if value <= low:
+            return 0
+        return current
@@ -15,4 +15,33 @@ states = {'motionSensor' : [{'id' : 1, 'name' : 'motion detected'}, {'id' : 0, '
 
 supportedBrands = {'motionSensor' : ['mock', 'arduino'] , 'lightSensor' : ['mock', 'gadgeteer'], 'temperatureSensor' : ['mock', 'arduino'] , 'energyMonitor' : ['mock', 'arduino'] , 'button' : ['mock', 'arduino', 'gadgeteer'] , 'door' : ['mock', 'arduino'], 'window' : ['mock', 'arduino'], 'curtain' : ['mock', 'arduino'], 'plug' : ['mock', 'wemo'], 'light' : ['mock', 'lightwaveRF'], 'radiator' : ['mock']}
 
-passive = {item.Item : True, item.Openable : False, item.OnOff : False, item.Lights : False, item.RadiatorValve : False}
\ No newline at end of file
+# Bounds in seconds on how often each type is polled, as (minimum, maximum)
+# Devices are polled at the minimum after a state change or command and back off towards the maximum while idle
+# Sensors whose changes trigger rules are never polled less often than every 2 seconds, so a trigger or a short press is not missed
+pollIntervals = {'motionSensor' : (1, 2), 'lightSensor' : (2, 60), 'temperatureSensor' : (10, 300), 'energyMonitor' : (5, 60), 'button' : (1, 2), 'door' : (1, 2), 'window' : (1, 2), 'curtain' : (2, 60), 'plug' : (2, 60), 'light' : (2, 60), 'radiator' : (30, 600)}
+
+# Debounce and minimum dwell in seconds, and hysteresis bands, applied to state changes before rules are evaluated
+stateFilters = {'motionSensor' : {'debounce' : 0.5, 'minDwell' : 5}, 'lightSensor' : {'debounce' : 2}, 'energyMonitor' : {'debounce' : 5, 'hysteresis' : (250, 350)}, 'button' : {'debounce' : 0.1}}
+
+passive = {item.Item : True, item.Openable : False, item.OnOff : False, item.Lights : False, item.RadiatorValve : False}
+
+
+class FrozenDict(dict):
+    """
+    A dict that cannot be changed after it is created
+    """
+    def readOnly(self, *args, **kwargs):
+        raise TypeError("staticData lookup tables are read only")
+
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = readOnly
+
+
+# Lookup tables built once from the data above, so converting between state ids, names and methods is a single dict lookup
+# stateNames -- type -> {state id : state name}
+# stateIds -- type -> {state name : state id}
+# methodStates -- type -> {method : id of the state it leaves the item in}
+# typeInfo -- type -> the metadata returned by the version API, except for the methods
+stateNames = FrozenDict((_type, FrozenDict((state['id'], state['name']) for state in typeStates if 'name' in state)) for _type, typeStates in states.items())
+stateIds = FrozenDict((_type, FrozenDict((state['name'], state['id']) for state in typeStates if 'name' in state)) for _type, typeStates in states.items())
+methodStates = FrozenDict((_type, FrozenDict((state['method'], state['id']) for state in typeStates if 'method' in state)) for _type, typeStates in states.items())
+typeInfo = FrozenDict((_type, FrozenDict({'name' : typesNice[_type], 'isPassive' : passive[types[_type]], 'supportedBrands' : supportedBrands[_type], 'states' : states[_type]})) for _type in types)
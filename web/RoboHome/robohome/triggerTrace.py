@@ -0,0 +1,146 @@
+import json
+import threading
+import time
+
+"""
+Records every trigger a house reacts to, with the actions it performed, so the workload can be replayed later
+
+A trace is a file of JSON lines, one [time, ip, trigger, [[ip, method], ...]] per trigger, only ever appended to
+"""
+
+
+class TraceRecorder(object):
+    """
+    Appends the triggers a house reacts to and the actions they set off to a trace file
+    """
+    def __init__(self, path, clock=time):
+        """
+        Arguments:
+        path -- the trace file, created if it does not exist
+        clock -- what the times are read from, e.g. a simulation.VirtualClock, wall clock time by default
+        """
+        self.path = path
+        self.clock = clock
+        self.file = open(path, 'a')
+        self.lock = threading.Lock()
+        self.recorded = 0
+
+    def attach(self, house):
+        """
+        Records the triggers the house's items notify from now on
+
+        Arguments:
+        house -- the house to record
+        """
+        def react(ip, trigger):
+            self.react(house.reactToEvent, ip, trigger)
+        house.listenerManager.replaceListener(house.reactToEvent, react)
+
+    def react(self, reactToEvent, ip, trigger):
+        """
+        Reacts to a trigger and records it with the actions performed
+
+        Arguments:
+        reactToEvent -- the house's reactToEvent
+        ip -- the IP address of the item that sent the trigger
+        trigger -- the name of the trigger
+        """
+        notified = self.clock.time()
+        performed = []
+        try:
+            performed = reactToEvent(ip, trigger)
+            return performed
+        finally:
+            self.record(notified, ip, trigger, performed)
+
+    def record(self, notified, ip, trigger, performed):
+        """
+        Appends one trigger to the trace
+
+        Arguments:
+        notified -- the time the trigger was notified
+        ip -- the IP address of the item that sent the trigger
+        trigger -- the name of the trigger
+        performed -- the (ip, method) of the actions it set off
+        """
+        line = json.dumps([round(notified, 3), ip, trigger, [list(action) for action in performed]], separators=(',', ':'))
+        with self.lock:
+            self.file.write(line + "\n")
+            self.file.flush()
+            self.recorded += 1
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+def readTrace(path):
+    """
+    Returns the (time, ip, trigger, actions) records of a trace file, with actions as (ip, method) tuples
+
+    Arguments:
+    path -- the trace file
+    """
+    records = []
+    with open(path) as f:
+        for number, line in enumerate(f):
+            if not line.strip():
+                continue
+            try:
+                notified, ip, trigger, performed = json.loads(line)
+            except ValueError:
+                # The last line of a trace that is still being written may be incomplete
+                print "Error reading line " + str(number + 1) + " of trace " + path
+                continue
+            records.append((notified, ip, trigger, [tuple(action) for action in performed]))
+    return records
+
+
+def replay(house, records, speed=None, sleep=time.sleep):
+    """
+    Feeds recorded triggers into a house and returns (time, ip, trigger, recorded actions, replayed actions, seconds) for each,
+    with replayed actions None if the house failed to react
+
+    Before each trigger the item that sent it is put in the state the trigger names, so conditions see the states they saw when recorded.
+    Items should not notify the house themselves, or their state changes would be reacted to on top of the trace
+
+    Arguments:
+    house -- the house to replay into, usually a fresh one built from the same rules
+    records -- the records read from a trace
+    speed -- 1 to replay at recorded speed, 10 for ten times faster, None for as fast as possible
+    sleep -- called with the seconds to wait between triggers
+    """
+    import staticData
+    results = []
+    start = time.time()
+    first = None
+    for notified, ip, trigger, recorded in records:
+        if first is None:
+            first = notified
+        if speed:
+            wait = (notified - first) / speed - (time.time() - start)
+            if wait > 0:
+                sleep(wait)
+        reactStart = time.time()
+        try:
+            item = house.getItemByIP(ip)
+            state = staticData.stateIds[item._type].get(trigger)
+            if state is not None:
+                item.middleLayer.state = item.middleLayer.mockState = state
+            reactStart = time.time()
+            performed = house.reactToEvent(ip, trigger)
+        except Exception, e:
+            print "Error replaying " + trigger + " from " + ip + ": " + str(e)
+            performed = None
+        results.append((notified, ip, trigger, recorded, performed, time.time() - reactStart))
+    return results
+
+
+def compare(results):
+    """
+    Returns the replayed triggers whose actions differ from the recorded ones, including those that failed
+
+    Arguments:
+    results -- as returned by replay
+    """
+    return [result for result in results if result[4] is None or sorted(result[3]) != sorted(result[4])]
@@ -0,0 +1,169 @@
+import unittest
+from benchmarks.memoryDatabase import MemoryDatabase
+from benchmarks.timing import percentile, summarise
+from benchmarks import ruleEngine, restApi, deviceFleet
+from robohome.houseSystem import House
+from robohome.lightwaveRF import LightwaveTransport
+from robohome import wemo
+from robohome import middleLayers
+import requests
+import threading
+import json
+
+
+class TestTiming(unittest.TestCase):
+
+    def test_percentile(self):
+        latencies = range(1, 101)
+        self.assertEqual(percentile(latencies, 50), 50)
+        self.assertEqual(percentile(latencies, 99), 99)
+        self.assertEqual(percentile(latencies, 100), 100)
+        self.assertEqual(percentile([], 50), None)
+
+    def test_summarise(self):
+        summary = summarise([0.002, 0.001, 0.003], 0.5)
+        self.assertEqual(summary['count'], 3)
+        self.assertEqual(summary['throughput'], 6)
+        self.assertEqual(summary['p50'], 2)
+        self.assertEqual(summary['max'], 3)
+
+
+class TestMemoryDatabase(unittest.TestCase):
+
+    def test_initFromDatabase(self):
+        database = MemoryDatabase()
+        house = House(database)
+        roomId = house.addRoom("lounge")
+        itemId = house.addItem(roomId, "light", "mock", "light", "10.0.0.1")
+        eventId = house.addEvent("rule", "light", itemId, "item", 1, 1)
+        house.addCondition(itemId, "is", 1, eventId)
+        house.addAction(roomId, "light", "room", "Turn Off", eventId)
+
+        restored = House(database)
+        restored.initFromDatabase()
+        self.assertEqual(restored.rooms[roomId].name, "lounge")
+        self.assertEqual(restored.getItemById(itemId).name, "light")
+        event = restored.events[0]
+        self.assertTrue(event.item is restored.getItemById(itemId))
+        self.assertEqual(event.conditions[0].method, "getState")
+        self.assertEqual(event.actions[0].method, "off")
+        self.assertTrue(event.actions[0].room is restored.rooms[roomId])
+
+    def test_getVersion(self):
+        house = House(MemoryDatabase())
+        self.assertEqual(house.getVersion()['supportedTypes']['light']['methods'], ['Lights on', 'Turn On', 'Turn Off'])
+
+
+class TestRuleEngineBenchmark(unittest.TestCase):
+
+    def test_run(self):
+        results = ruleEngine.run(2, 5, 10, 5)
+        self.assertEqual([r['operation'] for r in results], ['reactToEvent', 'getEventsForTrigger', 'getStructure', 'getRules'])
+        for result in results:
+            self.assertEqual(result['count'], 5)
+            self.assertEqual((result['rooms'], result['items'], result['rules']), (2, 5, 10))
+
+    def test_run_noPollers(self):
+        created = []
+        mockLayer = middleLayers.brands['mock']
+        middleLayers.brands['mock'] = lambda ip, item: created.append(ip) or mockLayer(ip, item)
+        try:
+            ruleEngine.run(2, 5, 10, 5)
+        finally:
+            middleLayers.brands['mock'] = mockLayer
+        self.assertEqual(created, [])
+
+
+class TestRestApiBenchmark(unittest.TestCase):
+
+    def test_parseMix(self):
+        self.assertEqual(restApi.parseMix("state=5,command=1"), {'state': 5, 'command': 1})
+        self.assertRaises(Exception, restApi.parseMix, "unknown=1")
+
+    def test_workload(self):
+        house = ruleEngine.buildHouse(2, 11, 0)
+        workload = restApi.Workload(house, {'command': 1, 'deleteRule': 1})
+        created = 0
+        for i in range(20):
+            name, method, path = workload.next()
+            if name == 'addRule':
+                self.assertEqual(method, 'POST')
+                workload.created(name, {'ruleId': i})
+                created += 1
+            elif name == 'deleteRule':
+                self.assertEqual(method, 'DELETE')
+                created -= 1
+            else:
+                self.assertEqual(name, 'command')
+            self.assertEqual(len(workload.createdRules), created)
+
+    def test_report(self):
+        results = restApi.report({'state': [0.001, 0.002], 'command': [0.003]}, {'command': 1}, 1.0, concurrency=2)
+        self.assertEqual([r['route'] for r in results], ['command', 'state', 'all'])
+        self.assertEqual(results[2]['count'], 3)
+        self.assertEqual(results[2]['errors'], 1)
+        self.assertEqual(results[0]['concurrency'], 2)
+
+
+class TestDeviceFleet(unittest.TestCase):
+
+    def setUp(self):
+        self.fleet = deviceFleet.Fleet(deviceFleet.Faults())
+
+    def test_addresses(self):
+        self.assertEqual(deviceFleet.addresses("127.1.0.254", 3), ["127.1.0.254", "127.1.0.255", "127.1.1.0"])
+
+    def test_faults(self):
+        self.assertEqual(deviceFleet.Faults(loss=1).outcome(), 'lost')
+        self.assertEqual(deviceFleet.Faults(failure=1).outcome(), 'failed')
+        self.assertEqual(deviceFleet.Faults().outcome(), 'ok')
+        delay = deviceFleet.Faults(latency=0.1, jitter=0.05).delay()
+        self.assertTrue(0.1 <= delay <= 0.15)
+
+    def test_arduino(self):
+        server = deviceFleet.serveHTTP(self.fleet, deviceFleet.ArduinoHandler, 0, '127.0.0.1')
+        url = 'http://127.0.0.1:%s' % server.server_port
+        self.assertEqual(json.loads(requests.get(url + '/state').content)['state'], 0)
+        requests.get(url + '/on')
+        self.assertEqual(json.loads(requests.get(url + '/state').content)['state'], 1)
+        self.assertEqual(self.fleet.getStats()['requests']['arduino']['ok'], 3)
+        server.shutdown()
+
+    def test_wemo(self):
+        server = deviceFleet.serveHTTP(self.fleet, deviceFleet.WemoHandler, 0, '127.0.0.1')
+        helper = wemo.WemoHelper('127.0.0.1')
+        name = '127.0.0.1:%s' % server.server_port
+        helper.conn.ENUM_HOSTS[0].update({'name': name, 'xmlFile': 'http://' + name + '/setup.xml'})
+        self.assertEqual(helper.getState(), 0)
+        self.assertTrue(helper.on())
+        self.assertEqual(helper.getState(), 1)
+        self.assertEqual(self.fleet.getState(('wemo', '127.0.0.1')), 1)
+        server.shutdown()
+
+    def test_lightwave(self):
+        emulator = deviceFleet.LightwaveEmulator(self.fleet, ["127.0.0.1"], 0)
+        emulator.start()
+        port = emulator.sockets.values()[0].getsockname()[1]
+        transport = LightwaveTransport(0, 0, 60)
+        transport.start()
+        try:
+            delivery = transport.getLink("127.0.0.1", port).send("!R1D2F1|light|On")
+            self.assertTrue(delivery.wait(2))
+            self.assertEqual(self.fleet.getState(('lightwaveRF', '127.0.0.1 R1D2')), 1)
+
+            received = threading.Event()
+            readings = []
+            def callback(data):
+                if '=' in data:
+                    readings.append(int(data.split("=")[1].split(",")[0]))
+                    received.set()
+            transport.register("127.0.0.1", callback)
+            transport.send("127.0.0.1", ",@?\0", port)
+            self.assertTrue(received.wait(2))
+            self.assertTrue(readings[0] >= 0)
+        finally:
+            transport.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
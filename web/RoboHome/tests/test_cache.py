@@ -0,0 +1,62 @@
+import unittest
+import time
+from robohome.cache import LRUCache
+
+
+class TestLRUCache(unittest.TestCase):
+
+    def test_get(self):
+        cache = LRUCache()
+        cache.put("key", "value")
+        self.assertEqual(cache.get("key"), "value")
+
+    def test_get_missing(self):
+        cache = LRUCache()
+        self.assertEqual(cache.get("key"), None)
+        self.assertEqual(cache.get("key", "default"), "default")
+
+    def test_get_storedNone(self):
+        cache = LRUCache()
+        cache.put("key", None)
+        self.assertTrue("key" in cache)
+        self.assertEqual(cache.get("key", "default"), None)
+
+    def test_put_evictsLeastRecentlyUsed(self):
+        cache = LRUCache(2)
+        cache.put(1, "one")
+        cache.put(2, "two")
+        cache.get(1)
+        cache.put(3, "three")
+        self.assertEqual(cache.get(1), "one")
+        self.assertEqual(cache.get(2), None)
+        self.assertEqual(cache.get(3), "three")
+        self.assertEqual(len(cache), 2)
+
+    def test_get_expired(self):
+        cache = LRUCache(10, 0.01)
+        cache.put("key", "value")
+        time.sleep(0.02)
+        self.assertEqual(cache.get("key"), None)
+
+    def test_setdefault(self):
+        cache = LRUCache()
+        self.assertEqual(cache.setdefault("key", "first"), "first")
+        self.assertEqual(cache.setdefault("key", "second"), "first")
+
+    def test_invalidate(self):
+        cache = LRUCache()
+        cache.put("key", "value")
+        cache.invalidate("key")
+        cache.invalidate("missing")
+        self.assertFalse("key" in cache)
+
+    def test_clear(self):
+        cache = LRUCache()
+        cache.put(1, "one")
+        cache.put(2, "two")
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+import unittest
+import threading
+import robohome.commands as commands
+from robohome.commands import CommandFuture
+
+
+class TestCommandFuture(unittest.TestCase):
+
+    def test_init(self):
+        command = CommandFuture(1, 2, 3, "setBrightness", [50])
+        self.assertEqual(command.status, commands.QUEUED)
+        self.assertFalse(command.isDone())
+
+    def test_setResult(self):
+        command = CommandFuture(1, 2, 3, "getState")
+        command.setRunning()
+        self.assertEqual(command.status, commands.RUNNING)
+        command.setResult(1)
+        self.assertTrue(command.isDone())
+        self.assertEqual(command.toDict()["status"], commands.DONE)
+        self.assertEqual(command.toDict()["result"], 1)
+
+    def test_setError(self):
+        command = CommandFuture(1, 2, 3, "on")
+        command.setError(Exception("device unreachable"))
+        self.assertEqual(command.status, commands.FAILED)
+        self.assertEqual(command.toDict()["error"], "device unreachable")
+
+    def test_wait(self):
+        command = CommandFuture(1, 2, 3, "on")
+        self.assertFalse(command.wait(0.01))
+        threading.Timer(0.01, command.setResult, [None]).start()
+        self.assertTrue(command.wait(2))
+
+    def test_toDict_unserialisableResult(self):
+        command = CommandFuture(1, 2, 3, "getState")
+        command.setResult(object())
+        self.assertTrue(isinstance(command.toDict()["result"], str))
+
+
+if __name__ == '__main__':
+    unittest.main()
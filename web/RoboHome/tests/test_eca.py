@@ -77,10 +77,11 @@ class TestAction(unittest.TestCase):
         mockItem2.mockMethod = MethCallLogger(mockItem2.mockMethod)
 
         action = eca.Action(1, None, None, "mockMethod", "niceMethodName", "mockType")
-        action.doAction([mockItem1, mockItem2])
+        actedOn = action.doAction([mockItem1, mockItem2])
 
         self.assertTrue(mockItem1.mockMethod.was_called)
         self.assertTrue(mockItem1.mockMethod.was_called)
+        self.assertEqual(actedOn, [mockItem1, mockItem2])
 
 
 class MockItem():
@@ -0,0 +1,90 @@
+import unittest
+import threading
+import time
+from robohome.eventBus import EventBus, Subscriber, DROP_OLDEST, DROP_NEWEST
+
+
+class BlockingCallback(object):
+    def __init__(self):
+        self.release = threading.Event()
+        self.calls = []
+
+    def __call__(self, *args):
+        self.release.wait()
+        self.calls.append(args)
+
+
+def waitFor(condition, timeout=2):
+    end = time.time() + timeout
+    while not condition() and time.time() < end:
+        time.sleep(0.01)
+    return condition()
+
+
+class TestEventBus(unittest.TestCase):
+
+    def test_publish_delivered(self):
+        bus = EventBus()
+        calls = []
+        bus.subscribe("test", lambda ip, trigger: calls.append((ip, trigger)))
+        bus.publish("mockIP", "mockTrigger")
+        self.assertTrue(waitFor(lambda: calls == [("mockIP", "mockTrigger")]))
+
+    def test_publish_doesNotWaitForSlowSubscriber(self):
+        bus = EventBus()
+        callback = BlockingCallback()
+        bus.subscribe("slow", callback)
+        start = time.time()
+        bus.publish("mockIP", "mockTrigger")
+        self.assertTrue(time.time() - start < 0.5)
+        callback.release.set()
+        self.assertTrue(waitFor(lambda: len(callback.calls) == 1))
+
+    def test_publish_dropOldest(self):
+        callback = BlockingCallback()
+        subscriber = Subscriber("test", callback, 1, DROP_OLDEST)
+        subscriber.offer(("first",))
+        self.assertTrue(waitFor(lambda: subscriber.queue.empty()))
+        subscriber.offer(("second",))
+        self.assertFalse(subscriber.offer(("third",)))
+        callback.release.set()
+        self.assertTrue(waitFor(lambda: len(callback.calls) == 2))
+        self.assertEqual(callback.calls, [("first",), ("third",)])
+        self.assertEqual(subscriber.getStats()['dropped'], 1)
+
+    def test_publish_dropNewest(self):
+        callback = BlockingCallback()
+        subscriber = Subscriber("test", callback, 1, DROP_NEWEST)
+        subscriber.offer(("first",))
+        self.assertTrue(waitFor(lambda: subscriber.queue.empty()))
+        subscriber.offer(("second",))
+        self.assertFalse(subscriber.offer(("third",)))
+        callback.release.set()
+        self.assertTrue(waitFor(lambda: len(callback.calls) == 2))
+        self.assertEqual(callback.calls, [("first",), ("second",)])
+
+    def test_subscriberErrorsCounted(self):
+        bus = EventBus()
+
+        def fail(ip, trigger):
+            raise Exception("plugin error")
+
+        bus.subscribe("broken", fail)
+        bus.publish("mockIP", "mockTrigger")
+        self.assertTrue(waitFor(lambda: bus.getStats()["broken"]["delivered"] == 1))
+        stats = bus.getStats()["broken"]
+        self.assertEqual(stats["errors"], 1)
+        self.assertEqual(stats["lastError"], "plugin error")
+
+    def test_unsubscribe(self):
+        bus = EventBus()
+        bus.subscribe("test", lambda *args: None)
+        bus.unsubscribe("test")
+        self.assertEqual(bus.getStats(), {})
+
+    def test_invalidPolicy(self):
+        self.assertRaises(Exception, Subscriber, "test", lambda: None, 1, "badPolicy")
+
+
+if __name__ == '__main__':
+    unittest.main()
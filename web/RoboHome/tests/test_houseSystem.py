@@ -1,5 +1,8 @@
 import unittest
+import time
+import threading
 from robohome.houseSystem import Room, House
+import robohome.houseSystem as houseSystem
 
 
 class MethCallLogger(object):
@@ -8,8 +11,9 @@ class MethCallLogger(object):
         self.was_called = False
 
     def __call__(self, code=None):
-        self.meth()
+        result = self.meth()
         self.was_called = True
+        return result
 
 
 class MockItem:
@@ -88,7 +92,8 @@ class MockAction:
     def __init__(self, allItemsInHouse=False, _type="", itemsActedOn=(None, None, "mockType"), isConflict=False, room = MockRoom(1, "room1"), item=MockItem(1, "mockName1", "mockBrand1", "mockType1", "mockIP1")):
         self.allItemsInHouse = allItemsInHouse
         self.itemsForType = []
-        self._type = _type
+        self.type = _type
+        self.method = "mockMethod"
         self.itemsActedOn = itemsActedOn
         self.isConflict = isConflict
         self.room = room 
@@ -99,6 +104,7 @@ class MockAction:
 
     def doAction(self, itemsForType=[]):
         self.itemsForType = itemsForType
+        return [self.item]
 
     def getItemsActedOn(self):
         return self.itemsActedOn
@@ -291,9 +297,22 @@ class TestHouse(unittest.TestCase):
         action.doAction = MethCallLogger(action.doAction)
         h.event1.actions = [action]
 
-        h.reactToEvent("mockIP1", "mockTrigger")
+        performed = h.reactToEvent("mockIP1", "mockTrigger")
 
         self.assertTrue(action.doAction.was_called)
+        self.assertEqual(performed, [("mockIP1", "mockMethod")])
+
+    def test_reactToEvent_metrics(self):
+        h = MockHouse()
+        h.event1.conditions = [MockCondition(True)]
+        h.event1.actions = [MockAction()]
+        evaluations = houseSystem.ruleEvaluationSeconds.getCount()
+        matched = houseSystem.rulesMatched.get()
+
+        h.reactToEvent("mockIP1", "mockTrigger")
+
+        self.assertEqual(houseSystem.ruleEvaluationSeconds.getCount(), evaluations + 1)
+        self.assertTrue(houseSystem.rulesMatched.get() > matched)
 
     def test_reactToEvent_conditionFailed(self):
         h = MockHouse()
@@ -302,9 +321,10 @@ class TestHouse(unittest.TestCase):
         action.doAction = MethCallLogger(action.doAction)
         h.event1.actions = [action]
 
-        h.reactToEvent("mockIP1", "mockTrigger")
+        performed = h.reactToEvent("mockIP1", "mockTrigger")
 
         self.assertFalse(action.doAction.was_called)
+        self.assertEqual(performed, [])
 
     def test_reactToEvent_MultipleEventsConditionFailed(self):
         h = MockHouse()
@@ -389,6 +409,95 @@ class TestHouse(unittest.TestCase):
         h.rooms = {}
         self.assertRaises(KeyError, h.executeMethod, 1, 1, "getState")
 
+    def test_validateCommand(self):
+        h = MockHouse()
+        self.assertEqual(h.validateCommand(1, 1, "getState", []), None)
+        self.assertEqual(h.validateCommand(3, 1, "getState", []), "Invalid roomId")
+        self.assertEqual(h.validateCommand(1, 3, "getState", []), "Invalid itemId")
+        self.assertNotEqual(h.validateCommand(1, 1, "open", []), None)
+        self.assertNotEqual(h.validateCommand(1, 1, "getState", 1), None)
+
+    def test_addCommandsToQueue(self):
+        h = MockHouse()
+        ids = h.addCommandsToQueue([(1, 1, "getState", []), (1, 2, "getState", [])])
+        self.assertEqual(len(ids), 2)
+        self.assertNotEqual(ids[0], ids[1])
+
+    def test_getItemsByType_afterDeleteItem(self):
+        h = MockHouse()
+        self.assertEqual([h.item1, h.item3], h.getItemsByType("mockType1"))
+        h.deleteItem(1, 1)
+        self.assertEqual([h.item3], h.getItemsByType("mockType1"))
+
+    def test_addTypeCommandToQueue_room(self):
+        h = MockHouse()
+        h.item1._type = "light"
+        h.item3._type = "light"
+        queued = h.addTypeCommandToQueue("light", "getState", [], 1)
+        self.assertEqual([(r, i) for r, i, c in queued], [(1, 1)])
+
+    def test_addTypeCommandToQueue_house(self):
+        h = MockHouse()
+        h.item1._type = "light"
+        h.item3._type = "light"
+        queued = h.addTypeCommandToQueue("light", "getState")
+        self.assertEqual([(r, i) for r, i, c in queued], [(1, 1), (2, 3)])
+
+    def test_addTypeCommandToQueue_invalid(self):
+        h = MockHouse()
+        h.item1._type = "light"
+        self.assertRaises(KeyError, h.addTypeCommandToQueue, "badType", "getState")
+        self.assertRaises(KeyError, h.addTypeCommandToQueue, "light", "getState", [], 5)
+        self.assertRaises(Exception, h.addTypeCommandToQueue, "light", "on")
+
+    def test_addToQueue_recordsResult(self):
+        h = MockHouse()
+        commandId = h.addToQueue(1, 1, "getState")
+        command = h.getCommand(commandId)
+        self.assertTrue(command.wait(2))
+        self.assertEqual(command.status, "done")
+        self.assertEqual(command.result, 1)
+
+    def test_addToQueue_recordsError(self):
+        h = MockHouse()
+        commandId = h.addToQueue(1, 1, "on")
+        command = h.getCommand(commandId)
+        self.assertTrue(command.wait(2))
+        self.assertEqual(command.status, "failed")
+
+    def test_queue_sameItemInOrder(self):
+        h = MockHouse()
+        calls = []
+        def switch(state):
+            def method():
+                # Give another worker the chance to overtake if commands for the item were not serialised
+                time.sleep(0.05)
+                calls.append(state)
+            return method
+        h.item1.on = switch("on")
+        h.item1.off = switch("off")
+        commandIds = [h.addToQueue(1, 1, method) for method in ("on", "off", "on")]
+        for commandId in commandIds:
+            self.assertTrue(h.getCommand(commandId).wait(2))
+        self.assertEqual(calls, ["on", "off", "on"])
+
+    def test_queue_slowItemDoesNotBlockOthers(self):
+        h = MockHouse()
+        released = threading.Event()
+        h.item1.on = released.wait
+        roomId, itemId = [(r, i) for r, i in ((1, 2), (2, 3), (2, 4)) if h.queue.getQueueIndex(r, i) != h.queue.getQueueIndex(1, 1)][0]
+        blocked = [h.addToQueue(1, 1, "on") for i in range(houseSystem.METHOD_THREADS)]
+        try:
+            commandId = h.addToQueue(roomId, itemId, "getState")
+            self.assertTrue(h.getCommand(commandId).wait(2))
+            self.assertFalse(h.getCommand(blocked[-1]).wait(0))
+        finally:
+            released.set()
+
+    def test_getCommand_unknown(self):
+        h = MockHouse()
+        self.assertEqual(h.getCommand(12345), None)
+
     def test_updateRoom(self):
         db = MockDatabase()
         h = House(db)
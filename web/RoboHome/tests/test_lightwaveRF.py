@@ -0,0 +1,214 @@
+import unittest
+import time
+import socket
+import threading
+from robohome import lightwaveRF
+from robohome.lightwaveRF import LightwaveTransport, WiFiLink
+
+
+class MockMonitor(object):
+
+    def __init__(self):
+        self.ip = "127.0.0.1"
+        self.polls = 0
+
+    def pollEnergy(self):
+        self.polls += 1
+
+
+class TestLightwaveTransport(unittest.TestCase):
+
+    def setUp(self):
+        self.transport = LightwaveTransport(0, 0.05, 0.01)
+        self.port = self.transport.sock.getsockname()[1]
+        self.device = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.device.bind(("127.0.0.1", 0))
+        self.device.settimeout(1)
+        self.devicePort = self.device.getsockname()[1]
+        self.transport.start()
+
+    def tearDown(self):
+        self.transport.close()
+        self.device.close()
+
+    def test_dispatch(self):
+        received = threading.Event()
+        packets = []
+        def callback(data):
+            packets.append(data)
+            received.set()
+        self.transport.register("127.0.0.1", callback)
+        self.device.sendto("?W=120,0,0;", ("127.0.0.1", self.port))
+        self.assertTrue(received.wait(1))
+        self.assertEqual(packets, ["?W=120,0,0;"])
+
+    def test_dispatch_unrouted(self):
+        self.transport.dispatch("data", ("10.0.0.1", 9760))
+        self.assertEqual(self.transport.unrouted, 1)
+
+    def test_dispatch_multipleAddresses(self):
+        first = []
+        second = []
+        self.transport.register("10.0.0.1", first.append)
+        self.transport.register("10.0.0.2", second.append)
+        self.transport.dispatch("one", ("10.0.0.1", 9760))
+        self.transport.dispatch("two", ("10.0.0.2", 9760))
+        self.assertEqual(first, ["one"])
+        self.assertEqual(second, ["two"])
+
+    def test_unregister(self):
+        packets = []
+        self.transport.register("10.0.0.1", packets.append)
+        self.transport.unregister("10.0.0.1", packets.append)
+        self.transport.dispatch("one", ("10.0.0.1", 9760))
+        self.assertEqual(packets, [])
+        self.assertFalse("10.0.0.1" in self.transport.handlers)
+
+    def test_send_paced(self):
+        self.transport.send("127.0.0.1", "first", self.devicePort)
+        self.transport.send("127.0.0.1", "second", self.devicePort)
+        self.assertEqual(self.device.recvfrom(1024)[0], "first")
+        start = time.time()
+        self.assertEqual(self.device.recvfrom(1024)[0], "second")
+        self.assertTrue(time.time() - start >= 0.04)
+
+    def test_send_pacingDoesNotDelayOtherLinks(self):
+        other = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        other.bind(("127.0.0.2", 0))
+        other.settimeout(1)
+        try:
+            self.transport.interval = 0.5
+            self.transport.send("127.0.0.1", "first", self.devicePort)
+            self.transport.send("127.0.0.1", "second", self.devicePort)
+            self.transport.send("127.0.0.2", "other", other.getsockname()[1])
+            self.assertEqual(self.device.recvfrom(1024)[0], "first")
+            start = time.time()
+            self.assertEqual(other.recvfrom(1024)[0], "other")
+            self.assertTrue(time.time() - start < 0.25)
+            self.assertEqual(self.device.recvfrom(1024)[0], "second")
+        finally:
+            other.close()
+
+    def test_close(self):
+        link = self.transport.getLink("127.0.0.1", self.devicePort)
+        self.transport.close()
+        for t in self.transport.threads + [link.thread]:
+            t.join(1)
+            self.assertFalse(t.is_alive())
+
+    def test_getLink(self):
+        link = self.transport.getLink("127.0.0.1", self.devicePort)
+        self.assertTrue(self.transport.getLink("127.0.0.1") is link)
+        delivery = link.send("!R1D2F1|light|On")
+        data, addr = self.device.recvfrom(1024)
+        self.assertEqual(data, "%03d,!R1D2F1|light|On" % delivery.transaction)
+        self.device.sendto("%03d,OK" % delivery.transaction, ("127.0.0.1", self.port))
+        self.assertTrue(delivery.wait(1))
+        self.assertEqual(self.transport.getStats()['links']['127.0.0.1']['delivered'], 1)
+
+    def test_pollLoop(self):
+        monitor = MockMonitor()
+        self.transport.addMonitor(monitor)
+        time.sleep(0.05)
+        self.transport.removeMonitor(monitor)
+        self.assertTrue(monitor.polls > 0)
+
+
+class MockTransport(object):
+
+    def __init__(self, dropped=0):
+        self.dropped = dropped
+        self.messages = []
+        self.link = None
+
+    def send(self, ip, message, port):
+        self.messages.append(message)
+        if self.dropped > 0:
+            self.dropped -= 1
+        elif self.link is not None:
+            self.link.receive(message.split(",")[0] + ",OK")
+
+
+class TestWiFiLink(unittest.TestCase):
+
+    def test_send_acknowledged(self):
+        transport = MockTransport()
+        link = WiFiLink(transport, "10.0.0.1", timeout=0.05)
+        transport.link = link
+        delivery = link.send("!R1D2F1|light|On")
+        self.assertTrue(delivery.wait(1))
+        self.assertEqual(delivery.attempts, 1)
+        self.assertEqual(transport.messages, ["%03d,!R1D2F1|light|On" % delivery.transaction])
+        self.assertEqual(link.getStats()['delivered'], 1)
+
+    def test_send_retried(self):
+        transport = MockTransport(2)
+        link = WiFiLink(transport, "10.0.0.1", timeout=0.01)
+        transport.link = link
+        delivery = link.send("!R1D2F1|light|On")
+        self.assertTrue(delivery.wait(1))
+        self.assertEqual(delivery.attempts, 3)
+        self.assertEqual(link.getStats()['resent'], 2)
+
+    def test_send_failed(self):
+        transport = MockTransport()
+        link = WiFiLink(transport, "10.0.0.1", timeout=0.01, retries=2)
+        delivery = link.send("!R1D2F1|light|On")
+        self.assertFalse(delivery.wait(1))
+        self.assertEqual(delivery.attempts, 3)
+        self.assertEqual(link.getStats()['failed'], 1)
+
+    def test_send_metrics(self):
+        transport = MockTransport(1)
+        link = WiFiLink(transport, "10.0.0.2", timeout=0.01, retries=1)
+        transport.link = link
+        self.assertTrue(link.send("!R1D2F1|light|On").wait(1))
+        transport.dropped = 2
+        self.assertFalse(link.send("!R1D2F1|light|On").wait(1))
+        self.assertEqual(lightwaveRF.deliverySeconds.getCount(("10.0.0.2",)), 1)
+        self.assertEqual(lightwaveRF.deliveryResends.values[("10.0.0.2",)], 2)
+        self.assertEqual(lightwaveRF.deliveryFailures.values[("10.0.0.2",)], 1)
+
+    def test_send_timeout(self):
+        transport = MockTransport()
+        link = WiFiLink(transport, "10.0.0.1", timeout=0.01, retries=2)
+        self.assertAlmostEqual(link.getMaxDeliverySeconds(), 0.07)
+        first = link.send("!R1D2F1|light|On")
+        self.assertFalse(first.wait(first.timeout))
+        self.assertTrue(first.finished.is_set())
+
+    def test_close_givesUpQueued(self):
+        transport = MockTransport()
+        link = WiFiLink(transport, "10.0.0.1", timeout=0.1, retries=0)
+        first = link.send("!R1D2F1|light|On")
+        second = link.send("!R1D3F1|light|On")
+        self.assertTrue(second.timeout >= 2 * link.getMaxDeliverySeconds())
+        link.close()
+        self.assertFalse(second.wait(1))
+        self.assertTrue(second.finished.is_set())
+        self.assertEqual(second.attempts, 0)
+        self.assertFalse(first.wait(1))
+        self.assertTrue(first.finished.is_set())
+        late = link.send("!R1D4F1|light|On")
+        self.assertTrue(late.finished.is_set())
+        self.assertEqual(link.getStats()['failed'], 3)
+
+    def test_receive_otherTransaction(self):
+        transport = MockTransport()
+        link = WiFiLink(transport, "10.0.0.1", timeout=0.01, retries=0)
+        delivery = link.send("!R1D2F1|light|On")
+        link.receive("%03d,OK" % (delivery.transaction + 1))
+        self.assertFalse(delivery.wait(1))
+
+    def test_send_transactionsIncrease(self):
+        transport = MockTransport()
+        link = WiFiLink(transport, "10.0.0.1")
+        transport.link = link
+        first = link.send("!R1D2F1|light|On")
+        second = link.send("!R1D3F1|light|On")
+        self.assertEqual(second.transaction, first.transaction + 1)
+        self.assertTrue(second.wait(1))
+
+
+if __name__ == '__main__':
+    unittest.main()
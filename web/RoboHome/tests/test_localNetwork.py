@@ -0,0 +1,47 @@
+import unittest
+from robohome.localNetwork import LocalNetwork
+
+
+class TestLocalNetwork(unittest.TestCase):
+
+    def test_isLocal(self):
+        network = LocalNetwork(["192.168.0.0/24", "10.0.0.0/24"])
+        self.assertTrue(network.isLocal("192.168.0.10"))
+        self.assertTrue(network.isLocal("10.0.0.255"))
+        self.assertFalse(network.isLocal("192.168.1.10"))
+        self.assertFalse(network.isLocal("8.8.8.8"))
+
+    def test_isLocal_ipv6(self):
+        network = LocalNetwork(["fd00::/8", "::1/128"])
+        self.assertTrue(network.isLocal("fd12:3456::1"))
+        self.assertTrue(network.isLocal("::1"))
+        self.assertFalse(network.isLocal("2001:db8::1"))
+        self.assertFalse(network.isLocal("0.0.0.1"))
+
+    def test_isLocal_invalidAddress(self):
+        network = LocalNetwork(["192.168.0.0/24"])
+        self.assertFalse(network.isLocal("not an ip"))
+
+    def test_isLocal_cached(self):
+        network = LocalNetwork(["192.168.0.0/24"])
+        network.isLocal("192.168.0.10")
+        self.assertEqual(network.cache.get("192.168.0.10"), True)
+
+    def test_getClientIp_noProxy(self):
+        network = LocalNetwork(["192.168.0.0/24"])
+        self.assertEqual(network.getClientIp("8.8.8.8", ["192.168.0.10"]), "8.8.8.8")
+
+    def test_getClientIp_untrustedProxy(self):
+        network = LocalNetwork(["192.168.0.0/24"], ["127.0.0.1"])
+        self.assertEqual(network.getClientIp("8.8.8.8", ["192.168.0.10"]), "8.8.8.8")
+
+    def test_getClientIp_trustedProxy(self):
+        network = LocalNetwork(["192.168.0.0/24"], ["127.0.0.1", "10.0.0.1"])
+        self.assertEqual(network.getClientIp("127.0.0.1", ["8.8.8.8, 192.168.0.10"]), "192.168.0.10")
+        self.assertEqual(network.getClientIp("127.0.0.1", ["8.8.8.8, 10.0.0.1"]), "8.8.8.8")
+        self.assertEqual(network.getClientIp("127.0.0.1", ["8.8.8.8", "10.0.0.1"]), "8.8.8.8")
+        self.assertEqual(network.getClientIp("127.0.0.1", []), "127.0.0.1")
+
+
+if __name__ == '__main__':
+    unittest.main()
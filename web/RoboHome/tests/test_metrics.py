@@ -0,0 +1,49 @@
+import unittest
+from robohome.metrics import Counter, Gauge, Histogram, Registry, formatLabels
+
+
+class TestMetrics(unittest.TestCase):
+
+    def test_formatLabels(self):
+        self.assertEqual(formatLabels((), ()), '')
+        self.assertEqual(formatLabels(('route', 'method'), ('/a/', 'GET')), '{route="/a/",method="GET"}')
+        self.assertEqual(formatLabels(('name',), ('say "hi"\\\n',)), '{name="say \\"hi\\"\\\\\\n"}')
+        self.assertEqual(formatLabels(('brand',), ('mock',), [('le', '0.5')]), '{brand="mock",le="0.5"}')
+
+    def test_counter(self):
+        c = Counter('errors_total', 'Errors', ['brand'])
+        c.inc(('mock',))
+        c.inc(('mock',), 2)
+        c.inc(('arduino',))
+        self.assertEqual(c.get(('mock',)), 3)
+        self.assertEqual(c.render(), ['# HELP errors_total Errors', '# TYPE errors_total counter',
+                                      'errors_total{brand="arduino"} 1', 'errors_total{brand="mock"} 3'])
+
+    def test_gauge_callback(self):
+        depth = [4]
+        g = Gauge('queue_depth', 'Depth', callback=lambda: depth[0])
+        self.assertEqual(g.samples(), ['queue_depth 4'])
+        depth[0] = 2
+        self.assertEqual(g.samples(), ['queue_depth 2'])
+
+    def test_histogram(self):
+        h = Histogram('latency_seconds', 'Latency', buckets=(0.1, 1))
+        h.observe(0.05)
+        h.observe(0.1)
+        h.observe(0.5)
+        h.observe(3)
+        self.assertEqual(h.getCount(), 4)
+        self.assertEqual(h.samples(), ['latency_seconds_bucket{le="0.1"} 2', 'latency_seconds_bucket{le="1"} 3', 'latency_seconds_bucket{le="+Inf"} 4',
+                                       'latency_seconds_sum 3.65', 'latency_seconds_count 4'])
+
+    def test_registry(self):
+        registry = Registry()
+        c = registry.register(Counter('a_total', 'A'))
+        self.assertTrue(registry.register(Counter('a_total', 'A')) is c)
+        self.assertRaises(Exception, registry.register, Histogram('a_total', 'A'))
+        c.inc()
+        self.assertEqual(registry.render(), '# HELP a_total A\n# TYPE a_total counter\na_total 1\n')
+
+
+if __name__ == '__main__':
+    unittest.main()
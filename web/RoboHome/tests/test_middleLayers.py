@@ -1,7 +1,13 @@
 import unittest
 import time
+import json
+from flask import Flask, request
 from robohome.houseSystem import House
 from robohome.item import Openable
+import robohome.middleLayers as middleLayers
+import robohome.staticData as staticData
+from robohome import lightwaveRF
+from robohome.localNetwork import LocalNetwork
 
 
 class MethCallLogger(object):
@@ -61,6 +67,208 @@ class TestMiddleLayer(unittest.TestCase):
 
         self.assertTrue(house.reactToEvent.was_called)
 
+    def test_send_appliesExpectedStateImmediately(self):
+        db = MockDB()
+        house = House(db)
+        item = Openable(1, "item1", "mock", "door", "192.168.0.102", house.listenerManager)
+        calls = []
+        item.stateChanged = lambda state: calls.append(state)
+
+        item.close()
+        self.assertEqual(item.getState(), 0)
+
+        # Give the confirming poll a chance to run
+        time.sleep(1)
+
+        self.assertEqual(calls, [0])
+
+    def test_send_reconcilesWhenDeviceDisagrees(self):
+        db = MockDB()
+        house = House(db)
+        item = Openable(1, "item1", "mock", "door", "192.168.0.103", house.listenerManager)
+        calls = []
+        item.stateChanged = lambda state: calls.append(state)
+        item.middleLayer.close = lambda: None
+
+        timeout = middleLayers.CONFIRM_TIMEOUT
+        middleLayers.CONFIRM_TIMEOUT = 1
+        try:
+            item.close()
+            self.assertEqual(item.getState(), 0)
+
+            # Wait for the confirmation window to pass so the real state is restored
+            time.sleep(3)
+        finally:
+            middleLayers.CONFIRM_TIMEOUT = timeout
+
+        self.assertEqual(item.getState(), 1)
+        self.assertEqual(calls, [0, 1])
+
+    def test_updatePollInterval(self):
+        db = MockDB()
+        house = House(db)
+        item = Openable(1, "item1", "mock", "curtain", "192.168.0.104", house.listenerManager)
+        layer = item.middleLayer
+        minimum, maximum = staticData.pollIntervals["curtain"]
+
+        self.assertEqual(layer.updatePollInterval(True), minimum)
+        self.assertTrue(layer.updatePollInterval(False) > minimum)
+        for i in range(50):
+            layer.updatePollInterval(False)
+        self.assertEqual(layer.pollInterval, maximum)
+        self.assertEqual(layer.updatePollInterval(True), minimum)
+
+    def test_updatePollInterval_unreachable(self):
+        db = MockDB()
+        house = House(db)
+        item = Openable(1, "item1", "mock", "door", "192.168.0.105", house.listenerManager)
+        layer = item.middleLayer
+
+        # An idle door is still polled often enough for its rules
+        for i in range(50):
+            layer.updatePollInterval(False)
+        self.assertTrue(layer.pollInterval <= 2)
+
+        for i in range(50):
+            layer.updatePollInterval(False, False)
+        self.assertEqual(layer.pollInterval, middleLayers.UNREACHABLE_POLL_INTERVAL)
+        self.assertEqual(layer.updatePollInterval(False), staticData.pollIntervals["door"][1])
+
+    def test_arduinoUnreachable(self):
+        db = MockDB()
+        house = House(db)
+        item = Openable(1, "item1", "arduino", "door", "127.0.0.1:1", house.listenerManager)
+        layer = item.middleLayer
+        try:
+            self.assertRaises(Exception, layer.checkState)
+            deadline = time.time() + 2
+            while layer.poller.consecutiveFailures == 0 and time.time() < deadline:
+                time.sleep(0.01)
+            self.assertTrue(layer.poller.consecutiveFailures > 0)
+            self.assertTrue(middleLayers.pollErrors.values[('arduino',)] > 0)
+        finally:
+            layer.stopPolling()
+
+
+class MockEnergyTable:
+    def __init__(self):
+        self.entries = []
+
+    def addEntry(self, value):
+        self.entries.append(value)
+
+
+class MockEnergyDatabase:
+    def __init__(self):
+        self.energy = MockEnergyTable()
+
+
+class MockEnergyMonitor:
+    brand = "lightwaveRF"
+    _type = "energyMonitor"
+
+
+class TestLightwaveRFLayer(unittest.TestCase):
+
+    def setUp(self):
+        self.transport = lightwaveRF.transport
+        self.database = middleLayers.db.Database
+        lightwaveRF.transport = lightwaveRF.LightwaveTransport(0, 0, 60)
+        middleLayers.db.Database = MockEnergyDatabase
+
+    def tearDown(self):
+        lightwaveRF.transport.close()
+        lightwaveRF.transport = self.transport
+        middleLayers.db.Database = self.database
+
+    def test_stopPolling_detachesEnergyMonitor(self):
+        layer = middleLayers.LightwaveRFLayer("192.168.0.60", MockEnergyMonitor())
+        transport = layer.transport
+        self.assertEqual(transport.monitors, [layer])
+        self.assertEqual(transport.handlers["192.168.0.60"], [layer.receiveEnergy])
+
+        layer.stopPolling()
+        self.assertEqual(transport.monitors, [])
+        self.assertFalse("192.168.0.60" in transport.handlers)
+
+        # Released from quarantine by the watchdog
+        layer.startPolling()
+        layer.startPolling()
+        self.assertEqual(transport.monitors, [layer])
+        self.assertEqual(transport.handlers["192.168.0.60"], [layer.receiveEnergy])
+        layer.stopPolling()
+
+
+class MockItem:
+    def __init__(self):
+        self.states = []
+
+    def stateChanged(self, state):
+        self.states.append(state)
+
+
+class TestGadgeteerBlueprint(unittest.TestCase):
+
+    def setUp(self):
+        app = Flask(__name__)
+        app.register_blueprint(middleLayers.gadgeteerBlueprint)
+        self.client = app.test_client()
+        self.item = MockItem()
+        self.layer = middleLayers.GadgeteerLayer("127.0.0.1", self.item)
+
+    def tearDown(self):
+        del middleLayers.items["127.0.0.1"]
+
+    def put(self, url, ip="127.0.0.1", **kwargs):
+        return self.client.put(url, environ_base={'REMOTE_ADDR': ip}, **kwargs)
+
+    def waitForUpdates(self):
+        while not middleLayers.getGadgeteerUpdates().queue.empty():
+            time.sleep(0.01)
+        time.sleep(0.05)
+
+    def test_statusUpdate(self):
+        response = self.put('/gadgeteer/state/0/')
+        self.assertEqual(response.data, "success")
+        self.waitForUpdates()
+        self.assertEqual(self.item.states, [0])
+        self.assertEqual(self.layer.state, 0)
+
+    def test_statusUpdate_unchanged(self):
+        self.put('/gadgeteer/state/1/')
+        self.waitForUpdates()
+        self.assertEqual(self.item.states, [])
+
+    def test_statusUpdate_unknownDevice(self):
+        response = self.put('/gadgeteer/state/0/', '10.0.0.99')
+        self.assertEqual(response.status_code, 404)
+
+    def test_statusUpdate_forwardedForIgnored(self):
+        response = self.put('/gadgeteer/state/0/', '10.0.0.99', headers={'X-Forwarded-For': '127.0.0.1'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_statusUpdate_trustedProxy(self):
+        network = LocalNetwork(['10.0.0.0/8'], ['10.0.0.1'])
+        getClientIp = middleLayers.getClientIp
+        middleLayers.getClientIp = lambda: network.getClientIp(request.remote_addr, request.headers.getlist("X-Forwarded-For"))
+        try:
+            response = self.put('/gadgeteer/state/0/', '10.0.0.1', headers={'X-Forwarded-For': '127.0.0.1'})
+            self.assertEqual(response.data, "success")
+            response = self.put('/gadgeteer/state/0/', '10.0.0.99', headers={'X-Forwarded-For': '127.0.0.1'})
+            self.assertEqual(response.status_code, 404)
+        finally:
+            middleLayers.getClientIp = getClientIp
+
+    def test_statusBatchUpdate(self):
+        response = self.put('/gadgeteer/state/', data=json.dumps({'states': [0, 0, 1, 1, 0]}))
+        self.assertEqual(response.data, "success")
+        self.waitForUpdates()
+        self.assertEqual(self.item.states, [0, 1, 0])
+
+    def test_statusBatchUpdate_invalid(self):
+        response = self.put('/gadgeteer/state/', data=json.dumps({'state': 0}))
+        self.assertEqual(response.status_code, 400)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,212 @@
+import unittest
+import os
+import sys
+import shutil
+import zipfile
+import tempfile
+
+# The server runs from inside robohome, so shipped plugins import the manager as the top level module pluginManager
+ROBOHOME = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "robohome")
+sys.path.append(ROBOHOME)
+try:
+    import pluginManager
+    from pluginManager import PluginManager
+finally:
+    sys.path.remove(ROBOHOME)
+
+PLUGIN_SOURCE = """import os
+parentdir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.sys.path.insert(0, parentdir)
+from pluginManager import Plugin
+
+
+class %(cls)s(Plugin):
+    def setup(self, rooms, events, queue):
+        pass
+
+    def getName(self):
+        return "%(name)s"
+
+    def getPage(self, path):
+        return "%(page)s"
+
+    def teardown(self):
+        pass
+
+    def notify(self, ip, trigger):
+        pass
+"""
+
+
+class MockUpload(object):
+    def __init__(self, filename, members):
+        self.filename = filename
+        self.members = members
+
+    def save(self, path):
+        with zipfile.ZipFile(path, "w") as zfile:
+            for name, data in self.members:
+                zfile.writestr(name, data)
+
+
+class TestPluginManager(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.dir = tempfile.mkdtemp()
+        os.chdir(self.dir)
+        sys.path.insert(0, self.dir)
+        os.mkdir("plugins")
+        open("plugins/__init__.py", "w").close()
+        self.writePlugin("first", "First", "page one")
+        self.writePlugin("second", "Second", "page two", manifest=False)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        # Each plugin imported adds its parent directory again
+        while self.dir in sys.path:
+            sys.path.remove(self.dir)
+        shutil.rmtree(self.dir)
+        for name in sys.modules.keys():
+            if name == "plugins" or name.startswith("plugins."):
+                del sys.modules[name]
+
+    def writePlugin(self, name, cls, page, manifest=True):
+        path = os.path.join("plugins", name)
+        if not os.path.exists(path):
+            os.mkdir(path)
+        open(os.path.join(path, "__init__.py"), "w").close()
+        with open(os.path.join(path, name + ".py"), "w") as f:
+            f.write(PLUGIN_SOURCE % {"cls": cls, "name": name, "page": page})
+        if manifest:
+            with open(os.path.join(path, "plugin.json"), "w") as f:
+                f.write('{"name": "%s", "module": "%s", "class": "%s"}' % (name, name, cls))
+
+    def test_loadPlugins_discoversWithoutImporting(self):
+        pm = PluginManager({}, [], None)
+        self.assertEqual(sorted(pm.getPlugins()["plugins"]), ["first", "second"])
+        self.assertFalse(pm.plugins["first"].isLoaded())
+        self.assertFalse("plugins.first.first" in sys.modules)
+
+    def test_getPage_importsOnFirstUse(self):
+        pm = PluginManager({}, [], None)
+        self.assertEqual(pm.plugins["first"].getPage(None), "page one")
+        self.assertEqual(pm.plugins["second"].getPage(None), "page two")
+        self.assertTrue(pm.plugins["first"].isLoaded())
+
+    def test_loadPlugin_onlyReloadsChangedPlugin(self):
+        pm = PluginManager({}, [], None)
+        first = pm.plugins["first"]
+        pm.plugins["second"].getPage(None)
+        self.writePlugin("second", "Second", "page three")
+        os.utime(os.path.join("plugins", "second", "plugin.json"), (0, 2000000000))
+        pm.loadPlugins()
+        self.assertTrue(pm.plugins["first"] is first)
+        self.assertEqual(pm.plugins["second"].getPage(None), "page three")
+
+    def test_discoverPlugin_cachedWhenUnchanged(self):
+        pm = PluginManager({}, [], None)
+        self.assertTrue(pm.discoverPlugin("first") is pm.discoverPlugin("first"))
+
+    def test_discoverPlugin_onlyChecksManifestAndDirectory(self):
+        pm = PluginManager({}, [], None)
+        discovered = pm.discoverPlugin("first")
+        os.utime(os.path.join("plugins", "first", "first.py"), (0, 2000000000))
+        self.assertTrue(pm.discoverPlugin("first") is discovered)
+        os.utime(os.path.join("plugins", "first", "plugin.json"), (0, 2000000000))
+        self.assertFalse(pm.discoverPlugin("first") is discovered)
+
+    def test_getPlugins_rediscovers(self):
+        pm = PluginManager({}, [], None)
+        first = pm.plugins["first"]
+        self.writePlugin("third", "Third", "page three")
+        shutil.rmtree(os.path.join("plugins", "second"))
+        self.assertEqual(sorted(pm.getPlugins()["plugins"]), ["first", "third"])
+        self.assertTrue(pm.plugins["first"] is first)
+
+        self.writePlugin("first", "First", "page four")
+        os.utime(os.path.join("plugins", "first", "plugin.json"), (0, 2000000000))
+        pm.getPlugins()
+        self.assertEqual(pm.plugins["first"].getPage(None), "page four")
+
+    def test_load_failureNotRetried(self):
+        with open(os.path.join("plugins", "second", "second.py"), "w") as f:
+            f.write("raise ImportError('broken')\n")
+        pm = PluginManager({}, [], None)
+        imports = []
+        importPlugin = pm.importPlugin
+        def countImports(directory, manifest):
+            imports.append(directory)
+            return importPlugin(directory, manifest)
+        pm.importPlugin = countImports
+        self.assertRaises(Exception, pm.plugins["second"].getPage, None)
+        self.assertRaises(Exception, pm.plugins["second"].notify, "10.0.0.1", "opened")
+        self.assertEqual(imports, ["second"])
+
+        # Fixed on disk, it is imported again once rediscovered
+        self.writePlugin("second", "Second", "page two")
+        pm.getPlugins()
+        self.assertEqual(pm.plugins["second"].getPage(None), "page two")
+
+    def test_deletePlugin(self):
+        pm = PluginManager({}, [], None)
+        pm.deletePlugin("first")
+        self.assertEqual(pm.getPlugins(), {"plugins": ["second"]})
+        self.assertFalse(os.path.exists(os.path.join("plugins", "first")))
+
+    def test_uploadPlugin(self):
+        pm = PluginManager({}, [], None)
+        upload = MockUpload("third.zip", [("__init__.py", ""), ("third.py", PLUGIN_SOURCE % {"cls": "Third", "name": "third", "page": "page three"})])
+        self.assertEqual(pm.uploadPlugin(upload), "Plugin Installed")
+        self.assertEqual(pm.plugins["third"].getPage(None), "page three")
+        self.assertEqual(sorted(os.listdir("plugins")), ["__init__.py", "first", "second", "third"])
+
+    def test_uploadPlugin_pathTraversal(self):
+        pm = PluginManager({}, [], None)
+        upload = MockUpload("third.zip", [("../../evil.py", "")])
+        self.assertNotEqual(pm.uploadPlugin(upload), "Plugin Installed")
+        self.assertFalse(os.path.exists(os.path.join("plugins", "third")))
+        self.assertEqual(sorted(os.listdir("plugins")), ["__init__.py", "first", "second"])
+
+    def test_uploadPlugin_tooLarge(self):
+        pm = PluginManager({}, [], None)
+        limit = pluginManager.MAX_PLUGIN_SIZE
+        pluginManager.MAX_PLUGIN_SIZE = 1024
+        try:
+            upload = MockUpload("third.zip", [("big.bin", "0" * 1025)])
+            self.assertNotEqual(pm.uploadPlugin(upload), "Plugin Installed")
+        finally:
+            pluginManager.MAX_PLUGIN_SIZE = limit
+        self.assertFalse(os.path.exists(os.path.join("plugins", "third")))
+
+    def test_uploadPlugin_restoresPreviousOnFailedSwap(self):
+        pm = PluginManager({}, [], None)
+        rename = os.rename
+        def failingRename(source, destination):
+            if os.path.basename(source).startswith(".staging-"):
+                raise OSError("rename failed")
+            rename(source, destination)
+        os.rename = failingRename
+        try:
+            upload = MockUpload("first.zip", [("__init__.py", ""), ("first.py", PLUGIN_SOURCE % {"cls": "First", "name": "first", "page": "new page"})])
+            self.assertNotEqual(pm.uploadPlugin(upload), "Plugin Installed")
+        finally:
+            os.rename = rename
+        self.assertTrue(os.path.exists(os.path.join("plugins", "first", "plugin.json")))
+        self.assertEqual(sorted(os.listdir("plugins")), ["__init__.py", "first", "second"])
+        self.assertEqual(pm.plugins["first"].getPage(None), "page one")
+
+    def test_uploadPlugin_replacesExisting(self):
+        pm = PluginManager({}, [], None)
+        upload = MockUpload("first.zip", [("__init__.py", ""), ("first.py", PLUGIN_SOURCE % {"cls": "First", "name": "first", "page": "new page"})])
+        self.assertEqual(pm.uploadPlugin(upload), "Plugin Installed")
+        self.assertEqual(pm.plugins["first"].getPage(None), "new page")
+        self.assertFalse(os.path.exists(os.path.join("plugins", "first", "plugin.json")))
+
+    def test_uploadPlugin_notZip(self):
+        pm = PluginManager({}, [], None)
+        self.assertEqual(pm.uploadPlugin(MockUpload("plugin.tar", [])), "File must be a .zip file")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,184 @@
+import unittest
+import time
+import threading
+from robohome.houseSystem import House
+from robohome.item import Openable
+from robohome.pollerWatchdog import PollerRegistry, Watchdog, registry
+from robohome import lightwaveRF
+from benchmarks.memoryDatabase import MemoryDatabase
+
+
+class MockItem:
+    brand = "mock"
+
+
+class MockLayer(object):
+    def __init__(self, ip):
+        self.ip = ip
+        self.item = MockItem()
+        self.started = 0
+        self.stopped = 0
+
+    def startPolling(self):
+        self.started += 1
+
+    def stopPolling(self):
+        self.stopped += 1
+
+
+class MockDB:
+    pass
+
+
+def waitFor(condition, timeout=2):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+class TestWatchdog(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = PollerRegistry()
+        self.layer = MockLayer("10.0.0.1")
+        self.status = self.registry.register(self.layer)
+        self.watchdog = Watchdog(self.registry, stallSeconds=60, maxRestarts=2, quarantineSeconds=300)
+
+    def test_finished(self):
+        self.status.started()
+        self.status.finished(False)
+        self.status.started()
+        self.status.finished(False)
+        self.assertEqual((self.status.polls, self.status.consecutiveFailures), (2, 2))
+        self.status.started()
+        self.status.finished(True)
+        self.assertEqual((self.status.polls, self.status.failures, self.status.consecutiveFailures), (3, 2, 0))
+        self.assertEqual(self.status.pollStarted, None)
+
+    def test_check_healthy(self):
+        self.status.started()
+        self.assertEqual(self.watchdog.check(), [])
+        self.assertEqual(self.layer.started, 0)
+
+    def test_check_restartThenQuarantine(self):
+        now = time.time()
+        self.status.pollStarted = now
+        self.assertEqual(self.watchdog.check(now + 30), [])
+        self.assertEqual(self.watchdog.check(now + 61), [("10.0.0.1", 'restarted')])
+        self.status.pollStarted = now + 100
+        self.assertEqual(self.watchdog.check(now + 161), [("10.0.0.1", 'restarted')])
+        self.status.pollStarted = now + 200
+        self.assertEqual(self.watchdog.check(now + 261), [("10.0.0.1", 'quarantined')])
+        self.assertEqual((self.layer.started, self.layer.stopped), (2, 1))
+        self.assertTrue(self.registry.getStatus()['pollers'][0]['quarantined'])
+
+        self.assertEqual(self.watchdog.check(now + 500), [])
+        self.assertEqual(self.watchdog.check(now + 561), [("10.0.0.1", 'released')])
+        self.assertEqual(self.layer.started, 3)
+        self.assertFalse(self.registry.getStatus()['pollers'][0]['quarantined'])
+
+    def test_check_restartWindow(self):
+        self.status.restarts = [0, 1]
+        self.status.started()
+        self.assertEqual(self.watchdog.check(time.time() + 61), [("10.0.0.1", 'restarted')])
+
+    def test_check_deadThread(self):
+        t = threading.Thread(target=lambda: None)
+        t.start()
+        t.join()
+        self.status.thread = t
+        self.assertEqual(self.watchdog.check(), [("10.0.0.1", 'restarted')])
+
+    def test_register_replaces(self):
+        other = MockLayer("10.0.0.1")
+        self.registry.register(other)
+        self.registry.unregister(self.layer)
+        self.assertEqual([status.layer for status in self.registry.getPollers()], [other])
+        self.registry.unregister(other)
+        self.assertEqual(self.registry.getPollers(), [])
+
+
+class TestMiddleLayerPolling(unittest.TestCase):
+
+    def test_hungPollerRestarted(self):
+        house = House(MockDB())
+        item = Openable(1, "item1", "mock", "door", "192.168.0.120", house.listenerManager)
+        layer = item.middleLayer
+        status = registry.pollers["192.168.0.120"]
+        self.assertTrue(status is layer.poller)
+        self.assertTrue(waitFor(lambda: status.polls > 0))
+
+        # The device stops answering in the middle of a poll
+        hung = threading.Event()
+        released = threading.Event()
+        def hang():
+            if hung.is_set():
+                return layer.mockState
+            hung.set()
+            released.wait()
+            return 0
+        layer.checkState = hang
+        layer.pollRequested.set()
+        self.assertTrue(hung.wait(2))
+        stalled = status.thread
+        polls = status.polls
+
+        watched = PollerRegistry()
+        watched.pollers[layer.ip] = status
+        self.assertEqual(Watchdog(watched, stallSeconds=0).check(time.time() + 1), [("192.168.0.120", 'restarted')])
+        self.assertFalse(status.thread is stalled)
+
+        # Once the device answers the abandoned thread exits without applying the state it read
+        released.set()
+        stalled.join(2)
+        self.assertFalse(stalled.is_alive())
+        self.assertEqual(layer.state, 1)
+        self.assertTrue(waitFor(lambda: status.polls > polls))
+        self.assertTrue(status.thread.is_alive())
+
+        layer.stopPolling()
+        status.thread.join(2)
+        self.assertFalse(status.thread.is_alive())
+
+    def test_deleteItemStopsPoller(self):
+        house = House(MemoryDatabase())
+        roomId = house.addRoom("Hall")
+        itemId = house.addItem(roomId, "Door", "mock", "door", "192.168.0.121")
+        otherId = house.addItem(roomId, "Light", "mock", "light", "192.168.0.122")
+        statuses = [registry.pollers["192.168.0.121"], registry.pollers["192.168.0.122"]]
+        self.assertTrue(waitFor(lambda: all(status.polls > 0 for status in statuses)))
+
+        house.deleteItem(roomId, itemId)
+        self.assertFalse("192.168.0.121" in registry.pollers)
+        statuses[0].thread.join(2)
+        self.assertFalse(statuses[0].thread.is_alive())
+        self.assertTrue(statuses[1].thread.is_alive())
+
+        house.deleteRoom(roomId)
+        self.assertFalse("192.168.0.122" in registry.pollers)
+        statuses[1].thread.join(2)
+        self.assertFalse(statuses[1].thread.is_alive())
+
+    def test_deleteLightwaveRFItem(self):
+        transport = lightwaveRF.transport
+        lightwaveRF.transport = lightwaveRF.LightwaveTransport(0, 0, 60)
+        try:
+            house = House(MemoryDatabase())
+            roomId = house.addRoom("Hall")
+            itemId = house.addItem(roomId, "Light", "lightwaveRF", "light", "192.168.0.50:R1D2")
+            layer = house.getItemById(itemId).middleLayer
+            self.assertEqual(layer.ip, "192.168.0.50")
+            self.assertTrue(registry.pollers["192.168.0.50:R1D2"].layer is layer)
+
+            house.deleteItem(roomId, itemId)
+            self.assertFalse(any(status.layer is layer for status in registry.getPollers()))
+            layer.poller.thread.join(2)
+            self.assertEqual([done for done in Watchdog(registry).check() if done[0] == "192.168.0.50"], [])
+        finally:
+            lightwaveRF.transport.close()
+            lightwaveRF.transport = transport
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,8 @@
 import unittest
-from robohome.priorityQueue import MyPriorityQueue
+from robohome.priorityQueue import MyPriorityQueue, RoutedQueue
 import Queue
+import time
+import threading
 
 class TestMyPriorityQueue(unittest.TestCase):
 
@@ -22,4 +24,79 @@ class TestMyPriorityQueue(unittest.TestCase):
 
     def test_get_emptyQueue(self):
         queue = MyPriorityQueue()
-        self.assertRaises(Queue.Empty, queue.get, False)
\ No newline at end of file
+        self.assertRaises(Queue.Empty, queue.get, False)
+
+    def test_put_returnsCommandIds(self):
+        queue = MyPriorityQueue()
+        self.assertEqual(queue.put(1, 1, "open"), 1)
+        self.assertEqual(queue.put(1, 1, "open"), 2)
+
+    def test_get_samePriorityInOrderAdded(self):
+        queue = MyPriorityQueue()
+        queue.put(2, 1, "on")
+        queue.put(1, 1, "off")
+        self.assertEqual(queue.get(), (2, 1, "on", []))
+        self.assertEqual(queue.get(), (1, 1, "off", []))
+
+    def test_putAll(self):
+        queue = MyPriorityQueue()
+        ids = queue.putAll([(1, 1, "setBrightness", [50]), (1, 2, "close", [])])
+        self.assertEqual(ids, [1, 2])
+        self.assertEqual(queue.get(), (1, 2, "close", []))
+        self.assertEqual(queue.get(), (1, 1, "setBrightness", [50]))
+
+    def test_putAll_invalidMethod(self):
+        queue = MyPriorityQueue()
+        self.assertRaises(KeyError, queue.putAll, [(1, 1, "open", []), (1, 1, "explode", [])])
+        self.assertTrue(queue.empty())
+
+    def test_getWithId(self):
+        queue = MyPriorityQueue()
+        commandId = queue.put(1, 2, "on")
+        self.assertEqual(queue.getWithId(), (commandId, 1, 2, "on", []))
+
+
+class TestRoutedQueue(unittest.TestCase):
+
+    def test_put_sameItemSameQueue(self):
+        queue = RoutedQueue(4)
+        ids = [queue.put(1, 2, method) for method in ("on", "off", "on")]
+        worker = queue.getQueueIndex(1, 2)
+        self.assertEqual([queue.getWithId(worker, False)[0] for i in range(3)], ids)
+        self.assertEqual(queue.qsize(), 0)
+
+    def test_putAll_idsUniqueAndInOrder(self):
+        queue = RoutedQueue(4)
+        commands = [(1, itemId, "on", []) for itemId in range(8)]
+        ids = queue.putAll(commands)
+        self.assertEqual(ids, range(1, 9))
+        self.assertEqual(queue.qsize(), 8)
+        self.assertEqual(queue.put(1, 1, "off"), 9)
+        for roomId, itemId, method, args in commands:
+            commandId, r, i, m, a = queue.getWithId(queue.getQueueIndex(roomId, itemId), False)
+            self.assertEqual((r, i), (roomId, itemId))
+
+    def test_putAll_atomic(self):
+        queue = RoutedQueue(2)
+        first = [itemId for itemId in range(10) if queue.getQueueIndex(1, itemId) == 0][0]
+        second = [itemId for itemId in range(10) if queue.getQueueIndex(1, itemId) == 1][0]
+        taken = []
+        worker = threading.Thread(target=lambda: taken.append(queue.getWithId(0, True, 2)[0]))
+        putEntries = queue.queues[1].putEntries
+        def putEntriesSlowly(entries, lock=True):
+            # The first queue's entry is already in, a worker must still not be able to take it
+            if worker.ident is None:
+                worker.start()
+                time.sleep(0.1)
+                taken.append('second queued')
+            putEntries(entries, lock)
+        queue.queues[1].putEntries = putEntriesSlowly
+
+        ids = queue.putAll([(1, first, "on", []), (1, second, "on", [])])
+        worker.join(2)
+        self.assertEqual(taken, ['second queued', ids[0]])
+
+    def test_putAll_invalidMethod(self):
+        queue = RoutedQueue(2)
+        self.assertRaises(KeyError, queue.putAll, [(1, 1, "open", []), (1, 2, "explode", [])])
+        self.assertEqual(queue.qsize(), 0)
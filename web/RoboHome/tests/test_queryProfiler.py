@@ -0,0 +1,123 @@
+import unittest
+import threading
+from robohome.queryProfiler import QueryProfiler, normalize
+from robohome.databaseHelper import DatabaseHelper
+
+
+class MockCursor(object):
+    lastrowid = 7
+
+    def execute(self, query):
+        pass
+
+    def fetchall(self):
+        return ((1, 'Hall'),)
+
+    def close(self):
+        pass
+
+
+class MockConnection(object):
+
+    def cursor(self):
+        return MockCursor()
+
+    def commit(self):
+        pass
+
+
+class TestQueryProfiler(unittest.TestCase):
+
+    def test_normalize(self):
+        self.assertEqual(normalize("SELECT * FROM items WHERE roomId=12"), "SELECT * FROM items WHERE roomId=?")
+        self.assertEqual(normalize("SELECT id FROM types WHERE name='door';"), "SELECT id FROM types WHERE name=?")
+        self.assertEqual(normalize("INSERT INTO robohome.`items`(name, typeId) VALUES ('It''s', 3)"), "INSERT INTO robohome.`items`(name, typeId) VALUES (?)")
+        self.assertEqual(normalize("SELECT  t1.id\n FROM t1 WHERE x IN (1, 2, 3) AND y=-1.5"), "SELECT t1.id FROM t1 WHERE x IN (?) AND y=?")
+        self.assertEqual(normalize("SELECT * FROM energy WHERE time BETWEEN '2013-01-01 00:00:00' AND '2013-01-02 00:00:00'"), "SELECT * FROM energy WHERE time BETWEEN ? AND ?")
+
+    def test_record_shapes(self):
+        profiler = QueryProfiler()
+        profiler.record("SELECT * FROM items WHERE roomId=1", 0.01)
+        profiler.record("SELECT * FROM items WHERE roomId=2", 0.03)
+        profiler.record("SELECT * FROM rooms", 0.001)
+        stats = profiler.getStats()
+        self.assertEqual(stats['shapes'][0]['shape'], "SELECT * FROM items WHERE roomId=?")
+        self.assertEqual(stats['shapes'][0]['count'], 2)
+        self.assertAlmostEqual(stats['shapes'][0]['max'], 0.03)
+        self.assertEqual(stats['threads'], {threading.current_thread().name: 3})
+
+    def test_record_threadsBounded(self):
+        profiler = QueryProfiler(threadNames=2)
+        for i in range(5):
+            t = threading.Thread(name="Thread " + str(i), target=profiler.record, args=["SELECT * FROM rooms", 0])
+            t.start()
+            t.join()
+        t = threading.Thread(name="Thread 1", target=profiler.record, args=["SELECT * FROM rooms", 0])
+        t.start()
+        t.join()
+        self.assertEqual(profiler.getStats()['threads'], {"Thread 0": 1, "Thread 1": 2, "other": 3})
+
+    def test_record_slow(self):
+        profiler = QueryProfiler(slowSeconds=0.05)
+        profiler.record("SELECT * FROM rooms", 0.01)
+        profiler.record("SELECT * FROM energy", 0.2)
+        slow = profiler.getStats()['slow']
+        self.assertEqual([entry['query'] for entry in slow], ["SELECT * FROM energy"])
+
+    def test_scope_repeated(self):
+        profiler = QueryProfiler(repeatThreshold=3)
+        with profiler.scope('initFromDatabase'):
+            for eventId in range(4):
+                profiler.record("SELECT * FROM conditions WHERE eventId=" + str(eventId), 0.001)
+            profiler.record("SELECT * FROM events", 0.001)
+        repeated = profiler.getStats()['repeated']
+        self.assertEqual(len(repeated), 1)
+        self.assertEqual((repeated[0]['scope'], repeated[0]['shape'], repeated[0]['count']), ('initFromDatabase', "SELECT * FROM conditions WHERE eventId=?", 4))
+
+    def test_scope_nested(self):
+        profiler = QueryProfiler(repeatThreshold=2)
+        outer = profiler.begin('GET /version/')
+        inner = profiler.begin('inner')
+        profiler.record("SELECT 1", 0)
+        self.assertTrue(profiler.end() is inner)
+        profiler.record("SELECT 2", 0)
+        self.assertTrue(profiler.end() is outer)
+        self.assertEqual((outer.queries, inner.queries), (1, 1))
+        self.assertEqual(profiler.end(), None)
+        self.assertEqual(profiler.getStats()['repeated'], [])
+
+    def test_scope_perThread(self):
+        profiler = QueryProfiler()
+        scope = profiler.begin('request')
+        t = threading.Thread(target=profiler.record, args=["SELECT * FROM rooms", 0])
+        t.start()
+        t.join()
+        profiler.end()
+        self.assertEqual(scope.queries, 0)
+
+
+class TestDatabaseHelperProfiling(unittest.TestCase):
+
+    def setUp(self):
+        self.connection = getattr(DatabaseHelper, 'con', None)
+        DatabaseHelper.con = MockConnection()
+        DatabaseHelper.profiler = QueryProfiler()
+
+    def tearDown(self):
+        DatabaseHelper.con = self.connection
+        DatabaseHelper.profiler = None
+
+    def test_recorded(self):
+        helper = DatabaseHelper()
+        self.assertEqual(helper.addEntry("rooms", "name", "'Hall'"), 7)
+        self.assertEqual(helper.retrieveData("SELECT * FROM rooms WHERE id=1"), ((1, 'Hall'),))
+        shapes = [entry['shape'] for entry in DatabaseHelper.profiler.getStats()['shapes']]
+        self.assertEqual(sorted(shapes), ["INSERT INTO robohome.`rooms`(name) VALUES (?)", "SELECT * FROM rooms WHERE id=?"])
+
+    def test_disabled(self):
+        DatabaseHelper.profiler = None
+        self.assertEqual(DatabaseHelper().retrieveData("SELECT * FROM rooms"), ((1, 'Hall'),))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+import unittest
+import sys
+import time
+import threading
+from robohome.samplingProfiler import SamplingProfiler, Profile, collapse
+
+
+def spin(stop):
+    while not stop.is_set():
+        sum(range(100))
+
+
+class TestSamplingProfiler(unittest.TestCase):
+
+    def test_collapse(self):
+        def inner():
+            return sys._getframe()
+        stack = collapse('Poller 10.0.0.1;x', inner())
+        frames = stack.split(';')
+        self.assertEqual(frames[0], 'Poller 10.0.0.1:x')
+        self.assertTrue(frames[-1].startswith('inner (test_samplingProfiler.py:'))
+        self.assertTrue(frames[-2].startswith('test_collapse (test_samplingProfiler.py:'))
+
+    def test_sample_idle(self):
+        stop = threading.Event()
+        waiter = threading.Thread(name="Waiter", target=stop.wait)
+        waiter.start()
+        try:
+            time.sleep(0.05)
+            names = {waiter.ident: waiter.name}
+            busy = Profile(1, 0.01, False)
+            busy.sample(sys._current_frames(), names)
+            idle = Profile(1, 0.01, True)
+            idle.sample(sys._current_frames(), names)
+        finally:
+            stop.set()
+            waiter.join()
+        self.assertFalse("Waiter" in busy.threads)
+        self.assertEqual(idle.threads["Waiter"], 1)
+
+    def test_sample_exclude(self):
+        profile = Profile(1, 0.01, True)
+        profile.sample(sys._current_frames(), {}, [threading.current_thread().ident])
+        self.assertFalse(any("test_sample_exclude" in stack for stack in profile.stacks))
+
+    def test_toDict_copies(self):
+        profile = Profile(1, 0.01, True)
+        profile.sample(sys._current_frames(), {})
+        content = profile.toDict()
+        profile.sample(sys._current_frames(), {})
+        self.assertEqual(content['samples'], 1)
+        self.assertEqual(sum(content['threads'].values()), sum(profile.threads.values()) / 2)
+
+    def test_readWhileSampling(self):
+        profile = Profile(1, 0.01, True)
+        stop = threading.Event()
+        def sample():
+            i = 0
+            while not stop.is_set():
+                profile.sample(sys._current_frames(), {threading.current_thread().ident: "Sampler " + str(i)})
+                i += 1
+        sampler = threading.Thread(target=sample)
+        sampler.start()
+        try:
+            deadline = time.time() + 2
+            while profile.samples < 100 and time.time() < deadline:
+                profile.toDict()
+                profile.collapsed()
+        finally:
+            stop.set()
+            sampler.join()
+        self.assertTrue(profile.samples >= 100)
+
+    def test_run(self):
+        stop = threading.Event()
+        spinner = threading.Thread(name="Spinner", target=spin, args=[stop])
+        spinner.start()
+        profiler = SamplingProfiler()
+        try:
+            self.assertTrue(profiler.start(0.2, 0.01))
+            self.assertFalse(profiler.start(0.2, 0.01))
+            while profiler.running:
+                time.sleep(0.02)
+        finally:
+            stop.set()
+            spinner.join()
+        profile = profiler.getProfile()
+        self.assertTrue(profile.samples > 1)
+        self.assertTrue(profile.threads["Spinner"] > 1)
+        self.assertFalse("Sampling Profiler" in profile.threads)
+        lines = profile.collapsed().splitlines()
+        self.assertTrue(any(line.startswith("Spinner;") and "spin (test_samplingProfiler.py:" in line for line in lines))
+        self.assertEqual(sum(int(line.rsplit(' ', 1)[1]) for line in lines), sum(profile.threads.values()))
+        self.assertTrue(profiler.start(0.01, 0.01))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+import unittest
+import threading
+import robohome.staticData as staticData
+import robohome.middleLayers as middleLayers
+from robohome.simulation import VirtualClock, VirtualLayer, Simulation
+
+
+class MockListener(object):
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.calls = []
+
+    def notify(self, ip, trigger):
+        self.calls.append((self.clock.time(), ip, trigger))
+
+
+class TestVirtualClock(unittest.TestCase):
+
+    def test_run_order(self):
+        clock = VirtualClock(0)
+        calls = []
+        clock.schedule(2, calls.append, 'b')
+        clock.schedule(1, calls.append, 'a')
+        clock.schedule(2, calls.append, 'c')
+        self.assertEqual(clock.run(), 3)
+        self.assertEqual(calls, ['a', 'b', 'c'])
+        self.assertEqual(clock.time(), 2)
+
+    def test_run_until(self):
+        clock = VirtualClock(0)
+        calls = []
+        clock.schedule(5, calls.append, 'late')
+        self.assertEqual(clock.run(3), 0)
+        self.assertEqual(clock.time(), 3)
+        self.assertEqual(clock.pending(), 1)
+        clock.run(5)
+        self.assertEqual(calls, ['late'])
+
+    def test_cancel(self):
+        clock = VirtualClock(0)
+        calls = []
+        clock.schedule(1, calls.append, 'cancelled').cancel()
+        clock.schedule(1, calls.append, 'kept')
+        clock.run()
+        self.assertEqual(calls, ['kept'])
+
+    def test_schedule_from_callback(self):
+        clock = VirtualClock(0)
+        calls = []
+        clock.schedule(1, lambda: clock.schedule(0, calls.append, clock.time()))
+        clock.run()
+        self.assertEqual(calls, [1])
+
+
+class TestSimulation(unittest.TestCase):
+
+    def setUp(self):
+        self.simulation = Simulation(seed=1, clock=VirtualClock(0))
+        self.listener = MockListener(self.simulation.clock)
+        self.simulation.install()
+
+    def tearDown(self):
+        self.simulation.uninstall()
+
+    def createItem(self, _type, ip):
+        return staticData.types[_type](1, _type, 'mock', _type, ip, self.listener)
+
+    def test_install(self):
+        item = self.createItem('light', '10.0.0.1')
+        self.assertTrue(isinstance(item.middleLayer, VirtualLayer))
+        self.simulation.uninstall()
+        self.assertEqual(middleLayers.brands['mock'], middleLayers.MockLayer)
+
+    def test_noThreads(self):
+        before = threading.active_count()
+        for i in range(50):
+            self.createItem('light', '10.0.0.%d' % i)
+        self.assertEqual(threading.active_count(), before)
+
+    def test_command(self):
+        item = self.createItem('light', '10.0.0.1')
+        item.off()
+        self.assertEqual(item.getState(), 0)
+        self.assertEqual(self.listener.calls, [])
+        self.simulation.run(1)
+        self.assertEqual(self.listener.calls, [(0, '10.0.0.1', 'off')])
+
+    def test_script_debounce(self):
+        self.createItem('motionSensor', '10.0.0.2')
+        self.simulation.script('10.0.0.2', [(1, 0), (1.2, 1), (10, 0)])
+        self.simulation.run(20)
+        self.assertEqual(self.listener.calls, [(1.7, '10.0.0.2', 'motion detected'), (10.5, '10.0.0.2', 'no motion')])
+        self.assertEqual(self.simulation.clock.time(), 20)
+
+    def test_stochastic(self):
+        item = self.createItem('plug', '10.0.0.3')
+        self.simulation.stochastic('10.0.0.3', 10)
+        self.simulation.run(1000)
+        changes = item.middleLayer.changes
+        self.assertTrue(50 < changes < 150)
+        self.assertEqual(len(self.listener.calls), changes)
+        for time, ip, trigger in self.listener.calls:
+            self.assertTrue(trigger in ('on', 'off'))
+
+    def test_stochastic_oneState(self):
+        self.createItem('radiator', '10.0.0.4')
+        self.assertRaises(Exception, self.simulation.stochastic, '10.0.0.4', 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+import unittest
+import os
+import json
+import tempfile
+import threading
+from robohome import spans
+from robohome.spans import Tracer
+from robohome.houseSystem import House
+from robohome.simulation import Simulation, VirtualClock
+from benchmarks.memoryDatabase import MemoryDatabase
+
+
+class TestTracer(unittest.TestCase):
+
+    def test_nested(self):
+        tracer = Tracer()
+        with tracer.span('outer', ip='10.0.0.1') as outer:
+            with tracer.span('inner') as inner:
+                self.assertTrue(tracer.current() is inner)
+            self.assertTrue(tracer.current() is outer)
+        self.assertEqual(tracer.current(), None)
+        self.assertEqual(inner.traceId, outer.traceId)
+        self.assertEqual((outer.parentId, inner.parentId), (None, outer.spanId))
+        with tracer.span('other') as other:
+            pass
+        self.assertNotEqual(other.traceId, outer.traceId)
+
+    def test_traced_error(self):
+        tracer = Tracer()
+
+        @tracer.traced('fail', lambda value: {'value': value})
+        def fail(value):
+            raise ValueError("bad " + value)
+
+        self.assertRaises(ValueError, fail, 'input')
+        trace = tracer.getTraces()[0]
+        self.assertEqual(trace['spans'][0]['attributes'], {'value': 'input', 'error': 'bad input'})
+        self.assertEqual(tracer.current(), None)
+
+    def test_wrap_thread(self):
+        tracer = Tracer()
+        seen = []
+        with tracer.span('poll') as poll:
+            t = threading.Thread(target=tracer.wrap(lambda: seen.append(tracer.begin('stateChanged'))))
+        t.start()
+        t.join()
+        self.assertEqual((seen[0].traceId, seen[0].parentId), (poll.traceId, poll.spanId))
+
+    def test_wrap_noSpan(self):
+        tracer = Tracer()
+        function = lambda: None
+        self.assertTrue(tracer.wrap(function) is function)
+
+    def test_ringBuffer(self):
+        tracer = Tracer(3)
+        for i in range(5):
+            with tracer.span('step', i=i):
+                pass
+        traces = tracer.getTraces()
+        self.assertEqual([trace['spans'][0]['attributes']['i'] for trace in traces], [4, 3, 2])
+        self.assertEqual(len(tracer.getTraces(2)), 2)
+        self.assertEqual(tracer.getTrace(traces[1]['traceId'])['spans'][0]['attributes'], {'i': 3})
+        self.assertEqual(tracer.getTrace('missing'), None)
+
+    def test_disabled(self):
+        tracer = Tracer()
+        tracer.enabled = False
+        with tracer.span('step') as span:
+            self.assertEqual(span, None)
+        self.assertEqual(tracer.getTraces(), [])
+
+    def test_export(self):
+        handle, path = tempfile.mkstemp()
+        os.close(handle)
+        try:
+            tracer = Tracer()
+            tracer.export(path)
+            with tracer.span('step', ip='10.0.0.1'):
+                pass
+            tracer.export(None)
+            with tracer.span('notExported'):
+                pass
+            with open(path) as f:
+                lines = [json.loads(line) for line in f]
+        finally:
+            os.remove(path)
+        self.assertEqual([(line['name'], line['attributes']) for line in lines], [('step', {'ip': '10.0.0.1'})])
+
+
+class TestHouseSpans(unittest.TestCase):
+
+    def setUp(self):
+        spans.tracer.clear()
+
+    def tearDown(self):
+        spans.tracer.clear()
+
+    def test_triggerToActuation(self):
+        simulation = Simulation(clock=VirtualClock(0))
+        simulation.install()
+        try:
+            house = House(MemoryDatabase())
+            roomId = house.addRoom("Hall")
+            doorId = house.addItem(roomId, "Door", "mock", "door", "10.0.0.1")
+            lightId = house.addItem(roomId, "Light", "mock", "light", "10.0.0.2")
+            eventId = house.addEvent("Door opened", "door", doorId, "item", 1, 1)
+            house.addAction(lightId, "light", "item", "Turn Off", eventId)
+        finally:
+            simulation.uninstall()
+        simulation.script("10.0.0.1", [(1, 0), (2, 1)])
+        simulation.run(5)
+
+        # The door closing and opening are separate traces, the light turned off belongs to the opening
+        traces = spans.tracer.getTraces()
+        self.assertEqual(len(traces), 2)
+        steps = [(span['name'], span['attributes'].get('ip')) for span in traces[0]['spans']]
+        self.assertEqual(steps, [('stateChanged', '10.0.0.1'), ('reactToEvent', '10.0.0.1'), ('doAction', None),
+                                 ('send', '10.0.0.2'), ('stateChanged', '10.0.0.2'), ('reactToEvent', '10.0.0.2')])
+        byId = dict((span['spanId'], span) for span in traces[0]['spans'])
+        send = [span for span in traces[0]['spans'] if span['name'] == 'send'][0]
+        self.assertEqual(byId[send['parentId']]['name'], 'doAction')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import unittest
+import time
+from robohome.stateFilter import StateFilter
+
+
+class TestStateFilter(unittest.TestCase):
+
+    def setUp(self):
+        self.calls = []
+
+    def test_update_noDelay(self):
+        f = StateFilter(self.calls.append)
+        f.update(1)
+        f.update(1)
+        f.update(0)
+        self.assertEqual(self.calls, [1, 0])
+
+    def test_update_debounce(self):
+        f = StateFilter(self.calls.append, debounce=0.05)
+        f.update(1)
+        self.assertEqual(self.calls, [])
+        time.sleep(0.1)
+        self.assertEqual(self.calls, [1])
+
+    def test_update_debounce_flapping(self):
+        f = StateFilter(self.calls.append, debounce=0.05)
+        f.update(1)
+        time.sleep(0.1)
+        for i in range(5):
+            f.update(0)
+            f.update(1)
+        time.sleep(0.1)
+        self.assertEqual(self.calls, [1])
+        self.assertEqual(f.suppressed, 5)
+
+    def test_update_debounce_repeatedState(self):
+        f = StateFilter(self.calls.append, debounce=0.05)
+        f.update(1)
+        time.sleep(0.03)
+        f.update(1)
+        time.sleep(0.04)
+        self.assertEqual(self.calls, [1])
+
+    def test_update_minDwell(self):
+        f = StateFilter(self.calls.append, minDwell=0.05)
+        f.update(1)
+        f.update(0)
+        self.assertEqual(self.calls, [1])
+        time.sleep(0.1)
+        self.assertEqual(self.calls, [1, 0])
+
+    def test_threshold(self):
+        f = StateFilter(self.calls.append)
+        self.assertEqual(f.threshold(301, 0, 300), 1)
+        self.assertEqual(f.threshold(300, 1, 300), 0)
+
+    def test_threshold_hysteresis(self):
+        f = StateFilter(self.calls.append, hysteresis=(250, 350))
+        self.assertEqual(f.threshold(320, 0, 300), 0)
+        self.assertEqual(f.threshold(360, 0, 300), 1)
+        self.assertEqual(f.threshold(280, 1, 300), 1)
+        self.assertEqual(f.threshold(250, 1, 300), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
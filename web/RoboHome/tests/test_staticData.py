@@ -0,0 +1,28 @@
+import unittest
+import robohome.staticData as staticData
+
+
+class TestStaticData(unittest.TestCase):
+
+    def test_stateNames(self):
+        self.assertEqual(staticData.stateNames['door'], {1: 'opened', 0: 'closed'})
+        self.assertEqual(staticData.stateNames['radiator'], {})
+
+    def test_stateIds(self):
+        self.assertEqual(staticData.stateIds['motionSensor'], {'motion detected': 1, 'no motion': 0})
+
+    def test_methodStates(self):
+        self.assertEqual(staticData.methodStates['light'], {'on': 1, 'off': 0})
+        self.assertEqual(staticData.methodStates['motionSensor'], {})
+
+    def test_typeInfo(self):
+        self.assertEqual(staticData.typeInfo['plug'], {'name': 'Plug', 'isPassive': False, 'supportedBrands': ['mock', 'wemo'], 'states': staticData.states['plug']})
+
+    def test_tablesReadOnly(self):
+        self.assertRaises(TypeError, staticData.stateNames.__setitem__, 'door', {})
+        self.assertRaises(TypeError, staticData.stateNames['door'].update, {2: 'ajar'})
+        self.assertRaises(TypeError, staticData.typeInfo['door'].pop, 'name')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import unittest
+import os
+import tempfile
+from robohome.houseSystem import House
+from robohome.simulation import Simulation, VirtualClock
+from robohome.triggerTrace import TraceRecorder, readTrace, replay, compare
+from benchmarks.memoryDatabase import MemoryDatabase
+
+
+class TestTriggerTrace(unittest.TestCase):
+
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp()
+        os.close(handle)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def buildHouse(self, condition=True):
+        """Builds a hall whose light is turned off when the door opens, if the plug is on"""
+        simulation = Simulation(clock=VirtualClock(0))
+        simulation.install()
+        try:
+            house = House(MemoryDatabase())
+            roomId = house.addRoom("Hall")
+            doorId = house.addItem(roomId, "Door", "mock", "door", "10.0.0.1")
+            lightId = house.addItem(roomId, "Light", "mock", "light", "10.0.0.2")
+            plugId = house.addItem(roomId, "Plug", "mock", "plug", "10.0.0.3")
+            eventId = house.addEvent("Door opened", "door", doorId, "item", 1, 1)
+            if condition:
+                house.addCondition(plugId, "is", 1, eventId)
+            house.addAction(lightId, "light", "item", "Turn Off", eventId)
+        finally:
+            simulation.uninstall()
+        return simulation, house
+
+    def record(self):
+        simulation, house = self.buildHouse()
+        recorder = TraceRecorder(self.path, simulation.clock)
+        recorder.attach(house)
+        simulation.script("10.0.0.1", [(1, 0), (2, 1)])
+        simulation.script("10.0.0.3", [(5, 0)])
+        simulation.script("10.0.0.1", [(6, 0), (7, 1)])
+        simulation.run(10)
+        recorder.close()
+        return recorder
+
+    def test_record(self):
+        recorder = self.record()
+        self.assertEqual(recorder.recorded, 6)
+        records = readTrace(self.path)
+        self.assertEqual([(t, ip, trigger) for t, ip, trigger, actions in records],
+                         [(1, "10.0.0.1", "closed"), (2, "10.0.0.1", "opened"), (2, "10.0.0.2", "off"),
+                          (5, "10.0.0.3", "off"), (6, "10.0.0.1", "closed"), (7, "10.0.0.1", "opened")])
+        self.assertEqual(records[1][3], [("10.0.0.2", "off")])
+        self.assertEqual(records[5][3], [])
+
+    def test_readTrace_partialLine(self):
+        self.record()
+        with open(self.path, 'a') as f:
+            f.write('[8.0,"10.0.0.1","clo')
+        self.assertEqual(len(readTrace(self.path)), 6)
+
+    def test_replay(self):
+        self.record()
+        simulation, house = self.buildHouse()
+        results = replay(house, readTrace(self.path))
+        self.assertEqual(len(results), 6)
+        self.assertEqual(compare(results), [])
+
+    def test_replay_changedRules(self):
+        self.record()
+        simulation, house = self.buildHouse(condition=False)
+        mismatches = compare(replay(house, readTrace(self.path)))
+        self.assertEqual([(t, ip, trigger) for t, ip, trigger, recorded, performed, seconds in mismatches], [(7, "10.0.0.1", "opened")])
+
+    def test_replay_speed(self):
+        self.record()
+        simulation, house = self.buildHouse()
+        waits = []
+        replay(house, readTrace(self.path), 2, waits.append)
+        # The waits do not sleep, so each one is measured from the start of the replay
+        self.assertEqual(len(waits), 5)
+        self.assertTrue(2.9 < waits[-1] <= 3)
+
+    def test_replay_unknownItem(self):
+        simulation, house = self.buildHouse()
+        results = replay(house, [(0, "10.9.9.9", "opened", [])])
+        self.assertEqual(results[0][4], None)
+        self.assertEqual(len(compare(results)), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()